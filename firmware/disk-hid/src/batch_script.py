@@ -0,0 +1,149 @@
+# batch_script.py - I2C batch scripts for code.py (extension command E5).
+# Imported by the FT260 emulator the first time a host sends a script.
+#
+# E5 LL LL [script...] - LL script bytes, continued in the next D0 reports.
+# The ops run back to back on the device and the host gets all read data
+# and every op's result in one reply, read with C2 like any extension reply:
+#
+#   E5, result, op count, result per op..., read data...
+
+import asyncio
+import time
+
+BATCH_OP_WRITE = 0x01       # addr, n, data[n]
+BATCH_OP_READ = 0x02        # addr, n
+BATCH_OP_WRITE_READ = 0x03  # addr, nw, nr, data[nw] - repeated start
+BATCH_OP_POLL = 0x04        # addr, n, index, mask, value, timeout_ms[2] - read until data[index] & mask == value
+BATCH_OP_DELAY = 0x05       # us[2]
+BATCH_MAX_SCRIPT = 1024
+BATCH_MAX_OPS = 255
+BATCH_MAX_READ = 1024       # read data per batch
+BATCH_POLL_INTERVAL = 0.001
+
+class BatchScript:
+    """
+    One script at a time: collected from the D0 reports, then run in its own
+    task. The reply goes to the emulator's ext_response, C2 reads of the
+    FXCore that arrive while the script runs wait for it.
+    """
+    def __init__(self, fw, emulator):
+        self.fw = fw                # code.py names: i2c_passthrough, result codes
+        self.emulator = emulator
+        self.script = None          # script while it streams in
+        self.remaining = 0
+        self.running = False        # executing in its own task
+        self.reads = []             # C2 requests that wait for the reply
+    
+    def start(self, write_data):
+        """E5 LL LL [script...] - start collecting a script, a refused one is answered right away"""
+        fw = self.fw
+        emulator = self.emulator
+        length = write_data[1] | (write_data[2] << 8) if len(write_data) >= 3 else 0
+        if self.running:
+            emulator.ext_response = bytearray([fw.EXT_BATCH, fw.EXT_ERR_BUSY, 0])
+            return
+        if length == 0 or length > BATCH_MAX_SCRIPT:
+            emulator.ext_response = bytearray([fw.EXT_BATCH, fw.EXT_ERR_PARAM, 0])
+            return
+        emulator.expecting_data = None
+        emulator.data_remaining = 0
+        emulator.stream_ns = time.monotonic_ns()
+        self.script = bytearray()
+        self.remaining = length
+        if len(write_data) > 3:
+            self.feed(write_data[3:])
+    
+    def feed(self, data):
+        """Collect script bytes, start the batch once the script is complete"""
+        take = min(len(data), self.remaining)
+        self.script.extend(data[:take])
+        self.remaining -= take
+        if self.remaining == 0:
+            script = self.script
+            self.script = None
+            self.running = True
+            self.emulator.ext_response = None
+            asyncio.create_task(self.run(script))
+    
+    def drop(self):
+        """Forget a script that stopped streaming in, the reply says it failed"""
+        fw = self.fw
+        fw.debug_message(f"FT260: Batch script dropped, {self.remaining} bytes missing")
+        self.script = None
+        self.remaining = 0
+        self.emulator.ext_response = bytearray([fw.EXT_BATCH, fw.EXT_ERR_LENGTH, 0])
+    
+    async def run(self, script):
+        """
+        Run a batch script against the bus. The first failing op ends the
+        batch and its result is the batch result.
+        """
+        fw = self.fw
+        i2c_passthrough = fw.i2c_passthrough
+        results = bytearray()
+        read_data = bytearray()
+        result = fw.EXT_OK
+        i = 0
+        try:
+            while i < len(script) and result == fw.EXT_OK:
+                if len(results) == BATCH_MAX_OPS:
+                    result = fw.EXT_ERR_LENGTH
+                    break
+                op = script[i]
+                left = len(script) - i
+                if op == BATCH_OP_WRITE and left >= 3 and left >= 3 + script[i + 2]:
+                    result, data = i2c_passthrough(script[i + 1], script[i + 3:i + 3 + script[i + 2]], 0)
+                    i += 3 + script[i + 2]
+                elif op == BATCH_OP_READ and left >= 3:
+                    count = script[i + 2]
+                    if count == 0 or len(read_data) + count > BATCH_MAX_READ:
+                        result = fw.EXT_ERR_LENGTH
+                    else:
+                        result, data = i2c_passthrough(script[i + 1], b"", count)
+                        read_data.extend(data)
+                    i += 3
+                elif op == BATCH_OP_WRITE_READ and left >= 4 and left >= 4 + script[i + 2]:
+                    count = script[i + 3]
+                    if count == 0 or len(read_data) + count > BATCH_MAX_READ:
+                        result = fw.EXT_ERR_LENGTH
+                    else:
+                        result, data = i2c_passthrough(script[i + 1], script[i + 4:i + 4 + script[i + 2]], count)
+                        read_data.extend(data)
+                    i += 4 + script[i + 2]
+                elif op == BATCH_OP_POLL and left >= 8:
+                    result = await self.poll(script[i + 1:i + 8])
+                    i += 8
+                elif op == BATCH_OP_DELAY and left >= 3:
+                    await asyncio.sleep((script[i + 1] | (script[i + 2] << 8)) / 1000000)
+                    i += 3
+                else:
+                    result = fw.EXT_ERR_PARAM   # unknown or truncated op
+                results.append(result)
+                await asyncio.sleep(0)          # keep HID and the pipeline going
+        except Exception as e:
+            fw.error_message(f"FT260: Batch failed: {e}")
+            result = fw.EXT_ERR_I2C
+        
+        fw.debug_message(f"FT260: Batch done, {len(results)} ops, result {result}, {len(read_data)} bytes read")
+        self.emulator.ext_response = bytearray([fw.EXT_BATCH, result, len(results)]) + results + read_data
+        self.running = False
+        requests = self.reads
+        self.reads = []
+        for request in requests:
+            self.emulator.handle_output_report_c2(request)
+    
+    async def poll(self, args):
+        """POLL op: addr, n, index, mask, value, timeout_ms[2]"""
+        fw = self.fw
+        address, count, index, mask, value = args[0], args[1], args[2], args[3], args[4]
+        if count == 0 or index >= count:
+            return fw.EXT_ERR_PARAM
+        deadline = time.monotonic_ns() + (args[5] | (args[6] << 8)) * 1000000
+        while True:
+            # A NACK counts as not ready yet (EEPROM write cycles, chips in reset)
+            result, data = fw.i2c_passthrough(address, b"", count)
+            if result == fw.EXT_OK and data[index] & mask == value:
+                return fw.EXT_OK
+            if time.monotonic_ns() >= deadline:
+                return fw.EXT_ERR_TIMEOUT
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
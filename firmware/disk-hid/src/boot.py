@@ -1,8 +1,17 @@
 # boot.py - FT260 USB-I2C Bridge Emulation (Simplified)
 import usb_hid
+import usb_cdc
+import usb_midi
 import supervisor
 import storage
 
+# Binary programming transport on the USB CDC data channel (second serial
+# port next to the REPL console), see readme-rp2040.md
+ENABLE_CDC_DATA = False
+
+# USB MIDI (on by default in CircuitPython) carries the SysEx upload transport
+ENABLE_MIDI = True
+
 # Simplified FT260 HID descriptor with fewer report IDs
 FT260_HID_DESCRIPTOR = bytes([
     0x06, 0x00, 0xFF,        # Usage Page (Vendor Defined 0xFF00)
@@ -25,6 +34,13 @@ FT260_HID_DESCRIPTOR = bytes([
     0x75, 0x08,              # Report Size (8 bits)
     0xB1, 0x02,              # Feature (Data, Variable, Absolute)
     
+    # Feature Report 0x01 (performance counters, not an FT260 report)
+    0x85, 0x01,              # Report ID (0x01)
+    0x09, 0x09,              # Usage (0x09)
+    0x95, 0x3F,              # Report Count (63)
+    0x75, 0x08,              # Report Size (8 bits)
+    0xB1, 0x02,              # Feature (Data, Variable, Absolute)
+    
     # Input Report 0xC2 (I2C Read Data responses)
     0x85, 0xC2,              # Report ID (0xC2)
     0x09, 0x04,              # Usage (0x04)
@@ -39,6 +55,20 @@ FT260_HID_DESCRIPTOR = bytes([
     0x75, 0x08,              # Report Size (8 bits)
     0x91, 0x02,              # Output (Data, Variable, Absolute)
     
+    # Input Report 0xB8 (programming progress events, not an FT260 report)
+    0x85, 0xB8,              # Report ID (0xB8)
+    0x09, 0x08,              # Usage (0x08)
+    0x95, 0x10,              # Report Count (16)
+    0x75, 0x08,              # Report Size (8 bits)
+    0x81, 0x02,              # Input (Data, Variable, Absolute)
+    
+    # Input Report 0xB9 (I2C self-test results, not an FT260 report)
+    0x85, 0xB9,              # Report ID (0xB9)
+    0x09, 0x0A,              # Usage (0x0A)
+    0x95, 0x3F,              # Report Count (63)
+    0x75, 0x08,              # Report Size (8 bits)
+    0x81, 0x02,              # Input (Data, Variable, Absolute)
+    
     # Output Report 0xD0 (I2C Write Commands - consolidated)
     0x85, 0xD0,              # Report ID (0xD0)
     0x09, 0x06,              # Usage (0x06)
@@ -56,7 +86,7 @@ FT260_HID_DESCRIPTOR = bytes([
     0xC0                     # End Collection
 ])
 
-# Create the FT260 HID device with only 6 report IDs
+# Create the FT260 HID device with 8 report IDs
 ft260_hid = usb_hid.Device(
     report_descriptor=FT260_HID_DESCRIPTOR,
     usage_page=0xFF00,
@@ -65,31 +95,43 @@ ft260_hid = usb_hid.Device(
         0xA1,  # Feature: Configuration
         0xC0,  # Feature: I2C Status - must have this or the host program fails
         0xC2,  # Input/Output: I2C Read Data/Request
+        0xB8,  # Input: programming progress events
+        0xB9,  # Input: I2C self-test results
         0xD0,  # Output: I2C Write Commands (all sizes)
         0xDE,  # Output: Alternative I2C Write (for compatibility) not used
-        0x01   # Reserved for future use
+        0x01   # Feature: performance counters
     ),
     in_report_lengths=(
         63,   # 0xA1 Feature (bidirectional)
         63,   # 0xC0 Feature (bidirectional) 
         63,   # 0xC2 Input (device to host)
+        16,   # 0xB8 Input (device to host)
+        63,   # 0xB9 Input (device to host)
         0,    # 0xD0 Output only (host to device)
         0,    # 0xDF Output only (host to device)
-        0     # 0x01 Reserved
+        63    # 0x01 Feature (bidirectional)
     ),
     out_report_lengths=(
         63,   # 0xA1 Feature (bidirectional)
         63,   # 0xC0 Feature (bidirectional)
         63,   # 0xC2 Output (host to device read request)
+        0,    # 0xB8 Input only
+        0,    # 0xB9 Input only
         63,   # 0xD0 Output (host to device write)
         63,   # 0xDF Output (host to device write)
-        0     # 0x01 Reserved
+        63    # 0x01 Feature (bidirectional)
     )
 )
 
 # Enable only our custom FT260 HID device
 usb_hid.enable((ft260_hid,))
 
+if ENABLE_CDC_DATA:
+    usb_cdc.enable(console=True, data=True)
+
+if not ENABLE_MIDI:
+    usb_midi.disable()
+
 storage.remount("/", readonly=False)
 
 m = storage.getmount("/")
@@ -101,9 +143,10 @@ storage.enable_usb_drive()
 
 supervisor.set_usb_identification(manufacturer='Disaster Area Designs', product='SandboxFX', vid=0x1209, pid=0x3911)
 
-print("FT260 HID device enabled with 6 report IDs:")
-print("  Feature Reports: 0xA1 (config), 0xC0 (status)")
-print("  Input Report: 0xC2 (I2C read data)") 
+print("FT260 HID device enabled with 8 report IDs:")
+print("  Feature Reports: 0xA1 (config), 0xC0 (status), 0x01 (performance counters)")
+print("  Input Reports: 0xC2 (I2C read data), 0xB8 (progress events), 0xB9 (self-test results)")
 print("  Output Reports: 0xC2 (I2C read req), 0xD0 (I2C write), 0xDF (alt write)")
-print("  Reserved: 0x01")
 print("  Note: All I2C writes will use report ID 0xD0 regardless of length")
+if ENABLE_CDC_DATA:
+    print("CDC data channel enabled for the binary programming transport")
@@ -0,0 +1,211 @@
+# cdc_transport.py - USB CDC data channel transport for code.py, imported
+# only when boot.py enables the data channel (ENABLE_CDC_DATA).
+#
+# A framed binary protocol for hosts that can open the data serial port.
+# Bulk transfers of a whole image in one frame, so an upload is limited by
+# I2C, not HID polling.
+#
+#   'F' 'X' cmd seq len_lo len_hi payload[len] crc32[4]
+#
+# crc32 is little-endian over cmd..payload. Every frame is answered with
+# cmd | 0x80, the same seq and a payload of [result, data...], result codes
+# as for the extension commands.
+
+import asyncio
+import time
+
+CDC_MAGIC = b"FX"
+CDC_HEADER_SIZE = 6
+CDC_MAX_PAYLOAD = 4736      # a whole image: 66 + 514 + 50 + 4098 section bytes
+CDC_FRAME_TIMEOUT = 0.5     # drop a partial frame after this long without data
+CDC_PROTOCOL_VERSION = 1
+CDC_IDLE_POLL = 0.002       # task sleep when no frame was waiting
+
+CDC_CMD_PING = 0x00         # -> version, max payload (2 bytes)
+CDC_CMD_IMAGE = 0x10        # CREG 66, MREG 514, SFR 50, program - stage an image, -> image CRC
+CDC_CMD_RUN = 0x11          # addr, flags (bit 0 force) - run the staged image from RAM
+CDC_CMD_WRITE_SLOT = 0x12   # addr, location - write the staged image to a flash slot
+CDC_CMD_RUN_PRESET = 0x13   # addr, flags, CRC[4] - run an image from the preset cache
+CDC_CMD_STATUS = 0x20       # addr -> 12-byte FXCore status
+CDC_CMD_I2C_WRITE = 0x30    # addr, data...
+CDC_CMD_I2C_READ = 0x31     # addr, len_lo, len_hi -> data
+CDC_CMD_I2C_WRITE_READ = 0x32   # addr, len_lo, len_hi, data... -> data (repeated start)
+
+CDC_IMAGE_FIXED = 66 + 514 + 50     # CREG, MREG and SFR ahead of the program
+
+class CDCTransport:
+    """Frame parser and command handler for the USB CDC data channel"""
+    def __init__(self, serial, fw):
+        self.serial = serial
+        self.fw = fw                # code.py names: pipeline, preset cache, result codes
+        serial.timeout = 0          # reads return what has arrived, never wait
+        # Preallocated frame buffers, bulk reads go straight into rx
+        frame_size = CDC_HEADER_SIZE + CDC_MAX_PAYLOAD + 4
+        self.rx = bytearray(frame_size)
+        self.rx_view = memoryview(self.rx)
+        self.rx_len = 0
+        self.rx_ns = 0              # when the last bytes arrived
+        self.tx = bytearray(frame_size)
+        self.tx_view = memoryview(self.tx)
+        self.image = None           # staged image from CDC_CMD_IMAGE
+        self.frames = 0
+        self.errors = 0
+    
+    def drop(self, count):
+        """Discard count bytes from the front of the receive buffer"""
+        remaining = self.rx_len - count
+        if remaining > 0:
+            self.rx[0:remaining] = self.rx[count:self.rx_len]
+        self.rx_len = max(remaining, 0)
+    
+    def receive(self):
+        """Read what the host sent, return (cmd, seq, payload length) of a complete frame or None"""
+        fw = self.fw
+        waiting = self.serial.in_waiting
+        now = time.monotonic_ns()
+        if waiting:
+            space = len(self.rx) - self.rx_len
+            received = self.serial.readinto(self.rx_view[self.rx_len:self.rx_len + min(waiting, space)])
+            if received:
+                self.rx_len += received
+                self.rx_ns = now
+        elif self.rx_len and now - self.rx_ns > CDC_FRAME_TIMEOUT * 1000000000:
+            fw.debug_message(f"CDC: Dropped {self.rx_len} bytes of an incomplete frame")
+            self.errors += 1
+            self.rx_len = 0
+        
+        # Hunt for the frame start
+        while self.rx_len >= 2 and self.rx[0:2] != CDC_MAGIC:
+            start = self.rx.find(CDC_MAGIC[0:1], 1, self.rx_len)
+            self.drop(start if start > 0 else self.rx_len)
+        if self.rx_len < CDC_HEADER_SIZE:
+            return None
+        
+        cmd = self.rx[2]
+        seq = self.rx[3]
+        length = self.rx[4] | (self.rx[5] << 8)
+        if length > CDC_MAX_PAYLOAD:
+            self.errors += 1
+            self.reply(cmd, seq, fw.EXT_ERR_LENGTH)
+            self.drop(1)
+            return None
+        frame_size = CDC_HEADER_SIZE + length + 4
+        if self.rx_len < frame_size:
+            return None
+        crc = int.from_bytes(self.rx[frame_size - 4:frame_size], 'little')
+        if fw.crc32(self.rx_view[2:CDC_HEADER_SIZE + length]) & 0xFFFFFFFF != crc:
+            self.errors += 1
+            fw.debug_message(f"CDC: CRC error in frame {seq}")
+            self.reply(cmd, seq, fw.EXT_ERR_CRC)
+            self.drop(1)
+            return None
+        self.frames += 1
+        return cmd, seq, length
+    
+    def reply(self, cmd, seq, result, data=b""):
+        """Send the response frame for cmd"""
+        fw = self.fw
+        length = 1 + len(data)
+        tx = self.tx
+        tx[0:2] = CDC_MAGIC
+        tx[2] = cmd | 0x80
+        tx[3] = seq
+        tx[4] = length & 0xFF
+        tx[5] = length >> 8
+        tx[6] = result
+        end = CDC_HEADER_SIZE + length
+        tx[7:end] = data
+        tx[end:end + 4] = (fw.crc32(self.tx_view[2:end]) & 0xFFFFFFFF).to_bytes(4, 'little')
+        self.serial.write(self.tx_view[0:end + 4])
+    
+    async def task(self):
+        """Main loop task - parse frames and run their commands"""
+        while True:
+            try:
+                frame = self.receive()
+                if frame:
+                    await self.handle(*frame)
+                    await asyncio.sleep(0)
+                else:
+                    await asyncio.sleep(CDC_IDLE_POLL)
+            except Exception as e:
+                self.fw.error_message(f"Unexpected error in CDC task: {e}")
+                await asyncio.sleep(0.1)
+    
+    async def handle(self, cmd, seq, length):
+        """Run one received frame and answer it, then drop it from the buffer"""
+        payload = self.rx_view[CDC_HEADER_SIZE:CDC_HEADER_SIZE + length]
+        try:
+            result, data = await self.execute(cmd, payload)
+        finally:
+            self.drop(CDC_HEADER_SIZE + length + 4)
+        self.reply(cmd, seq, result, data)
+    
+    async def execute(self, cmd, payload):
+        """Command dispatch, returns (result, reply data)"""
+        fw = self.fw
+        if cmd == CDC_CMD_PING:
+            return fw.EXT_OK, bytes([CDC_PROTOCOL_VERSION, CDC_MAX_PAYLOAD & 0xFF, CDC_MAX_PAYLOAD >> 8])
+        if cmd == CDC_CMD_IMAGE:
+            return self.stage_image(payload)
+        if len(payload) < 1 or payload[0] > 0x7F or (cmd < CDC_CMD_I2C_WRITE and not fw.is_fxcore_address(payload[0])):
+            return fw.EXT_ERR_PARAM, b""
+        address = payload[0]
+        
+        if cmd == CDC_CMD_RUN or cmd == CDC_CMD_WRITE_SLOT or cmd == CDC_CMD_RUN_PRESET:
+            if len(payload) < 2:
+                return fw.EXT_ERR_PARAM, b""
+            if cmd == CDC_CMD_RUN_PRESET:
+                if len(payload) < 6:
+                    return fw.EXT_ERR_PARAM, b""
+                image = fw.preset_image(int.from_bytes(payload[2:6], 'little'))
+                if image is None:
+                    return fw.EXT_ERR_NOT_CACHED, b""
+            else:
+                image = self.image
+                if image is None:
+                    return fw.EXT_ERR_PARAM, b""
+            if cmd == CDC_CMD_WRITE_SLOT:
+                if payload[1] > 0x0F:
+                    return fw.EXT_ERR_PARAM, b""
+                job = fw.pipeline.submit("flash", image, payload[1], address=address)
+            else:
+                job = fw.pipeline.submit("ram", image, address=address, force=(payload[1] & 0x01) != 0)
+            await job.done.wait()
+            return (fw.EXT_OK if job.result else fw.EXT_ERR_FAILED), b""
+        
+        if cmd == CDC_CMD_STATUS:
+            status = fw.read_fxcore_status(use_cache=True, address=address)
+            if not status:
+                return fw.EXT_ERR_I2C, b""
+            return fw.EXT_OK, bytes(status.buffer)
+        
+        if cmd == CDC_CMD_I2C_WRITE:
+            return fw.i2c_passthrough(address, payload[1:], 0)
+        if cmd == CDC_CMD_I2C_READ or cmd == CDC_CMD_I2C_WRITE_READ:
+            if len(payload) < 3:
+                return fw.EXT_ERR_PARAM, b""
+            read_length = payload[1] | (payload[2] << 8)
+            if read_length == 0 or read_length > CDC_MAX_PAYLOAD - 1:
+                return fw.EXT_ERR_LENGTH, b""
+            return fw.i2c_passthrough(address, payload[3:] if cmd == CDC_CMD_I2C_WRITE_READ else b"", read_length)
+        
+        return fw.EXT_ERR_COMMAND, b""
+    
+    def stage_image(self, payload):
+        """Copy an image out of the frame buffer, it is run or written by later frames"""
+        fw = self.fw
+        program_size = len(payload) - CDC_IMAGE_FIXED
+        if program_size < 0 or (program_size and (program_size < 6 or program_size > 4098 or (program_size - 2) % 4)):
+            return fw.EXT_ERR_LENGTH, b""
+        program_data = bytearray(payload[CDC_IMAGE_FIXED:])
+        self.image = {
+            'cregs': bytearray(payload[0:66]),
+            'mregs': bytearray(payload[66:580]),
+            'sfrs': bytearray(payload[580:CDC_IMAGE_FIXED]),
+            'instructions': fw.program_instructions(program_data),
+            'program_data': program_data
+        }
+        crc = fw.image_crc32(self.image['cregs'], self.image['mregs'], self.image['sfrs'], program_data)
+        fw.debug_message(f"CDC: Staged image 0x{crc:08X} ({len(payload)} bytes)")
+        return fw.EXT_OK, crc.to_bytes(4, 'little')
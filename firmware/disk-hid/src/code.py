@@ -1,23 +1,107 @@
 # FXCore Hex File Uploader with FT260 Emulation
-# Version 4.4
-# Date: 2025-08-20
+# Version 5.0
+# Date: 2026-10-19
+# asyncio cooperative main loop: HID, programming, LED and file tasks
 # unifed buffer and programming functions
 # fixed issue with LED state in HID mode
 
+import time
+CODE_START_NS = time.monotonic_ns()  # first startup profile mark, taken before the imports
+
 import board
 import busio
-import time
-import neopixel
 import os
 import usb_hid
 import digitalio
+import asyncio  # not in src/lib: circup install asyncio adafruit_ticks
+import supervisor
+
+try:
+    import usb_cdc
+except ImportError:
+    usb_cdc = None
+
+try:
+    import usb_midi
+except ImportError:
+    usb_midi = None
 
 # DEBUG FLAG - Set to True to enable detailed debug output
 DEBUG_MODE = True
 
+# FAST BOOT FLAG - defer the banner and the NeoPixel import until the boot
+# program is running, skip the STATE0 reset when the FXCore is already idle
+# and parse output.hex while the chip settles
+FAST_BOOT = True
+
+# Post-upload verification - read the FXCore status after every section and
+# after WRITE_PRG, re-send only what the chip didn't accept
+VERIFY_UPLOADS = False
+VERIFY_RETRIES = 2          # extra attempts per section or flash slot
+
+# Answer a RAM run of the image that is already running with immediate
+# success instead of uploading it again (forced runs always upload)
+SKIP_IDENTICAL_IMAGE = True
+
+# Push a progress input report (ID 0xB8) at every phase of a programming job
+# while a host uses the bridge, so it can react instead of sleeping
+PROGRESS_REPORTS = True
+
+# Preset cache - images that ran from RAM are kept on the device so the host
+# can switch back to them by CRC without sending them over USB again
+PRESET_CACHE_SIZE = 12          # images, 0 turns the cache off
+PRESET_CACHE_BYTES = 48 * 1024  # section data budget, least recently used go first
+
+# Span tracing - wrap the upload steps so each call records begin/end events
+# in a preallocated ring the host reads with extension command E6. When off
+# no wrappers are installed and the upload path is unchanged
+TRACE_SPANS = False
+TRACE_EVENTS = 512              # 8 bytes each
+
+# Traffic capture - record every incoming/outgoing HID report and every I2C
+# transaction in a compact binary ring the host reads with extension command
+# E8 (tools/fxcore_capture.py). The host can also start it at runtime; when
+# off the reports are not touched and the buses run without the proxy
+CAPTURE_TRAFFIC = False
+CAPTURE_BYTES = 16 * 1024       # ring size, allocated when capture starts (E8 offsets are 16 bit)
+
+# Deterministic memory - automatic GC is switched off and gc.collect() only
+# runs at safe points (HID idle, between sections, after a job), so no
+# collection lands in the middle of a transfer. Free memory low-water marks
+# are tracked per phase (performance counters page 2)
+DETERMINISTIC_MEMORY = False
+GC_RESERVE = 24 * 1024      # collect at the next report check below this much free memory
+GC_SAFE_POINT_MIN = 4096    # a safe point collects once this much was allocated since the last one
+GC_CHECK_REPORTS = 16       # reports between free memory checks
+GC_IDLE_TIME = 0.05         # HID idle this long counts as a safe point
+
+# Per-report debug lines build their f-strings even when nothing is printed
+REPORT_DEBUG = DEBUG_MODE and not DETERMINISTIC_MEMORY
+
+# Startup profile - (phase, monotonic_ns) marks, monotonic time counts from power-on
+boot_profile = [("code.py start", CODE_START_NS)]
+boot_profile_done = False
+
+def boot_mark(phase):
+    """Record a startup phase timestamp, no-op once boot has completed"""
+    if not boot_profile_done:
+        boot_profile.append((phase, time.monotonic_ns()))
+
 # are we running from RAM?
 running = False
 
+# asyncio task timing
+HID_IDLE_POLL = 0.001       # HID task sleep when no report was waiting
+LED_TASK_INTERVAL = 0.01    # LED animation tick
+BLINK_INTERVAL = 0.5        # RED heartbeat period while running from RAM
+
+# Hot reload - hex files are watched by file_task instead of relying on
+# CircuitPython autoreload restarting the whole interpreter on every file drop
+HOT_RELOAD = True
+FILE_POLL_MIN = 0.05        # poll interval right after a change
+FILE_POLL_MAX = 0.25        # poll interval after backing off while nothing changes
+FILE_SETTLE_TIME = 0.1      # size/mtime must be stable this long before acting
+
 # unified buffer for both HID and File mode
 class BufferManager:
     def __init__(self):
@@ -33,7 +117,7 @@ class BufferManager:
             # Clear only the portion we'll use
             for i in range(size):
                 self.i2c_buffer[i] = 0
-            return memoryview(self.i2c_buffer[:size])
+            return memoryview(self.i2c_buffer)[:size]
         # Fallback for oversized requests
         return bytearray(size)
     
@@ -44,20 +128,29 @@ class BufferManager:
     def get_temp_buffer(self, size):
         """Get temporary buffer for small operations"""
         if size <= len(self.temp_buffer):
-            return memoryview(self.temp_buffer[:size])
+            return memoryview(self.temp_buffer)[:size]
         return bytearray(size)
+    
+    def reserved(self, size):
+        """Empty bytearray with room for size bytes - clearing it with [:] = b"" keeps the room"""
+        buffer = bytearray(size)
+        buffer[:] = b""
+        return buffer
 
 # Initialize buffer manager
 buffer_mgr = BufferManager()
 
 # FXCore I2C address
 FXCORE_ADDRESS = 0x30
+# Every FXCore on the bus. Boards with several chips list all their addresses
+# here, FXCORE_ADDRESS stays the default target for hex files and FT260 data.
+FXCORE_ADDRESSES = (FXCORE_ADDRESS,)
 LOG_FILE = "results.txt"
 
-# NeoPixel setup
+# NeoPixel setup - created by init_status_led(), deferred when FAST_BOOT is set
 NEOPIXEL_PIN = board.GP16
 NUM_PIXELS = 1
-pixel = neopixel.NeoPixel(NEOPIXEL_PIN, NUM_PIXELS, brightness=0.3, auto_write=True)
+pixel = None
 
 # Colors
 RED = (255, 0, 0)
@@ -68,6 +161,10 @@ PURPLE = (255, 0, 255)
 WHITE = (255, 255, 255)
 OFF = (0, 0, 0)
 
+# LED state owned by led_task - base color plus an optional short flash on top
+led_base_color = OFF
+led_flash_until = 0
+
 def get_timestamp():
     """Get current timestamp for logging"""
     return f"T+{time.monotonic():.2f}s"
@@ -85,17 +182,178 @@ def error_message(message):
     """Error message - always prints to console with ERROR prefix"""
     print(f"ERROR: {message}")
 
+def log_boot_profile():
+    """Print the startup profile and stop recording marks"""
+    global boot_profile_done
+    boot_profile_done = True
+    log_message("Startup profile (ms since power-on, delta from previous phase):")
+    previous = boot_profile[0][1]
+    for phase, timestamp in boot_profile:
+        log_message(f"  {timestamp / 1000000:8.1f}  +{(timestamp - previous) / 1000000:7.1f}  {phase}")
+        previous = timestamp
+
+boot_mark("imports")
+
+# Optional second I2C bus on the RP2040's other I2C block. Set both pins
+# and list the addresses wired to it (FXCores and pass-through devices),
+# every other address stays on GP0/GP1.
+I2C2_SCL_PIN = None      # e.g. board.GP3
+I2C2_SDA_PIN = None      # e.g. board.GP2
+I2C2_ADDRESSES = ()      # e.g. (0x31,)
+
 # Initialize I2C bus on GP0 (SDA) and GP1 (SCL)
 try:
     i2c = busio.I2C(scl=board.GP1, sda=board.GP0)
     log_message("I2C bus initialized on GP0 (SDA) and GP1 (SCL)")
-    log_message("NeoPixel initialized on GP16")
-    pixel[0] = OFF  # Start with LED off
 except Exception as e:
-    error_message(f"Error initializing I2C or NeoPixel: {e}")
+    error_message(f"Error initializing I2C: {e}")
     while True:
         time.sleep(1)
 
+# I2C bus access - every transaction goes through the manager of its bus
+# (bus_for(address), i2c_bus for GP0/GP1) so a stuck lock turns into an error instead of hanging the device. No task holds the lock
+# across an await, so programming and pass-through take turns at every
+# section boundary and the lock is free whenever a task asks for it. What
+# keeps pass-through out of an upload is the reservation: a programming job
+# reserves its target address and pass-through writes to it are refused.
+I2C_LOCK_TIMEOUT = 0.05          # seconds - waiting longer fails the transfer with I2CBusTimeout
+
+class I2CBusTimeout(OSError):
+    """The I2C lock was not acquired before the deadline"""
+    pass
+
+class I2CBusManager:
+    """
+    Context-managed I2C lock with a deadline, address reservations and
+    contention counters:
+        
+        with i2c_bus.transaction() as bus:
+            bus.writeto(address, data)
+    """
+    def __init__(self, bus, name="I2C0", timeout=I2C_LOCK_TIMEOUT):
+        self.bus = bus
+        self.client = bus   # what transactions yield, the capture proxy while capturing
+        self.name = name
+        self.timeout_ns = int(timeout * 1000000000)
+        self.reserved = {}  # address -> reservation count
+        # Counters
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns_total = 0
+        self.wait_ns_max = 0
+        self.timeouts = 0
+        self.refused = 0
+        self.errors = 0     # transfers that raised (NACK, bus error)
+    
+    def transaction(self):
+        """Context manager holding the bus lock, yields the busio.I2C object"""
+        return self
+    
+    def __enter__(self):
+        """Take the bus lock, raises I2CBusTimeout when it isn't free before the deadline"""
+        bus = self.bus
+        self.acquisitions += 1
+        if bus.try_lock():
+            return self.client
+        
+        # Contended (only when something outside the transactions took the
+        # bus) - spin up to the deadline. The lock belongs to whoever holds
+        # it, so a timeout is reported to this caller and never frees it.
+        self.contended += 1
+        start = time.monotonic_ns()
+        deadline = start + self.timeout_ns
+        while not bus.try_lock():
+            if time.monotonic_ns() >= deadline:
+                self.timeouts += 1
+                raise I2CBusTimeout(f"I2C bus lock not acquired within {self.timeout_ns // 1000000} ms")
+        waited = time.monotonic_ns() - start
+        self.wait_ns_total += waited
+        if waited > self.wait_ns_max:
+            self.wait_ns_max = waited
+        return self.client
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.bus.unlock()
+        if exc_type is not None:
+            self.errors += 1
+        return False
+    
+    def reserve(self, address):
+        """Give programming exclusive write access to address until release()"""
+        self.reserved[address] = self.reserved.get(address, 0) + 1
+    
+    def release(self, address):
+        """End a reservation taken with reserve()"""
+        count = self.reserved.get(address, 0) - 1
+        if count > 0:
+            self.reserved[address] = count
+        else:
+            self.reserved.pop(address, None)
+    
+    def write_allowed(self, address):
+        """False when a pass-through write would interleave with a reserved upload"""
+        if address in self.reserved:
+            self.refused += 1
+            return False
+        return True
+    
+    def reset_stats(self):
+        """Clear the contention counters"""
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns_total = 0
+        self.wait_ns_max = 0
+        self.timeouts = 0
+        self.refused = 0
+        self.errors = 0
+    
+    def log_stats(self):
+        """Print the contention counters"""
+        log_message(f"{self.name}: {self.acquisitions} transactions, {self.contended} contended, "
+                    f"wait total {self.wait_ns_total / 1000000:.1f} ms / max {self.wait_ns_max / 1000000:.1f} ms, "
+                    f"{self.timeouts} timeouts, {self.refused} refused writes, {self.errors} errors")
+
+i2c_bus = I2CBusManager(i2c)
+i2c_buses = [i2c_bus]
+i2c_bus_map = {}    # address -> I2CBusManager for addresses not on GP0/GP1
+
+def add_i2c_bus(bus, addresses, name):
+    """Manage another busio.I2C and route addresses to it, returns its manager"""
+    manager = I2CBusManager(bus, name)
+    for address in addresses:
+        i2c_bus_map[address] = manager
+    i2c_buses.append(manager)
+    return manager
+
+def bus_for(address):
+    """Bus manager of the I2C bus address is wired to"""
+    return i2c_bus_map.get(address, i2c_bus)
+
+if I2C2_SCL_PIN is not None and I2C2_SDA_PIN is not None:
+    try:
+        add_i2c_bus(busio.I2C(scl=I2C2_SCL_PIN, sda=I2C2_SDA_PIN), I2C2_ADDRESSES, "I2C1")
+        log_message(f"Second I2C bus initialized for {', '.join(f'0x{a:02X}' for a in I2C2_ADDRESSES)}")
+    except Exception as e:
+        error_message(f"Error initializing second I2C bus: {e}")
+
+boot_mark("I2C init")
+
+def init_status_led():
+    """Create the NeoPixel, showing whatever status was set before it existed"""
+    global pixel
+    if pixel is not None:
+        return
+    try:
+        import neopixel
+        pixel = neopixel.NeoPixel(NEOPIXEL_PIN, NUM_PIXELS, brightness=0.3, auto_write=True)
+        pixel[0] = led_base_color
+        log_message("NeoPixel initialized on GP16")
+    except Exception as e:
+        error_message(f"Error initializing NeoPixel: {e}")
+
+if not FAST_BOOT:
+    init_status_led()
+
 def is_executing_from_ram(status_info):
     """
     Detect if FXCore is executing from RAM based on status patterns.
@@ -105,9 +363,9 @@ def is_executing_from_ram(status_info):
         return False
     
     # Check for common garbage patterns
-    transfer_state = status_info['transfer_state']
-    command_status = status_info['command_status']
-    device_id = status_info['device_id']
+    transfer_state = status_info.transfer_state
+    command_status = status_info.command_status
+    device_id = status_info.device_id
     
     # Pattern 1: All 0xFF (floating high)
     if (transfer_state == 0xFF and command_status == 0xFF and device_id == 0xFFFF):
@@ -129,70 +387,142 @@ def is_executing_from_ram(status_info):
     
     return False
 
-def read_fxcore_status():
-    """Read the 12-byte status from FXCore and return parsed information"""
-    try:
-        while not i2c.try_lock():
-            pass
-        
-        # Use pre-allocated buffer instead of creating new one
-        status_bytes = buffer_mgr.get_status_buffer()
-        i2c.readfrom_into(FXCORE_ADDRESS, status_bytes)
-        i2c.unlock()
-        
-        # Parse according to FXCore documentation:
-        transfer_state = status_bytes[0]
-        command_status = status_bytes[1]
-        last_cmd_h = status_bytes[2]
-        last_cmd_l = status_bytes[3]
-        prog_slot_status = status_bytes[4] | (status_bytes[5] << 8)
-        device_id = status_bytes[6] | (status_bytes[7] << 8)
-        serial_num = (status_bytes[8] | (status_bytes[9] << 8) | 
-                     (status_bytes[10] << 16) | (status_bytes[11] << 24))
-        
-        status_info = {
-            'transfer_state': transfer_state,
-            'command_status': command_status,
-            'last_command': (last_cmd_h << 8) | last_cmd_l,
-            'program_slot_status': prog_slot_status,
-            'device_id': device_id,
-            'serial_number': serial_num,
-            'program_received': bool(transfer_state & 0x10),
-            'registers_received': bool(transfer_state & 0x08),
-            'mregs_received': bool(transfer_state & 0x04),
-            'sfrs_received': bool(transfer_state & 0x02),
-            'cregs_received': bool(transfer_state & 0x01)
-        }
-        
-        # Add RAM execution detection
-        status_info['is_executing_from_ram'] = is_executing_from_ram(status_info)
-        
-        return status_info
-        
-    except Exception as e:
-        error_message(f"Error reading FXCore status: {e}")
+# FXCore status layout - 12 bytes read from the chip:
+#   [0] transfer state, [1] command status, [2:4] last command (big-endian),
+#   [4:6] program slot status, [6:8] device ID, [8:12] serial number (little-endian)
+class FXCoreStatus:
+    """Fixed view over a 12-byte status buffer, fields are decoded on access"""
+    def __init__(self, buffer=None):
+        self.buffer = buffer if buffer is not None else bytearray(12)
+    
+    @property
+    def transfer_state(self):
+        return self.buffer[0]
+    
+    @property
+    def command_status(self):
+        return self.buffer[1]
+    
+    @property
+    def last_command(self):
+        return (self.buffer[2] << 8) | self.buffer[3]
+    
+    @property
+    def program_slot_status(self):
+        return self.buffer[4] | (self.buffer[5] << 8)
+    
+    @property
+    def device_id(self):
+        return self.buffer[6] | (self.buffer[7] << 8)
+    
+    @property
+    def serial_number(self):
+        b = self.buffer
+        return b[8] | (b[9] << 8) | (b[10] << 16) | (b[11] << 24)
+    
+    @property
+    def program_received(self):
+        return bool(self.buffer[0] & 0x10)
+    
+    @property
+    def registers_received(self):
+        return bool(self.buffer[0] & 0x08)
+    
+    @property
+    def mregs_received(self):
+        return bool(self.buffer[0] & 0x04)
+    
+    @property
+    def sfrs_received(self):
+        return bool(self.buffer[0] & 0x02)
+    
+    @property
+    def cregs_received(self):
+        return bool(self.buffer[0] & 0x01)
+    
+    @property
+    def is_executing_from_ram(self):
+        return is_executing_from_ram(self)
+
+# Status cache - host status polls are answered from here while fresh
+STATUS_CACHE_TTL = 0.05             # seconds a status read stays fresh
+STATUS_REFRESH_INTERVAL = 0.04      # background refresh period while the host polls
+STATUS_HOST_ACTIVE_WINDOW = 2.0     # keep refreshing this long after the last host poll
+
+class FXCoreStatusCache:
+    """
+    Last status read from the FXCore, shared by firmware and host reads.
+    Any command sent to the chip invalidates it (see note_fxcore_command).
+    """
+    def __init__(self, address, buffer, ttl=STATUS_CACHE_TTL, state_machine=None):
+        self.address = address
+        self.state_machine = state_machine
+        self.status = FXCoreStatus(buffer)
+        self.ttl_ns = int(ttl * 1000000000)
+        self.valid = False
+        self.read_ns = 0
+        self.last_host_poll_ns = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def invalidate(self):
+        """Drop the cached status, the chip state may have changed"""
+        self.valid = False
+    
+    def fresh(self):
+        """True when the cached status is valid and younger than the TTL"""
+        return self.valid and (time.monotonic_ns() - self.read_ns) < self.ttl_ns
+    
+    def host_active(self):
+        """True while the host has polled the status recently"""
+        return (time.monotonic_ns() - self.last_host_poll_ns) < STATUS_HOST_ACTIVE_WINDOW * 1000000000
+    
+    def refresh(self):
+        """Live I2C read of the status into the cache, returns the status or None"""
         try:
-            i2c.unlock();
-        except:
-            pass
-        return None
+            with bus_for(self.address).transaction() as bus:
+                bus.readfrom_into(self.address, self.status.buffer)
+            self.valid = True
+            self.read_ns = time.monotonic_ns()
+            if self.state_machine is not None:
+                self.state_machine.confirm(self.status)
+            return self.status
+        except Exception as e:
+            self.valid = False
+            error_message(f"Error reading FXCore 0x{self.address:02X} status: {e}")
+            return None
+    
+    def get(self, max_age_ok=True):
+        """Cached status when fresh and allowed, otherwise a live read"""
+        if max_age_ok and self.fresh():
+            self.hits += 1
+            return self.status
+        self.misses += 1
+        return self.refresh()
+
+def read_fxcore_status(use_cache=False, address=FXCORE_ADDRESS):
+    """
+    Read the 12-byte status from FXCore and return it as an FXCoreStatus.
+    The object is the shared cache entry, it is only valid until the next read.
+    """
+    return fxcore_targets[address].status_cache.get(use_cache)
 
 def log_fxcore_status(operation="Status Check"):
     """Read and log FXCore status with improved RAM execution detection"""
     status = read_fxcore_status()
     if status:
         # Check if executing from RAM using the improved detection
-        if status.get('is_executing_from_ram', False):
+        if status.is_executing_from_ram:
             debug_message(f"{operation} - FXCore Status: EXECUTING FROM RAM (status registers contain garbage)")
             return status
-            
+        
         debug_message(f"{operation} - FXCore Status:")
-        debug_message(f"  Transfer State: 0x{status['transfer_state']:02X}")
-        debug_message(f"  Command Status: 0x{status['command_status']:02X}")
-        debug_message(f"  Last Command: 0x{status['last_command']:04X}")
-        debug_message(f"  Program Slots: 0x{status['program_slot_status']:04X}")
-        debug_message(f"  Device ID: 0x{status['device_id']:04X}")
-        debug_message(f"  Serial Number: {status['serial_number']} (0x{status['serial_number']:08X})")
+        debug_message(f"  Transfer State: 0x{status.transfer_state:02X}")
+        debug_message(f"  Command Status: 0x{status.command_status:02X}")
+        debug_message(f"  Last Command: 0x{status.last_command:04X}")
+        debug_message(f"  Program Slots: 0x{status.program_slot_status:04X}")
+        debug_message(f"  Device ID: 0x{status.device_id:04X}")
+        debug_message(f"  Serial Number: {status.serial_number} (0x{status.serial_number:08X})")
     
     return status
 
@@ -209,36 +539,32 @@ def find_valid_hex_files():
         files = os.listdir()
         
         for filename in files:
-            # Check for output.hex
+            # Check for output.hex - size from stat, only the first record is read
             if filename == "output.hex":
-                try:
-                    with open(filename, 'r') as f:
-                        content = f.read().strip()
-                        if len(content) == 0:
-                            log_message("output.hex was found, zero bytes, skipping")
-                        elif not content.startswith(':'):
-                            error_message("Invalid hex file found: output.hex")
-                        else:
-                            output_hex_valid = True
-                except:
+                signature = hex_file_signature(filename)
+                if signature is None:
                     pass
+                elif signature[0] == 0:
+                    log_message("output.hex was found, zero bytes, skipping")
+                elif not hex_file_has_records(filename):
+                    error_message("Invalid hex file found: output.hex")
+                else:
+                    output_hex_valid = True
             
             # Check for location files (0.hex through F.hex)
             elif filename.upper() in [name.upper() for name in valid_names]:
                 location = filename.upper().split('.')[0]
                 try:
                     location_num = int(location, 16)
-                    try:
-                        with open(filename, 'r') as f:
-                            content = f.read().strip()
-                            if len(content) == 0:
-                                log_message(f"{filename} was found, zero bytes, skipping")
-                            elif not content.startswith(':'):
-                                error_message(f"Invalid hex file found: {filename}")
-                            else:
-                                location_files[location_num] = filename
-                    except:
+                    signature = hex_file_signature(filename)
+                    if signature is None:
                         pass
+                    elif signature[0] == 0:
+                        log_message(f"{filename} was found, zero bytes, skipping")
+                    elif not hex_file_has_records(filename):
+                        error_message(f"Invalid hex file found: {filename}")
+                    else:
+                        location_files[location_num] = filename
                 except ValueError:
                     pass
     except:
@@ -247,69 +573,297 @@ def find_valid_hex_files():
     return output_hex_valid, location_files
 
 
+def is_location_hex_name(filename):
+    """True for 0.hex through F.hex (any case)"""
+    name = filename.upper()
+    return len(name) == 5 and name.endswith(".HEX") and name[0] in "0123456789ABCDEF"
+
+def hex_file_signature(filename):
+    """Cheap change signature (size, mtime) from os.stat, None if the file is missing"""
+    try:
+        st = os.stat(filename)
+        return (st[6], st[8])
+    except OSError:
+        return None
+
+def hex_file_has_records(filename):
+    """Check the first non-blank character is ':' without reading the whole file"""
+    try:
+        with open(filename, 'r') as f:
+            return f.read(64).strip().startswith(':')
+    except OSError:
+        return False
+
+class HexFileWatcher:
+    """
+    Polls output.hex, 0.hex-F.hex and the self-test trigger for size/mtime changes.
+    Polling backs off while nothing changes, and a change is only reported once
+    the signature has been stable for FILE_SETTLE_TIME so half-written files
+    from the host are never programmed. FAT mtime has 2 s resolution, a
+    same-size save within that window is not detected.
+    """
+    def __init__(self):
+        self.known = {}     # filename -> signature last acted on
+        self.pending = {}   # filename -> (signature, time first seen)
+        self.interval = FILE_POLL_MIN
+    
+    def snapshot(self):
+        """Current signatures of all watched files"""
+        signatures = {}
+        try:
+            for filename in os.listdir():
+                if filename in ("output.hex", SELFTEST_TRIGGER_FILE) or is_location_hex_name(filename):
+                    signatures[filename] = hex_file_signature(filename)
+        except OSError:
+            pass
+        return signatures
+    
+    def prime(self):
+        """Record the current files as already handled"""
+        self.known = self.snapshot()
+        self.pending = {}
+    
+    def poll(self):
+        """Return a list of (filename, signature) whose change has settled, signature None = deleted"""
+        now = time.monotonic()
+        current = self.snapshot()
+        settled = []
+        changed = False
+        
+        for filename in list(current) + [f for f in self.known if f not in current]:
+            signature = current.get(filename)
+            if signature == self.known.get(filename):
+                # Unchanged, or changed back before it settled
+                self.pending.pop(filename, None)
+                continue
+            
+            changed = True
+            pending = self.pending.get(filename)
+            if pending is None or pending[0] != signature:
+                # Still being written - restart the settle timer
+                self.pending[filename] = (signature, now)
+            elif now - pending[1] >= FILE_SETTLE_TIME:
+                del self.pending[filename]
+                if signature is None:
+                    self.known.pop(filename, None)
+                else:
+                    self.known[filename] = signature
+                settled.append((filename, signature))
+        
+        # Poll fast while files are moving, back off when idle
+        if changed:
+            self.interval = FILE_POLL_MIN
+        else:
+            self.interval = min(self.interval * 2, FILE_POLL_MAX)
+        
+        return settled
+
+def disable_autoreload():
+    """Stop CircuitPython restarting code.py when the host writes to the drive"""
+    try:
+        supervisor.runtime.autoreload = False
+    except AttributeError:
+        supervisor.disable_autoreload()  # CircuitPython 7.x
+    debug_message("Autoreload disabled - hex files are hot-reloaded by file_task")
+
 def set_status_led(color):
     """Set the status LED color"""
+    global led_base_color
+    led_base_color = color
+    if pixel is not None:
+        pixel[0] = color
+
+def flash_status_led(color, duration=0.01):
+    """Show color briefly without blocking, led_task restores the base color"""
+    global led_flash_until
+    if pixel is None:
+        return
     pixel[0] = color
+    led_flash_until = time.monotonic() + duration
 
-def blink_status_led(color, count=3, duration=0.01):
-    """Blink the status LED"""
+async def blink_status_led(color, count=3, duration=0.01):
+    """Blink the status LED, skipped (no delay) while the NeoPixel is not set up yet"""
+    if pixel is None:
+        return
     for _ in range(count):
         pixel[0] = color
-        time.sleep(duration)
+        await asyncio.sleep(duration)
         pixel[0] = OFF
-        time.sleep(duration)
+        await asyncio.sleep(duration)
+
+try:
+    from binascii import crc32
+except ImportError:
+    # Table-driven CRC-32 (IEEE) for builds without binascii.crc32
+    _CRC32_TABLE = []
+    for _n in range(256):
+        _c = _n
+        for _ in range(8):
+            _c = (_c >> 1) ^ 0xEDB88320 if _c & 1 else _c >> 1
+        _CRC32_TABLE.append(_c)
+    
+    def crc32(data, crc=0):
+        crc ^= 0xFFFFFFFF
+        for byte_val in data:
+            crc = _CRC32_TABLE[(crc ^ byte_val) & 0xFF] ^ (crc >> 8)
+        return crc ^ 0xFFFFFFFF
 
 def calculate_checksum(data):
     """Calculate simple sum checksum of all bytes"""
     return sum(data) & 0xFFFF
 
-def enter_prog_mode():
+# Settle time - the FXCore gets FXCORE_SETTLE_TIME of quiet after a command
+# before a new programming sequence starts. Only the part not already spent
+# (in command sleeps or parsing a hex file) is waited for.
+FXCORE_SETTLE_TIME = 0.1
+
+def note_fxcore_command(address=FXCORE_ADDRESS):
+    """Remember when the last command was written to the FXCore, its status is now stale"""
+    target = fxcore_targets[address]
+    target.last_command_ns = time.monotonic_ns()
+    target.status_cache.invalidate()
+
+async def settle_fxcore(address=FXCORE_ADDRESS):
+    """Wait out whatever remains of the settle time since the last command"""
+    remaining = FXCORE_SETTLE_TIME - (time.monotonic_ns() - fxcore_targets[address].last_command_ns) / 1000000000
+    if remaining > 0:
+        debug_message(f"Waiting {remaining * 1000:.0f} ms for FXCore to settle...")
+        await asyncio.sleep(remaining)
+
+# FXCore state model - which mode the chip is in, as far as the firmware knows
+FXCORE_STATE_UNKNOWN = 0    # not known yet, or a command failed
+FXCORE_STATE_RUN_FLASH = 1  # RUN mode, executing the program selected from flash
+FXCORE_STATE_PROG = 2       # PROG mode STATE0, accepts transfers and WRITE_PRG
+FXCORE_STATE_RUN_RAM = 3    # executing the program uploaded to RAM
+FXCORE_STATE_NAMES = ("UNKNOWN", "RUN_FLASH", "PROG", "RUN_RAM")
+
+def state_from_status(status):
+    """Derive the chip state from a status read"""
+    if status.is_executing_from_ram:
+        return FXCORE_STATE_RUN_RAM
+    last_command = status.last_command
+    if last_command == 0x0000 or last_command == 0x5AA5:
+        # Nothing since power-on, or EXIT_PRG
+        return FXCORE_STATE_RUN_FLASH
+    if last_command == 0x0D00:
+        return FXCORE_STATE_RUN_RAM
+    return FXCORE_STATE_PROG
+
+class FXCoreStateMachine:
+    """
+    Authoritative FXCore state, updated by every command the firmware or the
+    emulator sends and checked against status reads. Lets no-op transitions
+    (ENTER_PRG while in PROG, RETURN_0 outside RAM execution, EXIT_PRG while
+    running from flash) be skipped together with their sleeps.
+    """
+    def __init__(self):
+        self.state = FXCORE_STATE_UNKNOWN
+        self.image_crc = None   # CRC of the image running from RAM, set by the upload
+        self.skipped = 0
+    
+    def transition(self, state, reason):
+        """Record the state a successful command moved the chip to"""
+        if state != self.state:
+            debug_message(f"FXCore state: {FXCORE_STATE_NAMES[self.state]} -> {FXCORE_STATE_NAMES[state]} ({reason})")
+        if state != FXCORE_STATE_RUN_RAM:
+            self.image_crc = None
+        self.state = state
+    
+    def lost(self, reason):
+        """A command failed, the chip could be in any state"""
+        self.transition(FXCORE_STATE_UNKNOWN, reason)
+    
+    def confirm(self, status):
+        """Adopt the state a status read shows when it disagrees with the model"""
+        observed = state_from_status(status)
+        if observed != self.state:
+            self.transition(observed, "status read")
+    
+    def skip(self, command):
+        """Count and log a transition that would not change anything"""
+        self.skipped += 1
+        debug_message(f"Skipping {command}, FXCore already in {FXCORE_STATE_NAMES[self.state]}")
+
+class FXCoreTarget:
+    """Per-chip state: status cache, state machine and last command time"""
+    def __init__(self, address, status_buffer=None):
+        self.address = address
+        self.sm = FXCoreStateMachine()
+        if status_buffer is None:
+            status_buffer = bytearray(12)
+        self.status_cache = FXCoreStatusCache(address, status_buffer, state_machine=self.sm)
+        self.last_command_ns = 0
+        self.upload_reset = False   # the chip went back to STATE0 during the upload, its sections are gone
+
+fxcore_targets = {}
+
+def add_fxcore_target(address):
+    """Register an FXCore chip, returns its target (existing one if already known)"""
+    target = fxcore_targets.get(address)
+    if target is None:
+        # The default chip reuses the preallocated status buffer
+        target = FXCoreTarget(address, buffer_mgr.get_status_buffer() if address == FXCORE_ADDRESS else None)
+        fxcore_targets[address] = target
+    return target
+
+add_fxcore_target(FXCORE_ADDRESS)
+for _address in FXCORE_ADDRESSES:
+    add_fxcore_target(_address)
+
+# Default target shortcuts
+status_cache = fxcore_targets[FXCORE_ADDRESS].status_cache
+fxcore_sm = fxcore_targets[FXCORE_ADDRESS].sm
+
+def is_fxcore_address(address):
+    """True when address belongs to one of the configured FXCore chips"""
+    return address in fxcore_targets
+
+def ram_program_running():
+    """True while any FXCore is known to execute a program from RAM"""
+    for target in fxcore_targets.values():
+        if target.sm.state == FXCORE_STATE_RUN_RAM:
+            return True
+    return False
+
+async def enter_prog_mode(address=FXCORE_ADDRESS):
     """Enter programming mode on the FXCore"""
     try:
-        while not i2c.try_lock():
-            pass
-        
-        command = bytes([0xA5, 0x5A, FXCORE_ADDRESS])
-        i2c.writeto(FXCORE_ADDRESS, command)
+        command = bytes([0xA5, 0x5A, address])
+        with bus_for(address).transaction() as bus:
+            bus.writeto(address, command)
+        note_fxcore_command(address)
+        fxcore_targets[address].sm.transition(FXCORE_STATE_PROG, "ENTER_PRG")
         debug_message("Entered programming mode")
         
-        i2c.unlock()
-        time.sleep(0.1)
+        await asyncio.sleep(0.1)
         # log_fxcore_status("After ENTER_PRG")
         return True
-        
+    
     except OSError as e:
         error_message(f"Error entering PROG mode: {e}")
-        try:
-            i2c.unlock();
-        except:
-            pass
+        fxcore_targets[address].sm.lost("ENTER_PRG failed")
         return False
 
-def exit_prog_mode():
+async def exit_prog_mode(address=FXCORE_ADDRESS):
     global running
     """Exit programming mode and return to RUN mode"""
     try:
-        while not i2c.try_lock():
-            pass
-        
         command = bytes([0x5A, 0xA5])
-        i2c.writeto(FXCORE_ADDRESS, command)
+        with bus_for(address).transaction() as bus:
+            bus.writeto(address, command)
+        note_fxcore_command(address)
+        fxcore_targets[address].sm.transition(FXCORE_STATE_RUN_FLASH, "EXIT_PRG")
         debug_message("Exited programming mode - returned to RUN mode")
-
-        running = False
         
-        i2c.unlock()
-        time.sleep(0.1)
+        running = ram_program_running()
+        
+        await asyncio.sleep(0.1)
         # log_fxcore_status("After EXIT_PRG")
         return True
-        
+    
     except OSError as e:
         error_message(f"Error exiting PROG mode: {e}")
-        try:
-            i2c.unlock();
-        except:
-            pass
+        fxcore_targets[address].sm.lost("EXIT_PRG failed")
         return False
 
 def verify_hex_checksum(record_bytes):
@@ -348,11 +902,11 @@ def read_fxcore_hex_file(filename):
             line = line.strip()
             if not line.startswith(':'):
                 continue
-                
+            
             if len(line) < 11:
                 debug_message(f"Line {line_num}: Record too short, skipping")
                 continue
-                
+            
             try:
                 byte_count = int(line[1:3], 16)
                 address = int(line[3:7], 16) 
@@ -386,21 +940,21 @@ def read_fxcore_hex_file(filename):
                             mreg_data.append(0x00)
                         for i, byte_val in enumerate(data_bytes):
                             mreg_data[address - 0x0000 + i] = byte_val
-                            
+                    
                     elif 0x0800 <= address <= 0x0FFF:
                         # CREG data
                         while len(creg_data) < (address - 0x0800) + len(data_bytes):
                             creg_data.append(0x00)
                         for i, byte_val in enumerate(data_bytes):
                             creg_data[address - 0x0800 + i] = byte_val
-                            
+                    
                     elif 0x1000 <= address <= 0x17FF:
                         # SFR data
                         while len(sfr_data) < (address - 0x1000) + len(data_bytes):
                             sfr_data.append(0x00)
                         for i, byte_val in enumerate(data_bytes):
                             sfr_data[address - 0x1000 + i] = byte_val
-                            
+                    
                     elif address >= 0x1800:
                         # Program data - just append, we'll handle sparse addresses later
                         # Calculate offset from start of program area
@@ -409,18 +963,18 @@ def read_fxcore_hex_file(filename):
                             prog_data.append(0x00)
                         for i, byte_val in enumerate(data_bytes):
                             prog_data[prog_offset + i] = byte_val
-                    
+                
                 elif record_type == 0x01:  # End of file
                     debug_message(f"Line {line_num}: End of file record")
                     break
-                    
+            
             except ValueError as e:
                 error_message(f"Line {line_num}: Parse error - {e}")
                 continue
             except MemoryError as e:
                 error_message(f"Line {line_num}: Memory error - hex file too large")
                 return None
-
+        
         debug_message(f"Extracted arrays: MREG={len(mreg_data)}, CREG={len(creg_data)}, "
                    f"SFR={len(sfr_data)}, PROGRAM={len(prog_data)} bytes")
         
@@ -430,7 +984,7 @@ def read_fxcore_hex_file(filename):
             instruction_bytes = len(prog_data) - 2
         else:
             instruction_bytes = len(prog_data)
-            
+        
         instructions = []
         for i in range(0, instruction_bytes, 4):
             if i + 3 < instruction_bytes:
@@ -449,110 +1003,112 @@ def read_fxcore_hex_file(filename):
             'instructions': instructions,
             'program_data': prog_data,
             'mreg_checksum': bytearray([0, 0]),
-            'creg_checksum': bytearray([0, 0])
+            'creg_checksum': bytearray([0, 0]),
+            'filename': filename
         }
-        
+    
     except Exception as e:
         error_message(f"Error reading hex file {filename}: {e}")
         return None
 
-def send_i2c_data(data, description):
+async def send_i2c_data(data, description, address=FXCORE_ADDRESS):
     """Send data over I2C as a single transfer"""
+    fxcore_targets[address].status_cache.invalidate()
     try:
-        while not i2c.try_lock():
-            pass
-        
         try:
-            i2c.writeto(FXCORE_ADDRESS, data)
-            i2c.unlock()
+            with bus_for(address).transaction() as bus:
+                bus.writeto(address, data)
             debug_message(f"Sent {len(data)} bytes of {description} in single transfer")
             return True
+        except I2CBusTimeout:
+            raise
         except OSError as e:
             debug_message(f"Single transfer failed ({e}), trying chunked transfer...")
+            # Lock per chunk so other tasks can use the bus during the gaps
             chunk_size = 32
             for i in range(0, len(data), chunk_size):
                 chunk = data[i:i + chunk_size]
-                i2c.writeto(FXCORE_ADDRESS, chunk)
-                time.sleep(0.005) # was 0.01
+                with bus_for(address).transaction() as bus:
+                    bus.writeto(address, chunk)
+                await asyncio.sleep(0.005) # was 0.01
             
-            i2c.unlock()
             debug_message(f"Sent {len(data)} bytes of {description} in {(len(data) + chunk_size - 1) // chunk_size} chunks")
             return True
-        
+    
     except OSError as e:
         error_message(f"Error sending {description}: {e}")
-        try:
-            i2c.unlock();
-        except:
-            pass
+        fxcore_targets[address].sm.lost(f"{description} failed")
         return False
 
-def send_command(cmd_bytes, description):
-    """Send a command to FXCore"""
+# Fixed FXCore commands, built once
+CMD_XFER_CREG = b"\x01\x0F"
+CMD_XFER_MREG = b"\x04\x7F"
+CMD_XFER_SFR = b"\x02\x0B"
+CMD_EXEC_FROM_RAM = b"\x0D\x00"
+CMD_RETURN_0 = b"\x0E\x00"
+
+async def send_command(cmd_bytes, description, address=FXCORE_ADDRESS):
+    """Send a command to FXCore (bytes, or a list of ints)"""
     try:
-        while not i2c.try_lock():
-            pass
-        
-        command = bytes(cmd_bytes)
-        i2c.writeto(FXCORE_ADDRESS, command)
-        hex_bytes = [f'0x{b:02X}' for b in cmd_bytes]
-        debug_message(f"Sent {description} command: {' '.join(hex_bytes)}")
+        command = cmd_bytes if isinstance(cmd_bytes, bytes) else bytes(cmd_bytes)
+        with bus_for(address).transaction() as bus:
+            bus.writeto(address, command)
+        note_fxcore_command(address)
+        if DEBUG_MODE:
+            hex_bytes = [f'0x{b:02X}' for b in command]
+            debug_message(f"Sent {description} command: {' '.join(hex_bytes)}")
         
-        i2c.unlock()
-        time.sleep(0.005) # was 0.01
+        await asyncio.sleep(0.005) # was 0.01
         return True
-        
+    
     except OSError as e:
         error_message(f"Error sending {description} command: {e}")
-        try:
-            i2c.unlock();
-        except:
-            pass
+        fxcore_targets[address].sm.lost(f"{description} failed")
         return False
 
-def send_cregs(cregs):
+async def send_cregs(cregs, address=FXCORE_ADDRESS):
     """Send CREG data to FXCore - 66 bytes expected (64 data + 2 checksum)"""
-    if not send_command([0x01, 0x0F], "XFER_CREG"):
+    if not await send_command(CMD_XFER_CREG, "XFER_CREG", address):
         return False
     
     if len(cregs) != 66:
         error_message(f"CREG data must be exactly 66 bytes, got {len(cregs)}")
         return False
     
-    success = send_i2c_data(cregs, f"CREG data (66 bytes)")
+    success = await send_i2c_data(cregs, f"CREG data (66 bytes)", address)
     if success:
         debug_message("CREG transfer success")
     return success
 
-def send_mregs(mregs):
+async def send_mregs(mregs, address=FXCORE_ADDRESS):
     """Send MREG data to FXCore - 514 bytes expected (512 data + 2 checksum)"""
-    if not send_command([0x04, 0x7F], "XFER_MREG"):
+    if not await send_command(CMD_XFER_MREG, "XFER_MREG", address):
         return False
     
     if len(mregs) != 514:
         error_message(f"MREG data must be exactly 514 bytes, got {len(mregs)}")
         return False
     
-    success = send_i2c_data(mregs, f"MREG data (514 bytes)")
+    success = await send_i2c_data(mregs, f"MREG data (514 bytes)", address)
     if success:
         debug_message("MREG transfer success")
     return success
 
-def send_sfrs(sfrs):
+async def send_sfrs(sfrs, address=FXCORE_ADDRESS):
     """Send SFR data to FXCore - 50 bytes expected (48 data + 2 checksum)"""
-    if not send_command([0x02, 0x0B], "XFER_SFR"):
+    if not await send_command(CMD_XFER_SFR, "XFER_SFR", address):
         return False
     
     if len(sfrs) != 50:
         error_message(f"SFR data must be exactly 50 bytes, got {len(sfrs)}")
         return False
     
-    success = send_i2c_data(sfrs, f"SFR data (50 bytes)")
+    success = await send_i2c_data(sfrs, f"SFR data (50 bytes)", address)
     if success:
         debug_message("SFR transfer success")
     return success
 
-def send_program_data(instructions, program_data):
+async def send_program_data(instructions, program_data, address=FXCORE_ADDRESS):
     """Send program data to FXCore - program_data should include checksum"""
     if len(instructions) == 0:
         debug_message("No program instructions to send")
@@ -566,63 +1122,472 @@ def send_program_data(instructions, program_data):
     if len(program_data) != expected_size:
         error_message(f"Program data must be exactly {expected_size} bytes, got {len(program_data)}")
         return False
-        
+    
     num_instructions = len(instructions)
     cmd_value = 0x0800 + (num_instructions - 1)
     cmd_high = (cmd_value >> 8) & 0xFF
     cmd_low = cmd_value & 0xFF
     
-    if not send_command([cmd_high, cmd_low], f"XFER_PRG (0x{cmd_value:04X} for {num_instructions} instructions)"):
+    if not await send_command([cmd_high, cmd_low], f"XFER_PRG (0x{cmd_value:04X} for {num_instructions} instructions)", address):
         return False
     
-    success = send_i2c_data(program_data, f"program data ({len(program_data)} bytes)")
+    success = await send_i2c_data(program_data, f"program data ({len(program_data)} bytes)", address)
     if success:
         debug_message("PRG transfer success")
     return success
 
-def execute_from_ram():
+async def execute_from_ram(address=FXCORE_ADDRESS):
     """Execute the program from RAM"""
-    success = send_command([0x0D, 0x00], "EXEC_FROM_RAM")
+    success = await send_command(CMD_EXEC_FROM_RAM, "EXEC_FROM_RAM", address)
     if success:
         # log_fxcore_status("After EXEC_FROM_RAM")
-                debug_message("Enter RUN from RAM")
+        fxcore_targets[address].sm.transition(FXCORE_STATE_RUN_RAM, "EXEC_FROM_RAM")
+        debug_message("Enter RUN from RAM")
     return success
 
-def write_to_flash_location(location):
+async def write_to_flash_location(location, address=FXCORE_ADDRESS):
     """Write the program to a specific flash location (0-15)"""
     if location < 0 or location > 15:
         error_message(f"Invalid flash location: {location}")
         return False
     
-    success = send_command([0x0C, location], f"WRITE_PRG to location {location:X}")
+    success = await send_command([0x0C, location], f"WRITE_PRG to location {location:X}", address)
     if success:
         debug_message(f"Writing to FLASH location {location:X}, waiting 200ms...")
-        time.sleep(0.2)  # Wait for FLASH write to complete
+        await asyncio.sleep(0.2)  # Wait for FLASH write to complete, other tasks keep running
         # log_fxcore_status(f"After WRITE_PRG to location {location:X}")
     return success
 
-def send_return_0():
+async def send_return_0(address=FXCORE_ADDRESS):
     """Send RETURN_0 command to stop execution and return to STATE0"""
-    success = send_command([0x0E, 0x00], "RETURN_0")
+    success = await send_command(CMD_RETURN_0, "RETURN_0", address)
     if success:
         # log_fxcore_status("After RETURN_0")
-                debug_message("Sent RETURN_0 command")
+        fxcore_targets[address].sm.transition(FXCORE_STATE_PROG, "RETURN_0")
+        debug_message("Sent RETURN_0 command")
     return success
 
-# UNIFIED PROGRAMMING FUNCTION
-def execute_unified_programming(data_source, execution_mode="ram", flash_location=None):
+# State-aware transitions - only send the command when it changes something
+async def ensure_prog_mode(address=FXCORE_ADDRESS):
+    """ENTER_PRG unless the chip is already in PROG mode"""
+    sm = fxcore_targets[address].sm
+    if sm.state == FXCORE_STATE_PROG:
+        sm.skip("ENTER_PRG")
+        return True
+    # Wait for FXCore to settle - parsing the hex file already counts towards it
+    await settle_fxcore(address)
+    if not await enter_prog_mode(address):
+        return False
+    await asyncio.sleep(0.1)
+    return True
+
+async def leave_ram_execution(address=FXCORE_ADDRESS):
+    """RETURN_0 unless the chip is known not to be executing from RAM"""
+    sm = fxcore_targets[address].sm
+    if sm.state in (FXCORE_STATE_PROG, FXCORE_STATE_RUN_FLASH):
+        sm.skip("RETURN_0")
+        return True
+    success = await send_return_0(address)
+    await asyncio.sleep(0.1)
+    return success
+
+async def ensure_run_mode(address=FXCORE_ADDRESS):
+    """EXIT_PRG unless the chip is already running from flash"""
+    global running
+    sm = fxcore_targets[address].sm
+    if sm.state == FXCORE_STATE_RUN_FLASH:
+        sm.skip("EXIT_PRG")
+        running = ram_program_running()
+        return True
+    return await exit_prog_mode(address)
+
+# Upload verification - status bits and codes from the FXCore datasheet
+SECTION_RECEIVED_BITS = {"CREG": 0x01, "SFR": 0x02, "MREG": 0x04, "PRG": 0x10}
+FXCORE_NO_ERROR = 0x00
+FXCORE_STATUS_ERRORS = {
+    0xFF: "unknown command",
+    0xFE: "invalid command length",
+    0xFD: "parameter out of range",
+    0xFC: "command not allowed in current state",
+    0x80: "checksum error",
+    0x4F: "program too long",
+    0x40: "unknown error, state reset to STATE0",
+    0x1F: "flash erase error", 0x2F: "flash erase error", 0x3F: "flash erase error",
+    0x17: "flash programming error", 0x27: "flash programming error", 0x37: "flash programming error",
+}
+verify_retries = 0          # sections and slots re-sent since boot
+
+def verify_section(section, address=FXCORE_ADDRESS):
+    """Check the status after a section transfer, True when the FXCore accepted it"""
+    status = read_fxcore_status(address=address)
+    if status is None:
+        return False
+    code = status.command_status
+    if code != FXCORE_NO_ERROR:
+        error_message(f"{section} rejected by FXCore 0x{address:02X}: {FXCORE_STATUS_ERRORS.get(code, f'status 0x{code:02X}')}")
+        return False
+    if not status.transfer_state & SECTION_RECEIVED_BITS[section]:
+        error_message(f"{section} not marked received by FXCore 0x{address:02X} (transfer state 0x{status.transfer_state:02X})")
+        return False
+    return True
+
+def verify_flash_slot(location, address=FXCORE_ADDRESS):
+    """Check the status after WRITE_PRG, True when the slot was written"""
+    status = read_fxcore_status(address=address)
+    if status is None:
+        return False
+    code = status.command_status
+    if code != FXCORE_NO_ERROR:
+        error_message(f"WRITE_PRG to location {location:X} failed: {FXCORE_STATUS_ERRORS.get(code, f'status 0x{code:02X}')}")
+        return False
+    if not status.program_slot_status & (1 << location):
+        error_message(f"Location {location:X} not marked programmed (slot status 0x{status.program_slot_status:04X})")
+        return False
+    return True
+
+def image_complete(sections, address=FXCORE_ADDRESS):
+    """True when the status still shows every section of the image received"""
+    status = read_fxcore_status(address=address)
+    if status is None:
+        return False
+    missing = [section for section in sections if not status.transfer_state & SECTION_RECEIVED_BITS[section]]
+    if missing:
+        error_message(f"FXCore 0x{address:02X} lost {', '.join(missing)} (transfer state 0x{status.transfer_state:02X})")
+        return False
+    return True
+
+async def recover_for_retry(address):
     """
-    Unified programming function for both file mode and FT260 mode
+    Back to STATE0 after a rejected transfer so the retry starts clean. True
+    when the chip went to STATE0: that discards the sections it already
+    received, so the upload has to start over instead of a retry
+    """
+    target = fxcore_targets[address]
+    cache = target.status_cache
+    if not cache.valid:
+        return False
+    status = cache.status
+    if status.command_status == 0xFC or (status.command_status & 0xF0) == 0x40:
+        await send_return_0(address)
+        target.upload_reset = True
+        return True
+    return False
+
+def restart_upload(address):
+    """Count a restart of the whole upload, the next ensure_prog_mode() sends ENTER_PRG"""
+    global verify_retries
+    verify_retries += 1
+    log_message(f"FXCore 0x{address:02X} back in STATE0 - restarting the upload from ENTER_PRG")
+    fxcore_targets[address].sm.lost("upload restart")
+
+# Optional features live in their own modules next to this file and are
+# imported only when switched on or first used: span_trace, traffic_capture,
+# deterministic_memory, cdc_transport, midi_transport, batch_script,
+# self_test and preset_cache. A module can't import code.py, so it gets this
+# file's names through `firmware`.
+class FirmwareNames:
+    """The globals of code.py as attributes, read when used so rebinding stays visible"""
+    def __init__(self, names):
+        self.names = names
     
-    Args:
-        data_source: Either a filename (string) or a dict with programming data
-        execution_mode: "ram" for RAM execution, "flash" for flash programming
-        flash_location: Location (0-15) for flash programming, ignored for RAM mode
+    def __getattr__(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            raise AttributeError(name)
+
+firmware = FirmwareNames(globals())
+
+# Span tracing (TRACE_SPANS, extension command E6) lives in span_trace.py,
+# start_span_trace() imports it once the functions it wraps are defined
+span_trace = None
+trace = None
+
+# Traffic capture (CAPTURE_TRAFFIC, extension command E8) lives in
+# traffic_capture.py, imported the first time capture starts
+traffic_capture = None
+capture = None
+
+def start_capture():
+    """Clear the capture ring and start recording, importing the capture on first use"""
+    global traffic_capture, capture
+    if capture is None:
+        import traffic_capture
+        capture = traffic_capture.TrafficCapture(firmware)
+    capture.start()
+
+# Performance counters - plain int fields bumped in the hot paths, packed
+# into feature report 0x01 only when the host asks for them
+PERF_REPORT_ID = 0x01
+PERF_REPORT_SIZE = 63
+PERF_CMD_SNAPSHOT = 0x00    # SET_FEATURE 0x01 [cmd, page], then GET_FEATURE 0x01
+PERF_CMD_RESET = 0x01
+PERF_PAGE_COUNTERS = 0
+PERF_PAGE_LATENCY = 1       # section and flash write phases
+PERF_PAGE_MEMORY = 2
+PERF_PAGE_JOB_LATENCY = 3   # RAM and flash job phases
+
+PERF_PHASE_SECTION = 0      # one section transfer over I2C
+PERF_PHASE_FLASH_WRITE = 1  # WRITE_PRG including the flash wait
+PERF_PHASE_RAM_JOB = 2      # whole RAM job
+PERF_PHASE_FLASH_JOB = 3    # whole flash job
+PERF_PHASES = 4
+# Four values per phase, so a 63-byte page holds two phases
+PERF_LATENCY_PAGES = {
+    PERF_PAGE_LATENCY: (PERF_PHASE_SECTION, PERF_PHASE_FLASH_WRITE),
+    PERF_PAGE_JOB_LATENCY: (PERF_PHASE_RAM_JOB, PERF_PHASE_FLASH_JOB),
+}
+
+class PerfCounters:
+    def __init__(self):
+        self.report = bytearray(PERF_REPORT_SIZE)
+        self.reset()
     
-    Returns:
-        bool: True if successful, False otherwise
+    def reset(self):
+        self.reports_received = 0
+        self.reports_dropped = 0    # reports whose handler failed
+        self.bytes_from_host = 0    # D0 payload bytes, programmed or passed through
+        self.bytes_to_host = 0      # C2 read bytes returned
+        self.uploads_ram = 0
+        self.uploads_flash = 0
+        self.upload_failures = 0
+        self.uploads_skipped = 0    # identical image already running
+        self.report_max_us = 0      # longest time spent handling one HID report
+        self.phase_count = [0] * PERF_PHASES
+        self.phase_total_us = [0] * PERF_PHASES
+        self.phase_min_us = [0] * PERF_PHASES
+        self.phase_max_us = [0] * PERF_PHASES
+        if trace is not None:
+            trace.clear()
+        for manager in i2c_buses:
+            manager.reset_stats()
+    
+    def phase(self, phase, start_ns):
+        """Record one phase that started at start_ns"""
+        elapsed = (time.monotonic_ns() - start_ns) // 1000
+        count = self.phase_count[phase]
+        if count == 0 or elapsed < self.phase_min_us[phase]:
+            self.phase_min_us[phase] = elapsed
+        if elapsed > self.phase_max_us[phase]:
+            self.phase_max_us[phase] = elapsed
+        self.phase_count[phase] = count + 1
+        self.phase_total_us[phase] += elapsed
+    
+    def pack(self, values):
+        """Page number and little-endian uint32 fields into the report buffer"""
+        report = self.report
+        # A longer page would grow the buffer past the declared report length
+        assert 1 + 4 * len(values) <= PERF_REPORT_SIZE, "performance counters page too long"
+        for i in range(len(report)):
+            report[i] = 0
+        offset = 1
+        for value in values:
+            report[offset:offset + 4] = (value & 0xFFFFFFFF).to_bytes(4, 'little')
+            offset += 4
+        return report
+    
+    def snapshot(self, page):
+        """Feature report contents for a page"""
+        if page == PERF_PAGE_MEMORY:
+            if gc_scheduler is not None:
+                values = gc_scheduler.values() + [self.report_max_us]
+            else:
+                # free memory, low-water marks and collections all 0
+                values = [0] * (GC_PHASES + 4) + [self.report_max_us]
+        elif page in PERF_LATENCY_PAGES:
+            # count, min, avg, max (us) per phase
+            values = []
+            for phase in PERF_LATENCY_PAGES[page]:
+                count = self.phase_count[phase]
+                values.append(count)
+                values.append(self.phase_min_us[phase])
+                values.append(self.phase_total_us[phase] // count if count else 0)
+                values.append(self.phase_max_us[phase])
+        else:
+            page = PERF_PAGE_COUNTERS
+            transactions = contended = wait_us = errors = 0
+            for manager in i2c_buses:
+                transactions += manager.acquisitions
+                contended += manager.contended
+                wait_us += manager.wait_ns_total // 1000
+                errors += manager.errors + manager.timeouts
+            values = (time.monotonic_ns() // 1000000, self.reports_received, self.reports_dropped,
+                      self.bytes_from_host, self.bytes_to_host, transactions, errors, verify_retries,
+                      contended, wait_us, self.uploads_ram, self.uploads_flash, self.upload_failures,
+                      self.uploads_skipped, pipeline.superseded)
+        report = self.pack(values)
+        report[0] = page
+        return report
+
+perf = PerfCounters()
+
+GC_PHASE_REPORTS = 0    # HID report handling
+GC_PHASE_UPLOAD = 1     # programming jobs
+GC_PHASE_IDLE = 2
+GC_PHASES = 3
+
+# DETERMINISTIC_MEMORY collections live in deterministic_memory.py
+gc_scheduler = None
+if DETERMINISTIC_MEMORY:
+    from deterministic_memory import GCScheduler
+    gc_scheduler = GCScheduler(firmware)
+
+# Progress input reports - 16 bytes:
+#   event, result, address, detail, timestamp ms[4], job id[2], FXCore command_status
+PROGRESS_REPORT_ID = 0xB8
+PROGRESS_REPORT_SIZE = 16
+PROGRESS_JOB_STARTED = 0x01     # detail = job kind
+PROGRESS_SECTION_DONE = 0x02    # detail = section (XFER byte: 01 CREG, 02 SFR, 04 MREG, 08 program)
+PROGRESS_FLASH_STARTED = 0x03   # detail = location
+PROGRESS_FLASH_DONE = 0x04      # detail = location
+PROGRESS_RUN_STARTED = 0x05     # program running from RAM
+PROGRESS_FAILED = 0x06          # detail = section or 0x0C (flash write), result = error
+PROGRESS_JOB_DONE = 0x07        # detail = job kind, result = job result
+
+PROGRESS_SECTIONS = {"CREG": 0x01, "SFR": 0x02, "MREG": 0x04, "PRG": 0x08}
+PROGRESS_FLASH_WRITE = 0x0C
+PROGRESS_JOB_KINDS = {"ram": 1, "flash": 2, "enter": 3, "exit": 4, "return0": 5, "stop": 6, "selftest": 7}
+
+# Pushed input reports (progress, self-test) only go out while the host is
+# there to read them - a report nobody reads makes the next send_report()
+# wait for the endpoint and stalls the loop
+PUSH_HOST_WINDOW = 5.0      # seconds after the last host report
+PUSH_SEND_SLOW = 0.01       # a slower send holds back pushes until the next host report
+
+def report_progress(event, address, detail=0, result=0):
+    """Push a progress report for the job running on address"""
+    if PROGRESS_REPORTS and ft260.host_listening():
+        job = pipeline.active.get(address)
+        ft260.send_progress(event, result, address, detail, job.id if job else 0)
+
+async def upload_section(section, send, address=FXCORE_ADDRESS):
+    """
+    Send one section (send() returns the transfer coroutine) and give the
+    FXCore 100 ms to take it. With VERIFY_UPLOADS the status is checked and
+    only this section is re-sent, up to VERIFY_RETRIES times - unless the
+    chip went back to STATE0, then the caller restarts the whole upload.
     """
+    global verify_retries
+    attempts = 1 + VERIFY_RETRIES if VERIFY_UPLOADS else 1
+    for attempt in range(attempts):
+        if attempt > 0:
+            if await recover_for_retry(address):
+                return False
+            verify_retries += 1
+            log_message(f"Re-sending {section} to FXCore 0x{address:02X} (retry {attempt}/{VERIFY_RETRIES})")
+        start_ns = time.monotonic_ns()
+        if not await send():
+            continue
+        perf.phase(PERF_PHASE_SECTION, start_ns)
+        if gc_scheduler is not None:
+            gc_scheduler.safe_point(GC_PHASE_UPLOAD)
+        await asyncio.sleep(0.1)
+        if not VERIFY_UPLOADS or verify_section(section, address):
+            report_progress(PROGRESS_SECTION_DONE, address, PROGRESS_SECTIONS[section])
+            return True
+    report_progress(PROGRESS_FAILED, address, PROGRESS_SECTIONS[section], EXT_ERR_FAILED)
+    return False
 
+async def write_flash_slot(location, address=FXCORE_ADDRESS):
+    """
+    WRITE_PRG, with VERIFY_UPLOADS re-issued until the slot status confirms
+    it - unless the chip went back to STATE0, the program is gone then
+    """
+    global verify_retries
+    attempts = 1 + VERIFY_RETRIES if VERIFY_UPLOADS else 1
+    for attempt in range(attempts):
+        if attempt > 0:
+            if await recover_for_retry(address):
+                return False
+            verify_retries += 1
+            log_message(f"Re-writing FLASH location {location:X} (retry {attempt}/{VERIFY_RETRIES})")
+        report_progress(PROGRESS_FLASH_STARTED, address, location)
+        start_ns = time.monotonic_ns()
+        if not await write_to_flash_location(location, address):
+            continue
+        perf.phase(PERF_PHASE_FLASH_WRITE, start_ns)
+        if not VERIFY_UPLOADS or verify_flash_slot(location, address):
+            report_progress(PROGRESS_FLASH_DONE, address, location)
+            return True
+    report_progress(PROGRESS_FAILED, address, PROGRESS_FLASH_WRITE, EXT_ERR_FAILED)
+    return False
+
+# Image identity
+def image_crc32(cregs, mregs, sfrs, program_data):
+    """CRC-32 over all sections of an image, identifies it independent of its source"""
+    crc = 0
+    for section in (cregs, mregs, sfrs, program_data):
+        crc = crc32(section, crc)
+    return crc & 0xFFFFFFFF
+
+# The preset cache (extension commands E3/E4) lives in preset_cache.py,
+# imported only when PRESET_CACHE_SIZE is not 0
+preset_cache = None
+if PRESET_CACHE_SIZE:
+    from preset_cache import PresetCache
+    preset_cache = PresetCache(firmware)
+
+def preset_image(crc):
+    """Cached image with this image CRC, None when it isn't cached or the cache is off"""
+    return preset_cache.get(crc) if preset_cache is not None else None
+
+# UNIFIED PROGRAMMING FUNCTION
+def upload_cancelled(job):
+    """True when a newer request has superseded the upload running for job"""
+    return job is not None and job.cancelled
+
+async def abandon_upload(job):
+    """Stop a superseded upload at a section boundary, back to STATE0 in PROG mode"""
+    log_message(f"Upload superseded by a newer request - abandoning {job.kind} job")
+    # RETURN_0 drops any partial transfer, PROG mode is kept for the next upload
+    await send_return_0(job.address)
+    return False
+
+async def upload_image_sections(cregs, mregs, sfrs, instructions, program_data, job=None, address=FXCORE_ADDRESS):
+    """
+    Send the sections in the correct order (CREG, MREG, SFR, program), the
+    empty ones skipped. True when all were taken, None when job was
+    cancelled at a section boundary. With VERIFY_UPLOADS the status has to
+    show every section still received at the end, a chip that dropped some
+    counts as reset to STATE0.
+    """
+    sections = (
+        ("CREG", cregs, lambda: send_cregs(cregs, address)),
+        ("MREG", mregs, lambda: send_mregs(mregs, address)),
+        ("SFR", sfrs, lambda: send_sfrs(sfrs, address)),
+        ("PRG", instructions, lambda: send_program_data(instructions, program_data, address)),
+    )
+    sent = []
+    for section, data, send in sections:
+        if len(data) > 0:
+            debug_message(f"Uploading {section} data...")
+            if not await upload_section(section, send, address):
+                return False
+            sent.append(section)
+        if upload_cancelled(job):
+            return None
+    if VERIFY_UPLOADS and not image_complete(sent, address):
+        fxcore_targets[address].upload_reset = True
+        return False
+    return True
+
+async def execute_unified_programming(data_source, execution_mode="ram", flash_location=None, job=None, address=FXCORE_ADDRESS, force=False):
+    """
+    Unified programming function for both file mode and FT260 mode
+    
+    Args:
+        data_source: Either a filename (string) or a dict with programming data
+        execution_mode: "ram" for RAM execution, "flash" for flash programming
+        flash_location: Location (0-15) for flash programming, ignored for RAM mode
+        job: ProgrammingJob driving this upload, checked for cancellation at
+             every section boundary (None = not cancellable)
+        address: I2C address of the FXCore to program
+        force: upload even when the same image already runs from RAM
+    
+    Returns:
+        bool: True if successful, False otherwise (also when cancelled)
+    """
+    
     global running
     
     # Determine if we're working with file data or FT260 data
@@ -632,7 +1597,7 @@ def execute_unified_programming(data_source, execution_mode="ram", flash_locatio
         fx_data = read_fxcore_hex_file(data_source)
         if not fx_data:
             error_message("Failed to read hex file")
-            blink_status_led(RED, 5)
+            await blink_status_led(RED, 5)
             return False
         
         cregs = fx_data['cregs']
@@ -640,7 +1605,7 @@ def execute_unified_programming(data_source, execution_mode="ram", flash_locatio
         sfrs = fx_data['sfrs']
         instructions = fx_data['instructions']
         program_data = fx_data.get('program_data', bytearray())
-        
+    
     else:
         # FT260 mode - use provided data dict
         cregs = data_source.get('cregs', bytearray())
@@ -649,119 +1614,115 @@ def execute_unified_programming(data_source, execution_mode="ram", flash_locatio
         instructions = data_source.get('instructions', [])
         program_data = data_source.get('program_data', bytearray())
     
+    # Nothing to do when exactly this image is already running from RAM
+    image_crc = None
+    if execution_mode == "ram":
+        image_crc = image_crc32(cregs, mregs, sfrs, program_data)
+        sm = fxcore_targets[address].sm
+        if SKIP_IDENTICAL_IMAGE and not force and sm.state == FXCORE_STATE_RUN_RAM and sm.image_crc == image_crc:
+            log_message(f"Image 0x{image_crc:08X} already running from RAM - skipping upload")
+            perf.uploads_skipped += 1
+            if job is not None:
+                job.skipped = True
+            return True
+    
     # Set appropriate status LED based on mode
     if execution_mode == "flash":
         if isinstance(data_source, str):
             log_message(f"Starting flash programming: {data_source} -> Location {flash_location:X}")
         else:
-            log_message(f"Starting flash programming to location {flash_location:X}")
-        blink_status_led(PURPLE, 2)
+            log_message(f"Starting flash programming from {data_source.get('filename', 'FT260 data')} to location {flash_location:X}")
+        await blink_status_led(PURPLE, 2)
     else:
         if isinstance(data_source, str):
             log_message(f"Starting RAM execution: {data_source}")
         else:
-            log_message("Starting RAM execution from FT260 data")
-        blink_status_led(BLUE, 2)
-    
-    # Initial status check
-    # log_fxcore_status("Before programming")
+            log_message(f"Starting RAM execution from {data_source.get('filename', 'FT260 data')}")
+        await blink_status_led(BLUE, 2)
     
-    # Wait for FXCore to settle
-    debug_message("Waiting for FXCore to settle...")
-    time.sleep(0.1)
-    
-    # Enter programming mode
-    debug_message("Entering programming mode...")
-    if not enter_prog_mode():
-        error_message("Failed to enter programming mode")
-        blink_status_led(RED, 5)
+    if upload_cancelled(job):
+        log_message(f"Upload superseded by a newer request - skipping {job.kind} job")
         return False
     
-    time.sleep(0.1)
-    
-    # Send data in the correct order: CREG, MREG, SFR, PROGRAM
-    success = True
-    
-    # Send CREGs if available
-    if success and len(cregs) > 0:
-        debug_message("Uploading CREG data...")
-        if not send_cregs(cregs):
-            success = False
-        else:
-            time.sleep(0.1)
-    
-    # Send MREGs if available
-    if success and len(mregs) > 0:
-        debug_message("Uploading MREG data...")
-        if not send_mregs(mregs):
-            success = False
-        else:
-            time.sleep(0.1)
-    
-    # Send SFRs if available
-    if success and len(sfrs) > 0:
-        debug_message("Uploading SFR data...")
-        if not send_sfrs(sfrs):
-            success = False
-        else:
-            time.sleep(0.1)
+    # Initial status check
+    # log_fxcore_status("Before programming")
     
-    # Send program data if available
-    if success and len(instructions) > 0:
-        debug_message("Uploading program data...")
-        if not send_program_data(instructions, program_data):
-            success = False
-        else:
-            time.sleep(0.1)
+    # A chip that went back to STATE0 during the upload has dropped what it
+    # received, with VERIFY_UPLOADS the upload then starts over from ENTER_PRG
+    target = fxcore_targets[address]
+    restarts = VERIFY_RETRIES if VERIFY_UPLOADS else 0
+    while True:
+        target.upload_reset = False
+        
+        # Enter programming mode (settles first, skipped when already in PROG)
+        debug_message("Entering programming mode...")
+        if not await ensure_prog_mode(address):
+            error_message("Failed to enter programming mode")
+            await blink_status_led(RED, 5)
+            return False
+        
+        success = await upload_image_sections(cregs, mregs, sfrs, instructions, program_data, job, address)
+        if success is None:
+            return await abandon_upload(job)
+        failure = "Failed to upload complete program data"
+        
+        if success and execution_mode == "flash":
+            # Flash programming mode
+            if flash_location is None or flash_location < 0 or flash_location > 15:
+                error_message(f"Invalid flash location: {flash_location}")
+                await blink_status_led(RED, 5)
+                await leave_ram_execution(address)
+                await ensure_run_mode(address)
+                return False
+            
+            debug_message(f"Writing program to FLASH location {flash_location:X}...")
+            success = await write_flash_slot(flash_location, address)
+            failure = "Failed to write to FLASH"
+        
+        if success or not target.upload_reset or restarts == 0:
+            break
+        restarts -= 1
+        restart_upload(address)
     
     if not success:
-        error_message("Failed to upload complete program data")
-        blink_status_led(RED, 5)
-        send_return_0()
-        exit_prog_mode()
+        error_message(failure)
+        await blink_status_led(RED, 5)
+        await leave_ram_execution(address)
+        await ensure_run_mode(address)
         return False
-    
+   
    # Execute based on mode
     if execution_mode == "flash":
-        # Flash programming mode
-        if flash_location is None or flash_location < 0 or flash_location > 15:
-            error_message(f"Invalid flash location: {flash_location}")
-            blink_status_led(RED, 5)
-            send_return_0()
-            exit_prog_mode()
-            return False
-        
-        debug_message(f"Writing program to FLASH location {flash_location:X}...")
-        if not write_to_flash_location(flash_location):
-            error_message("Failed to write to FLASH")
-            blink_status_led(RED, 5)
-            send_return_0()
-            exit_prog_mode()
-            return False
-        
         # Return to STATE0 and exit programming mode for flash
-        send_return_0()
-        time.sleep(0.1)
-        exit_prog_mode()
+        await leave_ram_execution(address)
+        await ensure_run_mode(address)
         
         # Success - indicate with solid green LED
         set_status_led(GREEN)
         log_message(f"SUCCESS: Program written to FLASH location {flash_location:X}")
         debug_message("Programming complete. FXCore returned to RUN mode.")
-        
+    
     else:
         # RAM execution mode
         debug_message("Starting program execution from RAM...")
-        if not execute_from_ram():
+        if not await execute_from_ram(address):
             error_message("Failed to execute program")
-            blink_status_led(RED, 5)
-            send_return_0()
-            exit_prog_mode()
+            await blink_status_led(RED, 5)
+            await leave_ram_execution(address)
+            await ensure_run_mode(address)
             return False
         
         # Success - set running flag and initial LED state
-        running = True  # This makes the main loop handle blinking
+        report_progress(PROGRESS_RUN_STARTED, address)
+        fxcore_targets[address].sm.image_crc = image_crc
+        if preset_cache is not None:
+            preset_cache.store(image_crc, {
+                'cregs': cregs, 'mregs': mregs, 'sfrs': sfrs,
+                'instructions': instructions, 'program_data': program_data
+            })
+        running = True  # This makes led_task handle blinking
         set_status_led(RED)  # Set initial red state
+        boot_mark("RAM program running")
         log_message("SUCCESS: Program is running from RAM")
         debug_message("RED LED blinking indicates program is running from RAM")
         debug_message("CLEAR HARDWARE to stop execution and return to normal operation")
@@ -770,23 +1731,48 @@ def execute_unified_programming(data_source, execution_mode="ram", flash_locatio
 
 
 # Simplified file mode functions that use the unified function
-def program_location(location, filename):
+async def program_location(location, filename):
     """Program a specific location with a hex file (simplified wrapper)"""
-    return execute_unified_programming(filename, "flash", location)
+    return await execute_unified_programming(filename, "flash", location)
 
 
-def run_ram_execution(filename="output.hex"):
+async def run_ram_execution(filename="output.hex", force=False):
     """Run the complete upload and execution process for RAM execution (simplified wrapper)"""
-    return execute_unified_programming(filename, "ram")
+    return await execute_unified_programming(filename, "ram", force=force)
+
+
+def start_span_trace(events=TRACE_EVENTS):
+    """Import span tracing and wrap the upload steps, tools/fxcore_trace.py calls this at runtime"""
+    global span_trace, trace
+    if trace is None:
+        import span_trace
+        trace = span_trace.SpanTrace(firmware)
+    trace.install(events)
+
+if TRACE_SPANS:
+    start_span_trace()
+
+
+# I2C self-test (extension command E7, or SELFTEST_TRIGGER_FILE on the drive)
+# lives in self_test.py, imported the first time a self-test runs
+SELFTEST_TRIGGER_FILE = "selftest.txt"  # creating or changing it on the drive starts a run
+selftest = None
+
+async def run_self_test(address=FXCORE_ADDRESS):
+    """Self-test pipeline job, importing the self-test on first use"""
+    global selftest
+    if selftest is None:
+        from self_test import SelfTest
+        selftest = SelfTest(firmware)
+    return await selftest.run(address)
 
 
 # Helper function to convert FT260 data to the format expected by unified function
-def prepare_ft260_data_for_unified(ft260_emulator):
-    """Convert FT260 emulator data to format expected by unified programming function"""
-    # Convert program data to instructions if needed
+def program_instructions(program_data):
+    """32-bit instructions of program data as sent with XFER_PRG (checksum dropped)"""
     instructions = []
-    if len(ft260_emulator.program_data) >= 2:
-        program_payload = ft260_emulator.program_data[:-2]  # Everything except checksum
+    if len(program_data) >= 2:
+        program_payload = program_data[:-2]  # Everything except checksum
         for i in range(0, len(program_payload), 4):
             if i + 3 < len(program_payload):
                 instruction = (program_payload[i] |
@@ -794,16 +1780,341 @@ def prepare_ft260_data_for_unified(ft260_emulator):
                              (program_payload[i+2] << 16) |
                              (program_payload[i+3] << 24))
                 instructions.append(instruction)
-    
+    return instructions
+
+def prepare_ft260_data_for_unified(ft260_emulator):
+    """Convert FT260 emulator data to format expected by unified programming function"""
+    # Copies, not views - the job runs later and the host may already be
+    # sending the next program into the emulator buffers by then
     return {
-        'cregs': ft260_emulator.creg_data if len(ft260_emulator.creg_data) == 66 else bytearray(),
-        'mregs': ft260_emulator.mreg_data if len(ft260_emulator.mreg_data) == 514 else bytearray(),
-        'sfrs': ft260_emulator.sfr_data if len(ft260_emulator.sfr_data) == 50 else bytearray(),
-        'instructions': instructions,
-        'program_data': ft260_emulator.program_data
+        'cregs': bytearray(ft260_emulator.creg_data) if len(ft260_emulator.creg_data) == 66 else bytearray(),
+        'mregs': bytearray(ft260_emulator.mreg_data) if len(ft260_emulator.mreg_data) == 514 else bytearray(),
+        'sfrs': bytearray(ft260_emulator.sfr_data) if len(ft260_emulator.sfr_data) == 50 else bytearray(),
+        'instructions': program_instructions(ft260_emulator.program_data),
+        'program_data': bytearray(ft260_emulator.program_data)
     }
 
 
+# Programming pipeline - every FXCore command sequence runs in one task so
+# HID ingestion and the LED never wait on an upload or a flash write
+class ProgrammingJob:
+    def __init__(self, kind, data_source=None, location=None, address=FXCORE_ADDRESS, force=False):
+        self.kind = kind                # "ram", "flash", "enter", "exit", "return0", "stop", "selftest"
+        self.data_source = data_source  # filename or dict from prepare_ft260_data_for_unified
+        self.location = location        # flash location for "flash" jobs
+        self.address = address          # FXCore the job talks to
+        self.force = force              # "ram": upload even if the same image runs
+        self.id = 0                     # set by pipeline.submit, echoed in progress reports
+        self.result = None
+        self.cancelled = False          # set when a newer request supersedes this one
+        self.skipped = False            # "ram": same image already running, nothing sent
+        self.done = asyncio.Event()
+    
+    def cancel(self):
+        """Mark the job superseded, a running upload stops at its next section boundary"""
+        self.cancelled = True
+
+
+# Job kinds that supersede queued and running RAM uploads - only the most
+# recent program is sent, a "stop" also drops any RAM run still pending
+SUPERSEDES_RAM_JOBS = ("ram", "stop")
+
+class ProgrammingPipeline:
+    """
+    Jobs for one FXCore run strictly in submission order. Jobs for different
+    chips run side by side, one lane per address, so one chip's sections go
+    out while another waits in a settle, section gap or flash write.
+    """
+    def __init__(self):
+        self.jobs = []
+        self.wakeup = asyncio.Event()
+        self.active = {}    # address -> job currently running for that FXCore
+        self.superseded = 0
+        self.submitted = 0
+    
+    def supersede_ram_jobs(self, address):
+        """Drop queued RAM uploads for address and cancel the one in progress (latest wins)"""
+        kept = []
+        for queued in self.jobs:
+            if queued.kind == "ram" and queued.address == address:
+                queued.cancel()
+                queued.result = False
+                queued.done.set()
+                self.superseded += 1
+                debug_message("Dropped queued RAM upload - superseded")
+            else:
+                kept.append(queued)
+        self.jobs = kept
+        
+        current = self.active.get(address)
+        if current is not None and current.kind == "ram" and not current.cancelled:
+            current.cancel()
+            self.superseded += 1
+    
+    def submit(self, kind, data_source=None, location=None, address=FXCORE_ADDRESS, force=False):
+        """Queue a job and return it, await job.done.wait() for the result"""
+        if kind in SUPERSEDES_RAM_JOBS:
+            self.supersede_ram_jobs(address)
+        job = ProgrammingJob(kind, data_source, location, address, force)
+        self.submitted += 1
+        job.id = self.submitted & 0xFFFF
+        self.jobs.append(job)
+        self.wakeup.set()
+        return job
+    
+    def idle(self, address=None):
+        """True when nothing is queued or running (for address, or for any chip)"""
+        if address is None:
+            return not self.active and not self.jobs
+        if address in self.active:
+            return False
+        for queued in self.jobs:
+            if queued.address == address:
+                return False
+        return True
+    
+    def next_job(self):
+        """Take the oldest queued job whose FXCore has no job running"""
+        for index, job in enumerate(self.jobs):
+            if job.address not in self.active:
+                return self.jobs.pop(index)
+        return None
+    
+    async def run_job(self, job):
+        """Dispatch one job to the matching programming function"""
+        address = job.address
+        if job.kind == "ram":
+            return await execute_unified_programming(job.data_source, "ram", job=job, address=address, force=job.force)
+        elif job.kind == "flash":
+            return await execute_unified_programming(job.data_source, "flash", job.location, address=address)
+        elif job.kind == "enter":
+            return await ensure_prog_mode(address)
+        elif job.kind == "exit":
+            return await ensure_run_mode(address)
+        elif job.kind == "return0":
+            return await leave_ram_execution(address)
+        elif job.kind == "stop":
+            await stop_execution(address)
+            return True
+        elif job.kind == "selftest":
+            return await run_self_test(address)
+        error_message(f"Unknown programming job: {job.kind}")
+        return False
+    
+    async def run_lane(self, job):
+        """Run one job, then let the scheduler start the next one for its FXCore"""
+        # Uploads own their FXCore address until done, pass-through writes wait
+        reserve = job.kind in ("ram", "flash", "selftest")
+        if reserve:
+            bus_for(job.address).reserve(job.address)
+        kind = PROGRESS_JOB_KINDS.get(job.kind, 0)
+        report_progress(PROGRESS_JOB_STARTED, job.address, kind)
+        start_ns = time.monotonic_ns()
+        try:
+            job.result = await self.run_job(job)
+        except Exception as e:
+            error_message(f"Programming job '{job.kind}' failed: {e}")
+            job.result = False
+        finally:
+            if reserve:
+                bus_for(job.address).release(job.address)
+            # Superseded jobs count in pipeline.superseded and skipped ones in
+            # uploads_skipped, neither is a failure nor a timed upload
+            if job.kind in ("ram", "flash") and not job.skipped and not (job.cancelled and not job.result):
+                if not job.result:
+                    perf.upload_failures += 1
+                elif job.kind == "ram":
+                    perf.uploads_ram += 1
+                    perf.phase(PERF_PHASE_RAM_JOB, start_ns)
+                else:
+                    perf.uploads_flash += 1
+                    perf.phase(PERF_PHASE_FLASH_JOB, start_ns)
+            if job.result:
+                result = EXT_OK
+            elif job.cancelled:
+                result = EXT_ERR_SUPERSEDED
+            else:
+                result = EXT_ERR_FAILED
+            report_progress(PROGRESS_JOB_DONE, job.address, kind, result)
+            del self.active[job.address]
+            job.done.set()
+            self.wakeup.set()
+            if gc_scheduler is not None:
+                gc_scheduler.safe_point(GC_PHASE_UPLOAD)
+        
+        if job.kind in ("ram", "flash"):
+            debug_message(f"HID max poll gap during {job.kind} job: {ft260.max_poll_gap_ns / 1000000:.1f} ms")
+            if DEBUG_MODE:
+                for manager in i2c_buses:
+                    manager.log_stats()
+    
+    async def run(self):
+        """Programming task - starts queued jobs, one lane per FXCore"""
+        while True:
+            job = self.next_job()
+            if job is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            
+            if not self.active:
+                ft260.reset_poll_stats()
+            self.active[job.address] = job
+            asyncio.create_task(self.run_lane(job))
+
+# Initialize programming pipeline
+pipeline = ProgrammingPipeline()
+
+
+def i2c_passthrough(address, write_data, read_length):
+    """
+    Raw I2C write, read or write + repeated-start read for the host, same
+    rules as FT260 pass-through. Returns (result, read data), result codes
+    as for the extension commands.
+    """
+    manager = bus_for(address)
+    if write_data and not manager.write_allowed(address):
+        return EXT_ERR_BUSY, b""
+    if write_data and is_fxcore_address(address):
+        # Raw command the firmware doesn't model - the next status read re-derives the state
+        fxcore_targets[address].status_cache.invalidate()
+        fxcore_targets[address].sm.lost("host I2C write")
+    read_data = bytearray(read_length)
+    try:
+        with manager.transaction() as bus:
+            if write_data and read_length:
+                bus.writeto_then_readfrom(address, write_data, read_data)
+            elif write_data:
+                bus.writeto(address, write_data)
+            else:
+                bus.readfrom_into(address, read_data)
+    except OSError:
+        # I2CBusTimeout included
+        return EXT_ERR_I2C, b""
+    return EXT_OK, read_data
+
+# Vendor extension commands - D0 writes to an FXCore address whose first byte
+# is 0xE0-0xEF. The emulator handles them itself, they never reach the chip.
+# A following C2 read of the FXCore address returns the response, see
+# SmartFT260Emulator.ext_response.
+EXT_CMD_FIRST = 0xE0
+EXT_CMD_LAST = 0xEF
+EXT_SECTION_ZRLE = 0xE1     # compressed section transfer
+EXT_RUN_FORCED = 0xE2       # EXEC_FROM_RAM that uploads even an identical image
+EXT_PRESET_RUN = 0xE3       # run an image from the preset cache
+EXT_PRESET_LIST = 0xE4      # list the preset cache
+EXT_PRESET_LIST_MAX = 14    # CRCs per E4 reply, 3 + 14 * 4 bytes fit one C2 report
+EXT_BATCH = 0xE5            # run an I2C op script on the device
+EXT_TRACE_READ = 0xE6       # read span trace events
+TRACE_READ_MAX = 32         # events per E6 reply
+EXT_SELF_TEST = 0xE7        # queue an I2C self-test, results in input report 0xB9
+EXT_CAPTURE = 0xE8          # start/stop traffic capture, read the records
+EXT_CAPTURE_STOP = 0x00
+EXT_CAPTURE_START = 0x01
+EXT_CAPTURE_READ = 0x02
+CAPTURE_READ_MAX = 55       # bytes per E8 read reply, 60 with the header - one C2 read
+
+EXT_OK = 0x00
+EXT_ERR_CRC = 0x01          # expanded data doesn't match the CRC
+EXT_ERR_LENGTH = 0x02       # expanded length differs from the header
+EXT_ERR_PARAM = 0x03        # bad section or header
+EXT_ERR_NOT_CACHED = 0x04   # no preset with that CRC
+EXT_ERR_FAILED = 0x05       # programming job failed or was superseded
+EXT_ERR_BUSY = 0x06         # address reserved by a running upload
+EXT_ERR_I2C = 0x07          # I2C transfer failed
+EXT_ERR_COMMAND = 0x08      # unknown CDC command
+EXT_ERR_SEQUENCE = 0x09     # MIDI data message out of order, resend from the acked seq
+EXT_ERR_TIMEOUT = 0x0A      # batch poll didn't match in time
+EXT_ERR_SUPERSEDED = 0x0B   # job cancelled by a newer request
+
+EXT_STREAM_TIMEOUT = 1.0    # seconds without data before a partial E1 section or E5 script is dropped
+EXT_READ_MAX = 60           # reply bytes per C2 read, longer replies take several reads
+
+# Compressed sections, keyed by the XFER command's first byte: name, expanded size
+ZRLE_SECTIONS = {0x01: ("CREG", 66), 0x02: ("SFR", 50), 0x04: ("MREG", 514), 0x08: ("PROGRAM", None)}
+ZRLE_ZEROS = bytes(64)
+
+def section_size_valid(expanded_size, size):
+    """Check a section length against its ZRLE_SECTIONS size (None = program)"""
+    if size is None:
+        # Program: 1-1024 instructions plus checksum
+        return expanded_size >= 6 and expanded_size <= 4098 and (expanded_size - 2) % 4 == 0
+    return expanded_size == size
+
+class ZeroRunDecoder:
+    """
+    Streaming decoder for compressed section uploads. Control bytes:
+      0x00-0x7F  literal, the next (c + 1) bytes are copied
+      0x80-0xBF  (c - 0x80 + 1) zero bytes
+      0xC0-0xFF  the next byte repeated (c - 0xC0 + 1) times
+    Tokens may be split across reports, output goes straight into the
+    emulator's section buffer.
+    """
+    def __init__(self, name, out, expanded_size, crc, compressed_size):
+        self.name = name
+        self.out = out
+        self.expanded_size = expanded_size
+        self.crc = crc
+        self.remaining = compressed_size
+        self.literal = 0
+        self.repeat = 0
+        self.overflow = False
+    
+    def feed(self, data):
+        """Decode the next piece of the stream, returns the bytes consumed"""
+        out = self.out
+        count = min(len(data), self.remaining)
+        self.remaining -= count
+        if self.overflow:
+            # The stream expands past the section, the rest of it is dropped
+            return count
+        space = self.expanded_size - len(out)
+        i = 0
+        while i < count:
+            if self.literal:
+                take = min(self.literal, count - i)
+                if take > space:
+                    self.overflow = True
+                    break
+                out.extend(data[i:i + take])
+                space -= take
+                self.literal -= take
+                i += take
+                continue
+            c = data[i]
+            i += 1
+            if self.repeat:
+                if self.repeat > space:
+                    self.overflow = True
+                    break
+                for _ in range(self.repeat):
+                    out.append(c)
+                space -= self.repeat
+                self.repeat = 0
+            elif c < 0x80:
+                self.literal = c + 1
+            elif c < 0xC0:
+                if c - 0x7F > space:
+                    self.overflow = True
+                    break
+                out.extend(ZRLE_ZEROS[:c - 0x7F])
+                space -= c - 0x7F
+            else:
+                self.repeat = c - 0xBF
+        return count
+    
+    def done(self):
+        return self.remaining <= 0
+    
+    def result(self):
+        """EXT_OK or the error code once the whole stream was fed"""
+        if self.overflow or self.literal or self.repeat or len(self.out) != self.expanded_size:
+            return EXT_ERR_LENGTH
+        if crc32(self.out) & 0xFFFFFFFF != self.crc:
+            return EXT_ERR_CRC
+        return EXT_OK
+
+
 # Smart FT260 Emulator Class - Fixed command parsing
 # we accept HID reports 0xA1, 0xC0, 0xC2, 0xD0
 class SmartFT260Emulator:
@@ -825,73 +2136,148 @@ class SmartFT260Emulator:
         # State tracking
         self.i2c_status = 0x20  # I2C idle status
         self.active = False
+        self.batch = None       # BatchScript once a host sent E5, see start_batch()
         
         # Programming data buffers
         self.reset_programming_state()
         
         # Programming state
         self.in_programming_mode = False
+        self.target_address = FXCORE_ADDRESS  # FXCore the host is programming
+        self.decoder = None         # ZeroRunDecoder while a compressed section streams in
+        self.stream_ns = 0          # last report of a compressed section or batch script
+        self.ext_response = None    # reply to the last extension command, read with C2
+        self.progress_report = bytearray(PROGRESS_REPORT_SIZE)
+        self.last_report_ns = 0     # when the host last sent a report, see host_listening()
+        self.push_stalled = False   # a pushed report failed or blocked
+        self.read_report = bytearray(63)    # C2 input report, reused for every read
         self.expecting_data = None  # What type of data we're expecting next
         self.data_remaining = 0     # How many bytes remaining for current transfer
+        
+        # Report latency tracking - longest gap between two polls of the HID device
+        self.last_poll_ns = time.monotonic_ns()
+        self.max_poll_gap_ns = 0
+    
+    def reset_poll_stats(self):
+        """Restart the max poll gap measurement"""
+        self.last_poll_ns = time.monotonic_ns()
+        self.max_poll_gap_ns = 0
     
     # Use same buffers for both modes
     def reset_programming_state(self):
         """Reset all programming data buffers - reuse existing buffers"""
-        # Instead of creating new bytearrays, clear existing ones
+        # Instead of creating new bytearrays, clear existing ones. They are
+        # allocated once with room for the largest section, so collecting a
+        # section never grows them
         if hasattr(self, 'mreg_data'):
-            self.mreg_data[:] = bytearray()  # Clear in place
+            self.mreg_data[:] = b""  # Clear in place
+            self.creg_data[:] = b""
+            self.sfr_data[:] = b""
+            self.program_data[:] = b""
         else:
-            self.mreg_data = bytearray()
+            self.mreg_data = buffer_mgr.reserved(514)
+            self.creg_data = buffer_mgr.reserved(66)
+            self.sfr_data = buffer_mgr.reserved(52)
+            self.program_data = buffer_mgr.reserved(4098)
         
-        if hasattr(self, 'creg_data'):
-            self.creg_data[:] = bytearray()
-        else:
-            self.creg_data = bytearray()
-        
-        if hasattr(self, 'sfr_data'):
-            self.sfr_data[:] = bytearray()
-        else:
-            self.sfr_data = bytearray()
-        
-        if hasattr(self, 'program_data'):
-            self.program_data[:] = bytearray()
-        else:
-            self.program_data = bytearray()
-            
         self.expecting_data = None
         self.data_remaining = 0
+        self.decoder = None
+        if self.batch is not None:
+            self.batch.script = None
+            self.batch.remaining = 0
         debug_message("FT260: Programming state reset")
-
+    
     
     def get_last_received_report(self):
         """Get the last received report from host"""
         if not self.enabled:
             return None, None
-            
+        
         try:
             # Try each report type individually
-            for report_id in [0xA1, 0xC0, 0xC2, 0xD0]:
+            for report_id in [0xA1, 0xC0, 0xC2, 0xD0, PERF_REPORT_ID]:
                 data = self.hid_device.get_last_received_report(report_id)
                 if data:
-                    return report_id, list(data)
+                    return report_id, data
             return None, None
         except Exception as e:
             return None, None
     
+    def handle_perf_request(self, data):
+        """SET_FEATURE 0x01 [cmd, page] - reset and/or publish a counters page for GET_FEATURE 0x01"""
+        command = data[0] if len(data) > 0 else PERF_CMD_SNAPSHOT
+        page = data[1] if len(data) > 1 else PERF_PAGE_COUNTERS
+        if command == PERF_CMD_RESET:
+            perf.reset()
+            debug_message("FT260: Performance counters reset")
+        try:
+            # GET_FEATURE returns the last report sent with this ID
+            self.hid_device.send_report(perf.snapshot(page), PERF_REPORT_ID)
+        except Exception as e:
+            debug_message(f"FT260: Counters report not sent: {e}")
+    
+    def send_progress(self, event, result, address, detail, job_id):
+        """Send a progress input report, see report_progress()"""
+        report = self.progress_report
+        now_ms = (time.monotonic_ns() // 1000000) & 0xFFFFFFFF
+        status = fxcore_targets[address].status_cache
+        report[0] = event
+        report[1] = result
+        report[2] = address
+        report[3] = detail
+        report[4:8] = now_ms.to_bytes(4, 'little')
+        report[8] = job_id & 0xFF
+        report[9] = job_id >> 8
+        report[10] = status.status.command_status if status.valid else 0
+        self.push_report(report, PROGRESS_REPORT_ID)
+    
+    def host_listening(self):
+        """True while a host sent a report lately and the last push didn't stall"""
+        return (not self.push_stalled and
+                time.monotonic_ns() - self.last_report_ns < PUSH_HOST_WINDOW * 1000000000)
+    
+    def push_report(self, report, report_id):
+        """
+        Send an input report the host didn't ask for, skipped while the host
+        isn't listening. A send that fails or blocks longer than PUSH_SEND_SLOW
+        stops further pushes until the host sends its next report.
+        """
+        if not self.host_listening():
+            return False
+        if capture is not None and capture.enabled:
+            capture.report(traffic_capture.CAPTURE_REPORT_OUT, report_id, report)
+        start_ns = time.monotonic_ns()
+        try:
+            self.hid_device.send_report(report, report_id)
+        except Exception as e:
+            debug_message(f"FT260: Report 0x{report_id:02X} not sent: {e}")
+            self.push_stalled = True
+            return False
+        if time.monotonic_ns() - start_ns > PUSH_SEND_SLOW * 1000000000:
+            debug_message(f"FT260: Report 0x{report_id:02X} was slow to go out, pushes paused")
+            self.push_stalled = True
+        return True
+    
     def send_input_report(self, report_id, data):
         """Send an input report back to the host"""
         if not self.enabled:
             return False
-            
+        
         try:
-            report_data = bytearray(63)
-            if data:
-                copy_len = min(len(data), 63)
-                report_data[:copy_len] = data[:copy_len]
+            if data is not None and len(data) == 63:
+                report_data = data
+            else:
+                report_data = bytearray(63)
+                if data:
+                    copy_len = min(len(data), 63)
+                    report_data[:copy_len] = data[:copy_len]
             
+            if capture is not None and capture.enabled:
+                capture.report(traffic_capture.CAPTURE_REPORT_OUT, report_id, report_data)
             self.hid_device.send_report(report_data, report_id)
             return True
-            
+        
         except Exception as e:
             error_message(f"FT260: Error sending input report 0x{report_id:02X}: {e}")
             return False
@@ -900,44 +2286,56 @@ class SmartFT260Emulator:
         """Handle Output Report 0xC2 - I2C Read request (pass through normally)"""
         if len(data) < 4:
             return
-            
+        
         i2c_addr = data[0]
         bytes_to_read = data[2] | (data[3] << 8)
         
-        debug_message(f"FT260: I2C Read: 0x{i2c_addr:02X}, {bytes_to_read} bytes")
+        if REPORT_DEBUG:
+            debug_message(f"FT260: I2C Read: 0x{i2c_addr:02X}, {bytes_to_read} bytes")
+        
+        if is_fxcore_address(i2c_addr) and self.batch is not None and self.batch.running:
+            # Answered by BatchScript.run() when the script is done
+            self.batch.reads.append(bytes(data))
+            return
         
         # Perform actual I2C read
         read_data = None
-        if bytes_to_read > 0:
+        if is_fxcore_address(i2c_addr) and self.ext_response is not None:
+            # Reply to an extension command, returned once - a longer reply
+            # continues in the next reads
+            read_data = self.ext_response[:min(bytes_to_read, EXT_READ_MAX)]
+            self.ext_response = self.ext_response[len(read_data):] or None
+            self.i2c_status = 0x20
+        elif is_fxcore_address(i2c_addr) and 0 < bytes_to_read <= 12:
+            # FXCore status poll - answered from the status cache while fresh
+            cache = fxcore_targets[i2c_addr].status_cache
+            cache.last_host_poll_ns = time.monotonic_ns()
+            status = cache.get()
+            if status:
+                read_data = status.buffer
+                self.i2c_status = 0x20  # Success
+            else:
+                self.i2c_status = 0x26  # Error: device not responding
+        elif bytes_to_read > 0:
             try:
-                while not i2c.try_lock():
-                    time.sleep(0.001)
-                
-                try:
-                    read_buffer = bytearray(bytes_to_read)
-                    i2c.readfrom_into(i2c_addr, read_buffer)
-                    read_data = read_buffer
-                    self.i2c_status = 0x20  # Success
-                    
-                except OSError:
-                    self.i2c_status = 0x26  # Error: device not responding
-                    read_data = None
-                finally:
-                    i2c.unlock()
-                    
+                read_buffer = buffer_mgr.get_temp_buffer(bytes_to_read)
+                with bus_for(i2c_addr).transaction() as bus:
+                    bus.readfrom_into(i2c_addr, read_buffer)
+                read_data = read_buffer
+                self.i2c_status = 0x20  # Success
+            
             except Exception:
-                self.i2c_status = 0x26
+                self.i2c_status = 0x26  # Error: device not responding or bus stuck
                 read_data = None
-                try:
-                    i2c.unlock()
-                except:
-                    pass
         
         # Create response in FT260 format
-        response_data = bytearray(63)
+        response_data = self.read_report
+        for i in range(len(response_data)):
+            response_data[i] = 0
         
         if read_data is not None:
             response_data[0] = min(bytes_to_read, len(read_data))  # Byte count
+            perf.bytes_to_host += response_data[0]
             for i in range(min(bytes_to_read, len(read_data))):
                 response_data[1 + i] = read_data[i]
             debug_message("FT260: ✓ Read successful")
@@ -949,6 +2347,29 @@ class SmartFT260Emulator:
     
     def handle_programming_command(self, write_data, i2c_flag):
         """Handle FXCore programming commands - parse the I2C write data properly"""
+        # A compressed section or a batch script takes every report until it
+        # is complete, its length is known so no flag guessing is needed
+        batch_streaming = self.batch is not None and self.batch.remaining
+        if batch_streaming or self.decoder is not None:
+            if self.stream_abandoned(write_data, i2c_flag):
+                self.drop_stream()
+                if not i2c_flag & 0x02:
+                    return True     # late rest of the dropped stream, never forward it to the chip
+            elif batch_streaming:
+                self.stream_ns = time.monotonic_ns()
+                self.batch.feed(write_data)
+                return True
+            else:
+                self.stream_ns = time.monotonic_ns()
+                self.feed_compressed(write_data)
+                return True
+        
+        # Vendor extension commands, only between sections: section data
+        # (a short SFR or program section comes as one START + STOP report)
+        # may start with any byte
+        if not self.expecting_data and len(write_data) >= 2 and EXT_CMD_FIRST <= write_data[0] <= EXT_CMD_LAST:
+            return self.handle_extension_command(write_data)
+        
         # If we're currently expecting data, check the flag to see if this is data or a new command
         if self.expecting_data:
             # Flag 0x06 = START + STOP (command packet)
@@ -986,39 +2407,42 @@ class SmartFT260Emulator:
                     
                     if not is_valid_command:
                         # This has flag 0x06 but doesn't look like a command, treat as data
-                        debug_message(f"FT260: Data for {self.expecting_data} (flag 0x{i2c_flag:02X}): {len(write_data)} bytes")
+                        if REPORT_DEBUG:
+                            debug_message(f"FT260: Data for {self.expecting_data} (flag 0x{i2c_flag:02X}): {len(write_data)} bytes")
                         self.handle_programming_data(write_data)
                         return True
                 # Continue to command parsing below
             else:
                 # This is data continuation (not a command)
-                debug_message(f"FT260: Data continuation for {self.expecting_data} (flag 0x{i2c_flag:02X}): {len(write_data)} bytes")
+                if REPORT_DEBUG:
+                    debug_message(f"FT260: Data continuation for {self.expecting_data} (flag 0x{i2c_flag:02X}): {len(write_data)} bytes")
                 self.handle_programming_data(write_data)
                 return True
         
         if len(write_data) < 2:
             return False
-            
+        
         cmd_high = write_data[0]
         cmd_low = write_data[1]
         payload_data = write_data[2:] if len(write_data) > 2 else bytearray()
         
         cmd = (cmd_high << 8) | cmd_low
-        debug_message(f"FT260: Command 0x{cmd_high:02X} 0x{cmd_low:02X} (0x{cmd:04X}) with {len(payload_data)} payload bytes")
+        if REPORT_DEBUG:
+            debug_message(f"FT260: Command 0x{cmd_high:02X} 0x{cmd_low:02X} (0x{cmd:04X}) with {len(payload_data)} payload bytes")
         
         # Enter programming mode
         if cmd_high == 0xA5 and cmd_low == 0x5A:
             debug_message("FT260: ENTER_PRG command detected")
             self.in_programming_mode = True
             self.reset_programming_state()
-            enter_prog_mode()  # Actually execute the command
+            pipeline.submit("enter", address=self.target_address)  # Actually execute the command
             return True
         
         # Exit programming mode
         elif cmd_high == 0x5A and cmd_low == 0xA5:
             debug_message("FT260: EXIT_PRG command detected")
             self.in_programming_mode = False
-            exit_prog_mode()  # Actually execute the command
+            pipeline.submit("exit", address=self.target_address)  # Actually execute the command
             return True
         
         # MREG transfer - correct command is 0x04 0x7F (128 registers, 0x7F = 127 but 0-indexed)
@@ -1080,11 +2504,205 @@ class SmartFT260Emulator:
         # Return to STATE0
         elif cmd_high == 0x0E and cmd_low == 0x00:
             debug_message("FT260: RETURN_0 command detected")
-            send_return_0()  # Actually execute the command
+            pipeline.submit("return0", address=self.target_address)  # Actually execute the command
             return True
         
         return False  # Not a recognized command
     
+    def handle_extension_command(self, write_data):
+        """Handle a vendor extension command (0xE0-0xEF), never forwarded to the FXCore"""
+        cmd = write_data[0]
+        if cmd == EXT_SECTION_ZRLE:
+            return self.start_compressed_section(write_data)
+        if cmd == EXT_RUN_FORCED:
+            debug_message("FT260: Forced EXEC_FROM_RAM")
+            self.execute_programming(force=True)
+            self.ext_response = bytearray([cmd, EXT_OK])
+            return True
+        if cmd == EXT_PRESET_RUN:
+            return self.run_preset(write_data)
+        if cmd == EXT_BATCH:
+            return self.start_batch(write_data)
+        if cmd == EXT_SELF_TEST:
+            # E7 00 - reply E7 00 job id[2], the results follow as report 0xB9
+            job = pipeline.submit("selftest", address=self.target_address)
+            self.ext_response = bytearray([cmd, EXT_OK, job.id & 0xFF, job.id >> 8])
+            return True
+        if cmd == EXT_CAPTURE:
+            return self.capture_command(write_data)
+        if cmd == EXT_TRACE_READ:
+            # E6 ss ss nn - nn events from index ss (oldest first), reply E6 00 held[2] n events
+            if len(write_data) < 4:
+                self.ext_response = bytearray([cmd, EXT_ERR_PARAM])
+                return True
+            if trace is None:
+                # Tracing off - nothing held
+                self.ext_response = bytearray([cmd, EXT_OK, 0, 0, 0])
+                return True
+            events = trace.events(write_data[1] | (write_data[2] << 8), min(write_data[3], TRACE_READ_MAX))
+            response = bytearray([cmd, EXT_OK, trace.count & 0xFF, trace.count >> 8,
+                                  len(events) // span_trace.TRACE_RECORD_SIZE])
+            response.extend(events)
+            self.ext_response = response
+            return True
+        if cmd == EXT_PRESET_LIST:
+            # E4 ii - CRCs from index ii on, most recently used first
+            crcs = preset_cache.crcs() if preset_cache is not None else []
+            response = bytearray([cmd, EXT_OK, len(crcs)])
+            for crc in crcs[write_data[1]:write_data[1] + EXT_PRESET_LIST_MAX]:
+                response.extend(crc.to_bytes(4, 'little'))
+            self.ext_response = response
+            return True
+        debug_message(f"FT260: Unknown extension command 0x{cmd:02X}")
+        self.ext_response = bytearray([cmd, EXT_ERR_PARAM])
+        return True
+    
+    def capture_command(self, write_data):
+        """
+        E8 00 stop, E8 01 start (clears the ring) - reply E8 00 length[2]
+        records[2] dropped[2]. E8 02 oo oo nn - nn bytes of the records from
+        offset oo, reply E8 00 length[2] n data. Stop before reading, or the
+        reads themselves are captured and old records drop out underneath.
+        """
+        cmd = write_data[0]
+        op = write_data[1] if len(write_data) > 1 else -1
+        if op == EXT_CAPTURE_STOP or op == EXT_CAPTURE_START:
+            if op == EXT_CAPTURE_START:
+                start_capture()
+            elif capture is not None:
+                capture.stop()
+            length = records = dropped = 0      # never started
+            if capture is not None:
+                length = capture.length()
+                records = capture.records
+                dropped = min(capture.dropped, 0xFFFF)
+            self.ext_response = bytearray([cmd, EXT_OK, length & 0xFF, length >> 8,
+                                           records & 0xFF, records >> 8, dropped & 0xFF, dropped >> 8])
+            return True
+        if op == EXT_CAPTURE_READ and len(write_data) >= 5:
+            data = b""
+            length = 0
+            if capture is not None:
+                data = capture.read(write_data[2] | (write_data[3] << 8), min(write_data[4], CAPTURE_READ_MAX))
+                length = capture.length()
+            response = bytearray([cmd, EXT_OK, length & 0xFF, length >> 8, len(data)])
+            response.extend(data)
+            self.ext_response = response
+            return True
+        self.ext_response = bytearray([cmd, EXT_ERR_PARAM])
+        return True
+    
+    def run_preset(self, write_data):
+        """E3 CC CC CC CC [ff] - run the cached image with CRC CC (little-endian), ff bit 0 = force"""
+        if len(write_data) < 5:
+            self.ext_response = bytearray([EXT_PRESET_RUN, EXT_ERR_PARAM])
+            return True
+        crc = write_data[1] | (write_data[2] << 8) | (write_data[3] << 16) | (write_data[4] << 24)
+        force = len(write_data) > 5 and (write_data[5] & 0x01) != 0
+        image = preset_image(crc)
+        if image is None:
+            debug_message(f"FT260: Preset 0x{crc:08X} not cached")
+            self.ext_response = bytearray([EXT_PRESET_RUN, EXT_ERR_NOT_CACHED])
+            return True
+        debug_message(f"FT260: Running preset 0x{crc:08X}")
+        pipeline.submit("ram", image, address=self.target_address, force=force)
+        self.ext_response = bytearray([EXT_PRESET_RUN, EXT_OK])
+        return True
+    
+    def stream_abandoned(self, write_data, i2c_flag):
+        """
+        True when the host gave up on a compressed section or batch script:
+        nothing arrived for EXT_STREAM_TIMEOUT, or a new ENTER_PRG came as its
+        own report. Stream bytes that look like ENTER_PRG only count as the
+        command when they are not exactly the rest of the stream.
+        """
+        if time.monotonic_ns() - self.stream_ns > EXT_STREAM_TIMEOUT * 1000000000:
+            error_message("FT260: Stream stalled, dropped")
+            return True
+        remaining = self.decoder.remaining if self.decoder is not None else self.batch.remaining
+        if (i2c_flag == 0x06 and 2 <= len(write_data) <= 3 and write_data[0] == 0xA5 and write_data[1] == 0x5A
+                and len(write_data) != remaining):
+            error_message("FT260: ENTER_PRG during a stream, stream dropped")
+            return True
+        return False
+    
+    def drop_stream(self):
+        """Forget a partial compressed section or batch script, the C2 reply says it failed"""
+        if self.batch is not None and self.batch.remaining:
+            self.batch.drop()
+        if self.decoder is not None:
+            debug_message(f"FT260: Compressed {self.decoder.name} dropped, {self.decoder.remaining} bytes missing")
+            self.decoder.out[:] = b""
+            self.decoder = None
+            self.ext_response = bytearray([EXT_SECTION_ZRLE, EXT_ERR_LENGTH])
+    
+    def start_batch(self, write_data):
+        """E5 - I2C batch script, batch_script.py is imported for the first one"""
+        if self.batch is None:
+            from batch_script import BatchScript
+            self.batch = BatchScript(firmware, self)
+        self.batch.start(write_data)
+        return True
+    
+    def section_buffer(self, name):
+        """Emulator buffer for a section name"""
+        if name == "MREG":
+            return self.mreg_data
+        if name == "CREG":
+            return self.creg_data
+        if name == "SFR":
+            return self.sfr_data
+        return self.program_data
+    
+    def start_compressed_section(self, write_data):
+        """
+        E1 ss LL LL CC CC CC CC NN NN [stream...] - compressed section transfer.
+        ss = XFER command byte of the section (01 CREG, 02 SFR, 04 MREG, 08 PRG),
+        LL = expanded size, CC = CRC-32 of the expanded data, NN = stream size,
+        all little-endian. The stream follows in this and the next D0 reports.
+        """
+        self.expecting_data = None
+        self.data_remaining = 0
+        section = ZRLE_SECTIONS.get(write_data[1]) if len(write_data) >= 10 else None
+        if section is None:
+            debug_message("FT260: Bad compressed section header")
+            self.ext_response = bytearray([EXT_SECTION_ZRLE, EXT_ERR_PARAM])
+            return True
+        
+        name, size = section
+        expanded_size = write_data[2] | (write_data[3] << 8)
+        crc = write_data[4] | (write_data[5] << 8) | (write_data[6] << 16) | (write_data[7] << 24)
+        compressed_size = write_data[8] | (write_data[9] << 8)
+        if not section_size_valid(expanded_size, size) or compressed_size == 0:
+            debug_message(f"FT260: Bad compressed {name} size {expanded_size}/{compressed_size}")
+            self.ext_response = bytearray([EXT_SECTION_ZRLE, EXT_ERR_PARAM])
+            return True
+        
+        buffer = self.section_buffer(name)
+        buffer[:] = b""
+        self.decoder = ZeroRunDecoder(name, buffer, expanded_size, crc, compressed_size)
+        self.stream_ns = time.monotonic_ns()
+        debug_message(f"FT260: Compressed {name}: {compressed_size} -> {expanded_size} bytes")
+        if len(write_data) > 10:
+            self.feed_compressed(write_data[10:])
+        return True
+    
+    def feed_compressed(self, data):
+        """Pass stream bytes to the decoder, check the section when it is complete"""
+        decoder = self.decoder
+        decoder.feed(data)
+        if not decoder.done():
+            return
+        result = decoder.result()
+        self.decoder = None
+        if result != EXT_OK:
+            # Never hand a corrupt section to the programming job
+            decoder.out[:] = b""
+            error_message(f"FT260: Compressed {decoder.name} rejected (error {result})")
+        else:
+            debug_message(f"FT260: {decoder.name} data complete ({len(decoder.out)} total bytes, CRC ok)")
+        self.ext_response = bytearray([EXT_SECTION_ZRLE, result])
+    
     def handle_programming_data(self, data):
         """Handle programming data based on what we're expecting"""
         if not self.expecting_data:
@@ -1093,76 +2711,61 @@ class SmartFT260Emulator:
         
         bytes_to_take = min(len(data), self.data_remaining)
         
-        if self.expecting_data == "MREG":
-            self.mreg_data.extend(data[:bytes_to_take])
-            debug_message(f"FT260: Added {bytes_to_take} bytes to MREG buffer (total: {len(self.mreg_data)})")
-        
-        elif self.expecting_data == "CREG":
-            self.creg_data.extend(data[:bytes_to_take])
-            debug_message(f"FT260: Added {bytes_to_take} bytes to CREG buffer (total: {len(self.creg_data)})")
-        
-        elif self.expecting_data == "SFR":
-            self.sfr_data.extend(data[:bytes_to_take])
-            debug_message(f"FT260: Added {bytes_to_take} bytes to SFR buffer (total: {len(self.sfr_data)})")
-        
-        elif self.expecting_data == "PROGRAM":
-            self.program_data.extend(data[:bytes_to_take])
-            debug_message(f"FT260: Added {bytes_to_take} bytes to PROGRAM buffer (total: {len(self.program_data)})")
+        # Whole reports are appended without slicing a copy first
+        buffer = self.section_buffer(self.expecting_data)
+        buffer.extend(data if bytes_to_take == len(data) else data[:bytes_to_take])
+        if REPORT_DEBUG:
+            debug_message(f"FT260: Added {bytes_to_take} bytes to {self.expecting_data} buffer (total: {len(buffer)})")
         
         self.data_remaining -= bytes_to_take
         
         if self.data_remaining <= 0:
-            if self.expecting_data == "MREG":
-                total = len(self.mreg_data)
-            elif self.expecting_data == "CREG":
-                total = len(self.creg_data)
-            elif self.expecting_data == "SFR":
-                total = len(self.sfr_data)
-            elif self.expecting_data == "PROGRAM":
-                total = len(self.program_data)
-            else:
-                total = 0
-            debug_message(f"FT260: {self.expecting_data} data complete ({total} total bytes)")
+            debug_message(f"FT260: {self.expecting_data} data complete ({len(buffer)} total bytes)")
             self.expecting_data = None
             self.data_remaining = 0
     
-    def execute_programming(self):
-        """Execute the collected programming data (RAM execution) - use unified function"""
+    def execute_programming(self, force=False):
+        """Queue the collected programming data for RAM execution - use unified function"""
         debug_message("FT260: Starting programming execution...")
         debug_message(f"Data collected - MREG: {len(self.mreg_data)}, CREG: {len(self.creg_data)}, SFR: {len(self.sfr_data)}, Program: {len(self.program_data)} bytes")
         
         # Prepare data for unified function
         unified_data = prepare_ft260_data_for_unified(self)
         
-        # Use unified programming function
-        return execute_unified_programming(unified_data, "ram")
+        # Run through the programming pipeline so HID keeps being serviced
+        return pipeline.submit("ram", unified_data, address=self.target_address, force=force)
     
     def execute_programming_to_flash(self, location):
-        """Execute the collected programming data (Flash programming) - use unified function"""
+        """Queue the collected programming data for flash programming - use unified function"""
         debug_message(f"FT260: Starting flash programming to location {location:X}...")
         debug_message(f"Data collected - MREG: {len(self.mreg_data)}, CREG: {len(self.creg_data)}, SFR: {len(self.sfr_data)}, Program: {len(self.program_data)} bytes")
         
         # Prepare data for unified function
         unified_data = prepare_ft260_data_for_unified(self)
         
-        # Use unified programming function
-        return execute_unified_programming(unified_data, "flash", location)
+        # Run through the programming pipeline so HID keeps being serviced
+        return pipeline.submit("flash", unified_data, location, self.target_address)
     
     def handle_output_report_d0(self, data):
         """Handle Output Report 0xD0 - Intercept ALL D0 reports for smart programming"""
         if len(data) < 4:
             return
-            
+        
         i2c_addr = data[0]
         i2c_flag = data[1]  # I2C flags (not used currently but good to track)
         byte_count = data[2]  # Exact number of I2C payload bytes
         write_data = data[3:3+byte_count]  # Extract exactly the right amount of data
+        perf.bytes_from_host += byte_count
         
-        if DEBUG_MODE:
+        if REPORT_DEBUG:
             debug_message(f"FT260: D0 Report - I2C addr 0x{i2c_addr:02X}, flag 0x{i2c_flag:02X}, {byte_count} bytes")
         
-        # Check if this is targeting the FXCore
-        if i2c_addr == FXCORE_ADDRESS:
+        # Check if this is targeting one of the FXCores
+        if is_fxcore_address(i2c_addr):
+            if i2c_addr != self.target_address:
+                # Host moved on to another chip, earlier data was already queued
+                self.reset_programming_state()
+                self.target_address = i2c_addr
             # Try to handle as programming command/data
             if self.handle_programming_command(write_data, i2c_flag):
                 # Successfully handled as programming command
@@ -1170,46 +2773,58 @@ class SmartFT260Emulator:
                 return
         
         # If not FXCore or not a programming command, pass through normally
-        if DEBUG_MODE:
+        if REPORT_DEBUG:
             data_preview = ' '.join([f'0x{byte_val:02X}' for byte_val in write_data[:min(8, len(write_data))]])
             debug_message(f"FT260: Pass-through I2C Write: 0x{i2c_addr:02X}, {byte_count} bytes - Data: {data_preview}{'...' if len(write_data) > 8 else ''}")
         
+        if not bus_for(i2c_addr).write_allowed(i2c_addr):
+            # A programming job owns this address - report bus busy, host retries
+            self.i2c_status = 0x42
+            debug_message(f"FT260: ✗ Pass-through write to 0x{i2c_addr:02X} refused, upload in progress")
+            return
+        
+        if is_fxcore_address(i2c_addr):
+            # Raw command the emulator doesn't model - the next status read re-derives the state
+            fxcore_targets[i2c_addr].status_cache.invalidate()
+            fxcore_targets[i2c_addr].sm.lost("pass-through write")
+        
         try:
-            while not i2c.try_lock():
-                time.sleep(0.001)
-            
-            try:
-                i2c.writeto(i2c_addr, bytes(write_data))
-                self.i2c_status = 0x20  # Success
-                debug_message("FT260: ✓ Pass-through write successful")
-                
-            except OSError:
-                self.i2c_status = 0x26  # Error
-                debug_message("FT260: ✗ Pass-through write failed")
-            finally:
-                i2c.unlock()
-                
-        except Exception:
+            with bus_for(i2c_addr).transaction() as bus:
+                bus.writeto(i2c_addr, write_data)
+            self.i2c_status = 0x20  # Success
+            debug_message("FT260: ✓ Pass-through write successful")
+        
+        except I2CBusTimeout:
             self.i2c_status = 0x26
-            debug_message("FT260: ✗ Pass-through write error")
-            try:
-                i2c.unlock()
-            except:
-                pass
+            error_message("FT260: ✗ Pass-through write error, I2C bus lock timed out")
+        except OSError:
+            self.i2c_status = 0x26  # Error
+            debug_message("FT260: ✗ Pass-through write failed")
     
     def process_reports(self):
         """Process incoming HID reports"""
         if not self.enabled:
             return False
-            
+        
+        now = time.monotonic_ns()
+        gap = now - self.last_poll_ns
+        if gap > self.max_poll_gap_ns:
+            self.max_poll_gap_ns = gap
+        self.last_poll_ns = now
+        
         try:
             report_id, data = self.get_last_received_report()
             if report_id is not None:
-                blink_status_led(YELLOW, 1, 0.005)
+                perf.reports_received += 1
+                if capture is not None and capture.enabled:
+                    capture.report(traffic_capture.CAPTURE_REPORT_IN, report_id, data)
+                flash_status_led(YELLOW, 0.005)
                 
                 if not self.active:
                     debug_message("FT260: Smart bridge mode activated")
                     self.active = True
+                self.last_report_ns = now
+                self.push_stalled = False
                 
                 # Route to appropriate handler
                 if report_id == 0xA1:
@@ -1225,132 +2840,287 @@ class SmartFT260Emulator:
                 elif report_id == 0xD0:
                     # D0 reports are I2C writes - intercept ALL of them
                     self.handle_output_report_d0(data)
+                elif report_id == PERF_REPORT_ID:
+                    self.handle_perf_request(data)
                 
+                elapsed = (time.monotonic_ns() - now) // 1000
+                if elapsed > perf.report_max_us:
+                    perf.report_max_us = elapsed
+                if gc_scheduler is not None:
+                    gc_scheduler.report_handled()
                 return True  # Processed a report
-                
+        
         except Exception as e:
+            perf.reports_dropped += 1
             error_message(f"FT260: Error processing reports: {e}")
         
         return False  # No report processed
-        
+
 # Initialize FT260 Emulator
 ft260 = SmartFT260Emulator()
 
-def stop_execution():
+
+# Binary programming transport on the USB CDC data channel, cdc_transport.py
+cdc = None
+if usb_cdc is not None and usb_cdc.data is not None:
+    from cdc_transport import CDCTransport
+    cdc = CDCTransport(usb_cdc.data, firmware)
+    log_message("✓ CDC data channel transport ready")
+
+
+# SysEx upload transport on the USB MIDI ports, midi_transport.py
+midi = None
+if usb_midi is not None and usb_midi.ports:
+    import midi_transport
+    midi = midi_transport.open_transport(usb_midi, firmware)
+    if midi is not None:
+        log_message("✓ MIDI SysEx transport ready")
+
+boot_mark("HID init")
+
+async def stop_execution(address=FXCORE_ADDRESS):
     """Stop program execution and return to normal operation"""
     debug_message("Stopping program execution...")
     
-    # Send RETURN_0 to stop execution
-    send_return_0()
-    time.sleep(0.1)
+    # Send RETURN_0 to stop execution (skipped unless running from RAM)
+    await leave_ram_execution(address)
     
-    # Exit programming mode, also clears running flag
-    exit_prog_mode()
+    # Exit programming mode, also clears running flag (skipped when in RUN)
+    await ensure_run_mode(address)
     
-    # Turn off LED
-    set_status_led(OFF)
+    # Turn off LED unless another FXCore still runs from RAM
+    if not running:
+        set_status_led(OFF)
     
     debug_message("Program stopped and returned to normal operation")
 
-def main():
+async def hid_task():
+    """HID ingestion - poll the FT260 reports, never blocked by programming"""
+    last_report = time.monotonic()
+    while True:
+        try:
+            # High-frequency FT260 processing
+            ft260_processed = ft260.process_reports()
+            
+            # Yield straight back after a report, sleep a little when idle
+            if ft260_processed:
+                last_report = time.monotonic()
+                await asyncio.sleep(0)
+            else:
+                if gc_scheduler is not None and gc_scheduler.enabled and time.monotonic() - last_report > GC_IDLE_TIME:
+                    # The host went quiet - a collection here delays nobody
+                    gc_scheduler.safe_point(GC_PHASE_IDLE)
+                    last_report = time.monotonic()
+                await asyncio.sleep(HID_IDLE_POLL)
+        except Exception as e:
+            error_message(f"Unexpected error in HID task: {e}")
+            await asyncio.sleep(0.1)
+
+async def led_task():
+    """LED animation - ends short flashes and blinks RED while running from RAM"""
+    global led_flash_until
+    last_blink_time = 0
+    
+    while True:
+        current_time = time.monotonic()
+        
+        if led_flash_until:
+            # Restore the base color once a flash has been shown long enough
+            if current_time >= led_flash_until:
+                led_flash_until = 0
+                pixel[0] = led_base_color
+        elif running and (current_time - last_blink_time >= BLINK_INTERVAL):
+            if led_base_color == RED:
+                set_status_led((128, 0, 0))  # Dimmer red
+            else:
+                set_status_led(RED)  # Full red
+            last_blink_time = current_time
+        
+        await asyncio.sleep(LED_TASK_INTERVAL)
 
-    global running
+async def clear_result_led(job, delay=3):
+    """Turn a flash job's GREEN/RED result off after a while unless a RAM program took over"""
+    await job.done.wait()
+    await asyncio.sleep(delay)
+    if not running:
+        set_status_led(OFF)
+
+def queue_hex_file_change(filename, signature):
+    """Queue the programming job for a single changed hex file (or the self-test trigger)"""
+    if filename == SELFTEST_TRIGGER_FILE:
+        if signature is not None:
+            log_message(f"{filename} changed - running the I2C self-test")
+            return pipeline.submit("selftest")
+        return None
     
-    log_message("FXCore Enhanced Hex Programmer with FT260 Emulation")
-    log_message("===================================================")
-    log_message("- NeoPixel on GP16 shows status:")
-    log_message("  * RED = Program running from RAM")
-    log_message("  * GREEN = Location programming successful")
-    log_message("  * PURPLE = Location programming in progress") 
-    log_message("  * BLUE = RAM upload in progress")
-    log_message("  * OFF = Normal operation")
-    log_message("- Place output.hex for RAM execution")
-    log_message("- Place 0.hex through F.hex for location programming")
-    log_message("- FT260 USB-I2C Bridge emulation available")
-    log_message("")
+    if filename == "output.hex":
+        if signature is None or signature[0] == 0:
+            if running:
+                log_message("output.hex removed or emptied - stopping execution")
+                pipeline.submit("stop")
+        elif hex_file_has_records(filename):
+            log_message("output.hex changed - reloading RAM program")
+            pipeline.submit("ram", filename)
+        else:
+            error_message("Invalid hex file found: output.hex")
+        return None
     
-    # Turn off LED initially
-    set_status_led(OFF)
-
-    running = False # init running flag
+    if signature is None or signature[0] == 0:
+        debug_message(f"{filename} removed or emptied - nothing to program")
+        return None
+    if not hex_file_has_records(filename):
+        error_message(f"Invalid hex file found: {filename}")
+        return None
     
-    # Always return to STATE0 on boot
-    debug_message("Ensuring STATE0 on startup...")
-    stop_execution()
-    time.sleep(0.1)
+    location = int(filename[0], 16)
+    log_message(f"{filename} changed - programming location {location:X}...")
+    return pipeline.submit("flash", filename, location)
+
+async def status_task():
+    """Background status refresh - keeps the cache fresh while the host is polling"""
+    while True:
+        for address, target in fxcore_targets.items():
+            cache = target.status_cache
+            if cache.host_active() and pipeline.idle(address) and not cache.fresh():
+                cache.refresh()
+        await asyncio.sleep(STATUS_REFRESH_INTERVAL)
+
+async def file_task():
+    """File monitoring - queue programming jobs for the hex files on the drive"""
+    watcher = HexFileWatcher()
+    watcher.prime()
     
     # Find all valid hex files at boot
     output_hex_valid, location_files = find_valid_hex_files()
+    boot_mark("file scan")
     
     # Process any location files found at boot
     if location_files:
+        # Slot programming is the slow path anyway, show progress on the LED
+        init_status_led()
         for location, filename in location_files.items():
             log_message(f"Boot-time location file detected: {filename} for location {location:X}")
             log_message(f"Found {filename} - programming location {location:X}...")
             
-            if program_location(location, filename):
+            job = pipeline.submit("flash", filename, location)
+            await job.done.wait()
+            if job.result:
                 log_message(f"Successfully programmed location {location:X}")
-                # Keep green LED on for a few seconds to show success
-                time.sleep(3)
             else:
                 error_message(f"Failed to program location {location:X}")
-                # Keep red LED on for a few seconds to show failure
-                time.sleep(3)
+            
+            # Keep green/red LED on for a few seconds to show the result
+            await asyncio.sleep(3)
             
             # Return LED to off state after programming
             set_status_led(OFF)
     
     # Check for output.hex (RAM execution) at boot
+    boot_job = None
     if output_hex_valid:
         log_message("output.hex found at boot - starting RAM execution...")
-        if run_ram_execution():
-            running = True
+        data_source = "output.hex"
+        if FAST_BOOT:
+            # Parse now, while the pipeline is still waiting out the STATE0 reset
+            data_source = read_fxcore_hex_file("output.hex") or "output.hex"
+            boot_mark("output.hex parsed")
+        boot_job = pipeline.submit("ram", data_source)
     
-    last_blink_time = 0
-    blink_interval = 0.5
+    # Boot is complete once the boot program is running (or failed)
+    if boot_job is not None:
+        await boot_job.done.wait()
+    boot_mark("boot complete")
+    if FAST_BOOT:
+        init_status_led()
+        log_banner()
+    log_boot_profile()
+    
+    if not HOT_RELOAD:
+        return
     
+    # Re-program only the file that changed, without restarting the interpreter
     while True:
+        await asyncio.sleep(watcher.interval)
         try:
-            current_time = time.monotonic()
-            
-            # High-frequency FT260 processing
-            ft260_processed = ft260.process_reports()
-            
-            # Handle LED blinking with timing control
-            if running and (current_time - last_blink_time >= blink_interval):
-                current_color = pixel[0]
-                if current_color == RED:
-                    set_status_led((128, 0, 0))  # Dimmer red
-                else:
-                    set_status_led(RED)  # Full red
-                last_blink_time = current_time
-            
-            # Minimal delay - responsive to FT260 but not CPU-intensive
-            if ft260_processed:
-                time.sleep(0.0001)  # Very short delay after processing
-            else:
-                time.sleep(0.001)   # Slightly longer when idle
-                
-        except KeyboardInterrupt:
-            break
+            for filename, signature in watcher.poll():
+                job = queue_hex_file_change(filename, signature)
+                if job is not None:
+                    asyncio.create_task(clear_result_led(job))
         except Exception as e:
-            error_message(f"Unexpected error in main loop: {e}")
-            set_status_led(OFF)
-            time.sleep(2)
+            error_message(f"Error watching hex files: {e}")
+
+def log_banner():
+    """Print the startup banner"""
+    log_message("FXCore Enhanced Hex Programmer with FT260 Emulation")
+    log_message("===================================================")
+    log_message("- NeoPixel on GP16 shows status:")
+    log_message("  * RED = Program running from RAM")
+    log_message("  * GREEN = Location programming successful")
+    log_message("  * PURPLE = Location programming in progress") 
+    log_message("  * BLUE = RAM upload in progress")
+    log_message("  * OFF = Normal operation")
+    log_message("- Place output.hex for RAM execution")
+    log_message("- Place 0.hex through F.hex for location programming")
+    log_message("- FT260 USB-I2C Bridge emulation available")
+    log_message("")
+
+async def main():
+    
+    global running
+    
+    boot_mark("main start")
+    if not FAST_BOOT:
+        log_banner()
+    
+    # Turn off LED initially
+    set_status_led(OFF)
+    
+    running = False # init running flag
+    
+    if HOT_RELOAD:
+        disable_autoreload()
+    
+    # Return to STATE0 on boot - first job, runs before any file job.
+    # Fast boot reads the status first so the state machine can skip the
+    # reset when the chip is already idle, otherwise the state stays
+    # UNKNOWN and both RETURN_0 and EXIT_PRG are sent.
+    debug_message("Ensuring STATE0 on startup...")
+    for address in fxcore_targets:
+        if FAST_BOOT:
+            read_fxcore_status(address=address)
+        pipeline.submit("stop", address=address)
+    boot_mark("state check")
+    if gc_scheduler is not None:
+        gc_scheduler.start()
+    if CAPTURE_TRAFFIC:
+        start_capture()
+    
+    tasks = [
+        asyncio.create_task(hid_task()),
+        asyncio.create_task(pipeline.run()),
+        asyncio.create_task(led_task()),
+        asyncio.create_task(status_task()),
+        asyncio.create_task(file_task()),
+    ]
+    if cdc is not None:
+        tasks.append(asyncio.create_task(cdc.task()))
+    if midi is not None:
+        tasks.append(asyncio.create_task(midi.task()))
+    await asyncio.gather(*tasks)
 
 # Run the main function
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         log_message("\nProgram interrupted")
         debug_message("Program terminated by user")
-        stop_execution()
-        if 'i2c' in globals():
-            i2c.deinit()
+        asyncio.run(stop_execution())
+        for manager in i2c_buses:
+            manager.bus.deinit()
         log_message("I2C bus released")
     except Exception as e:
         set_status_led(OFF)
         error_message(f"Fatal error: {e}")
-        if 'i2c' in globals():
-            i2c.deinit()
\ No newline at end of file
+        for manager in i2c_buses:
+            manager.bus.deinit()
@@ -0,0 +1,73 @@
+# deterministic_memory.py - DETERMINISTIC_MEMORY garbage collection for code.py
+# Imported by code.py only when DETERMINISTIC_MEMORY is on. The settings
+# (GC_RESERVE, GC_SAFE_POINT_MIN, GC_CHECK_REPORTS) and the phase ids stay
+# in code.py and are read through the firmware names it passes in.
+
+import gc
+import time
+
+class GCScheduler:
+    """
+    gc.collect() at safe points only, plus a forced collection when a report
+    check finds less than GC_RESERVE free (with automatic GC off, running
+    out raises MemoryError)
+    """
+    def __init__(self, fw):
+        self.log_message = fw.log_message
+        self.phase_reports = fw.GC_PHASE_REPORTS
+        self.reserve = fw.GC_RESERVE
+        self.safe_point_min = fw.GC_SAFE_POINT_MIN
+        self.check_reports = fw.GC_CHECK_REPORTS
+        self.enabled = hasattr(gc, "mem_free")
+        self.low_water = [0] * fw.GC_PHASES
+        self.free_after_collect = 0
+        self.collections = 0
+        self.forced = 0
+        self.collect_max_us = 0
+        self.reports = 0
+    
+    def start(self):
+        """Collect once after startup allocations and take over from automatic GC"""
+        if not self.enabled:
+            return
+        self.collect()
+        gc.disable()
+        for phase in range(len(self.low_water)):
+            self.low_water[phase] = self.free_after_collect
+        self.log_message(f"Deterministic memory mode, {self.free_after_collect} bytes free")
+    
+    def sample(self, phase):
+        """Free memory now, recorded against the phase's low-water mark"""
+        free = gc.mem_free()
+        if free < self.low_water[phase]:
+            self.low_water[phase] = free
+        return free
+    
+    def collect(self):
+        start_ns = time.monotonic_ns()
+        gc.collect()
+        elapsed = (time.monotonic_ns() - start_ns) // 1000
+        if elapsed > self.collect_max_us:
+            self.collect_max_us = elapsed
+        self.collections += 1
+        self.free_after_collect = gc.mem_free()
+    
+    def safe_point(self, phase):
+        """Collect if enough was allocated since the last collection"""
+        if self.enabled and self.sample(phase) < self.free_after_collect - self.safe_point_min:
+            self.collect()
+    
+    def report_handled(self):
+        """Every GC_CHECK_REPORTS reports check the reserve, collect right away when it is gone"""
+        self.reports += 1
+        if not self.enabled or self.reports < self.check_reports:
+            return
+        self.reports = 0
+        if self.sample(self.phase_reports) < self.reserve:
+            self.forced += 1
+            self.collect()
+    
+    def values(self):
+        """Performance counters page 2, ahead of the longest report handling time"""
+        free = gc.mem_free() if self.enabled else 0
+        return [free] + self.low_water + [self.collections, self.forced, self.collect_max_us]
@@ -0,0 +1,223 @@
+# midi_transport.py - USB MIDI SysEx transport for code.py, imported only
+# when boot.py enables USB MIDI (ENABLE_MIDI) and the ports are there.
+#
+# For hosts that only reach the box over MIDI. Messages are
+# F0 00 02 17 <type> ... F7 (the ID the web MIDI page uses). Section data is
+# 7-bit packed and lands in the FT260 emulator's section buffers, so run and
+# slot write work exactly as after a HID upload. Data messages carry a
+# sequence number and the device acknowledges them cumulatively: the host
+# keeps up to MIDI_WINDOW messages in flight and never has to guess delays,
+# the USB bulk endpoint paces the stream.
+
+import asyncio
+
+MIDI_SYSEX_ID = b"\x00\x02\x17"
+MIDI_CHUNK = 256            # section bytes per data message
+MIDI_MAX_MESSAGE = 4 + 2 + (MIDI_CHUNK * 8 + 6) // 7   # ID and type, seq, packed data
+MIDI_WINDOW = 8             # data messages the host may send ahead of the last ack
+MIDI_ACK_EVERY = 4          # acknowledge every n-th data message, and the last one
+MIDI_IDLE_POLL = 0.002      # task sleep when nothing arrived
+
+MIDI_MSG_STOP = 0x5B        # stop a RAM program (the web MIDI page's cancel/exit)
+MIDI_MSG_BEGIN = 0x60       # addr, section (XFER byte), size[3], crc[5] - start a section
+MIDI_MSG_DATA = 0x61        # seq[2], 7-bit packed data
+MIDI_MSG_RUN = 0x62         # addr, flags (bit 0 force) - EXEC_FROM_RAM
+MIDI_MSG_WRITE_SLOT = 0x63  # addr, location - WRITE_PRG
+MIDI_MSG_RUN_PRESET = 0x64  # addr, flags, crc[5] - run from the preset cache
+MIDI_MSG_REPLY = 0x70       # device -> host: type, result, value[2]
+
+def midi_value(data, offset, count):
+    """Little-endian 7-bit groups to an int"""
+    value = 0
+    for i in range(count):
+        value |= data[offset + i] << (7 * i)
+    return value
+
+def midi_unpack(data, out):
+    """Append 7-bit packed data (MSB byte, then up to 7 low-bit bytes) to out"""
+    i = 0
+    while i < len(data):
+        msbs = data[i]
+        for j in range(1, min(8, len(data) - i)):
+            out.append(data[i + j] | ((msbs << (8 - j)) & 0x80))
+        i += 8
+
+class MidiSysExTransport:
+    """SysEx parser and message handler for the USB MIDI ports"""
+    def __init__(self, port_in, port_out, fw):
+        self.port_in = port_in
+        self.port_out = port_out
+        self.fw = fw                            # code.py names: FT260 emulator, pipeline, result codes
+        self.chunk = bytearray(64)              # one USB packet worth of MIDI stream
+        self.message = bytearray(MIDI_MAX_MESSAGE)
+        self.length = 0
+        self.in_sysex = False
+        self.complete = False
+        self.pending = bytearray()              # stream bytes after a complete message
+        self.reply_buffer = bytearray([0xF0, 0x00, 0x02, 0x17, MIDI_MSG_REPLY, 0, 0, 0, 0, 0xF7])
+        # Section in progress
+        self.section = None                     # buffer being filled
+        self.section_name = None
+        self.section_size = 0
+        self.section_crc = 0
+        self.next_seq = 0
+        self.messages = 0
+        self.errors = 0
+    
+    def receive(self):
+        """Collect stream bytes, True when a complete SysEx message is in self.message"""
+        if self.pending:
+            data = self.pending
+            self.pending = bytearray()
+        else:
+            count = self.port_in.readinto(self.chunk)
+            if not count:
+                return False
+            data = memoryview(self.chunk)[0:count]
+        for i in range(len(data)):
+            byte = data[i]
+            if byte >= 0xF8:
+                continue                        # realtime bytes may appear anywhere
+            if byte == 0xF0:
+                self.in_sysex = True
+                self.length = 0
+            elif not self.in_sysex:
+                continue                        # notes, CCs - not for us
+            elif byte == 0xF7:
+                self.in_sysex = False
+                self.pending = bytearray(data[i + 1:])
+                self.messages += 1
+                return True
+            elif byte & 0x80 or self.length == len(self.message):
+                self.in_sysex = False           # broken or oversized message
+                self.errors += 1
+            else:
+                self.message[self.length] = byte
+                self.length += 1
+        return False
+    
+    def reply(self, msg_type, result, value=0):
+        self.reply_buffer[5] = msg_type
+        self.reply_buffer[6] = result
+        self.reply_buffer[7] = value & 0x7F
+        self.reply_buffer[8] = (value >> 7) & 0x7F
+        self.port_out.write(self.reply_buffer)
+    
+    async def task(self):
+        """Main loop task - SysEx upload and run messages"""
+        while True:
+            try:
+                if self.receive():
+                    await self.handle()
+                    await asyncio.sleep(0)
+                else:
+                    await asyncio.sleep(MIDI_IDLE_POLL)
+            except Exception as e:
+                self.fw.error_message(f"Unexpected error in MIDI task: {e}")
+                await asyncio.sleep(0.1)
+    
+    async def handle(self):
+        """Run the message in self.message"""
+        fw = self.fw
+        message = self.message
+        length = self.length
+        if length < 4 or message[0:3] != MIDI_SYSEX_ID:
+            return
+        msg_type = message[3]
+        if msg_type == MIDI_MSG_DATA:
+            self.section_data(message, length)
+        elif msg_type == MIDI_MSG_BEGIN:
+            self.begin_section(message, length)
+        elif msg_type == MIDI_MSG_STOP:
+            fw.pipeline.submit("stop", address=fw.ft260.target_address)
+        elif msg_type in (MIDI_MSG_RUN, MIDI_MSG_WRITE_SLOT, MIDI_MSG_RUN_PRESET):
+            await self.run(msg_type, message, length)
+    
+    def select_target(self, address):
+        """Point the emulator at address, like a D0 write to it would"""
+        fw = self.fw
+        if address != fw.ft260.target_address:
+            fw.ft260.reset_programming_state()
+            fw.ft260.target_address = address
+    
+    def begin_section(self, message, length):
+        fw = self.fw
+        section = fw.ZRLE_SECTIONS.get(message[5]) if length >= 14 else None
+        size = midi_value(message, 6, 3) if section else 0
+        if section is None or not fw.is_fxcore_address(message[4]) or not fw.section_size_valid(size, section[1]):
+            self.section = None
+            self.reply(MIDI_MSG_BEGIN, fw.EXT_ERR_PARAM)
+            return
+        self.select_target(message[4])
+        self.section_name = section[0]
+        self.section = fw.ft260.section_buffer(self.section_name)
+        self.section[:] = bytearray()
+        self.section_size = size
+        self.section_crc = midi_value(message, 9, 5) & 0xFFFFFFFF
+        self.next_seq = 0
+        fw.debug_message(f"MIDI: {self.section_name} upload, {size} bytes")
+        self.reply(MIDI_MSG_BEGIN, fw.EXT_OK, MIDI_WINDOW)
+    
+    def section_data(self, message, length):
+        fw = self.fw
+        if self.section is None or length < 6:
+            self.reply(MIDI_MSG_DATA, fw.EXT_ERR_PARAM, self.next_seq)
+            return
+        seq = midi_value(message, 4, 2)
+        if seq != self.next_seq:
+            # Lost or repeated message - the host resends from next_seq
+            self.errors += 1
+            self.reply(MIDI_MSG_DATA, fw.EXT_ERR_SEQUENCE, self.next_seq)
+            return
+        midi_unpack(memoryview(message)[6:length], self.section)
+        self.next_seq = (seq + 1) & 0x3FFF
+        if len(self.section) < self.section_size:
+            if self.next_seq % MIDI_ACK_EVERY == 0:
+                self.reply(MIDI_MSG_DATA, fw.EXT_OK, self.next_seq)
+            return
+        # Section complete - never hand a corrupt one to the programming job
+        result = fw.EXT_OK
+        if len(self.section) != self.section_size:
+            result = fw.EXT_ERR_LENGTH
+        elif fw.crc32(self.section) & 0xFFFFFFFF != self.section_crc:
+            result = fw.EXT_ERR_CRC
+        if result != fw.EXT_OK:
+            self.section[:] = bytearray()
+            fw.error_message(f"MIDI: {self.section_name} rejected (error {result})")
+        else:
+            fw.debug_message(f"MIDI: {self.section_name} data complete ({self.section_size} bytes, CRC ok)")
+        self.section = None
+        self.reply(MIDI_MSG_DATA, result, self.next_seq)
+    
+    async def run(self, msg_type, message, length):
+        """Queue run, slot write or preset run and answer when the job is done"""
+        fw = self.fw
+        if length < 6 or not fw.is_fxcore_address(message[4]):
+            self.reply(msg_type, fw.EXT_ERR_PARAM)
+            return
+        address = message[4]
+        if msg_type == MIDI_MSG_RUN_PRESET:
+            image = fw.preset_image(midi_value(message, 6, 5) & 0xFFFFFFFF) if length >= 11 else None
+            if image is None:
+                self.reply(msg_type, fw.EXT_ERR_NOT_CACHED)
+                return
+            job = fw.pipeline.submit("ram", image, address=address, force=(message[5] & 0x01) != 0)
+        else:
+            self.select_target(address)
+            if msg_type == MIDI_MSG_RUN:
+                job = fw.ft260.execute_programming(force=(message[5] & 0x01) != 0)
+            elif message[5] <= 0x0F:
+                job = fw.ft260.execute_programming_to_flash(message[5])
+            else:
+                self.reply(msg_type, fw.EXT_ERR_PARAM)
+                return
+        await job.done.wait()
+        self.reply(msg_type, fw.EXT_OK if job.result else fw.EXT_ERR_FAILED)
+
+def open_transport(usb_midi, fw):
+    """Transport on the first MIDI in and out port, None when either is missing"""
+    ports_in = [port for port in usb_midi.ports if isinstance(port, usb_midi.PortIn)]
+    ports_out = [port for port in usb_midi.ports if isinstance(port, usb_midi.PortOut)]
+    if not ports_in or not ports_out:
+        return None
+    return MidiSysExTransport(ports_in[0], ports_out[0], fw)
@@ -0,0 +1,58 @@
+# preset_cache.py - preset cache of RAM images for code.py (extension
+# commands E3/E4, CDC and MIDI preset runs). Imported by code.py only when
+# PRESET_CACHE_SIZE is not 0; the limits stay in code.py.
+
+class PresetCache:
+    """
+    Images that ran from RAM, keyed by image_crc32 and evicted least recently
+    used first. Entries are data_source dicts for execute_unified_programming.
+    """
+    def __init__(self, fw):
+        self.debug_message = fw.debug_message
+        self.max_images = fw.PRESET_CACHE_SIZE
+        self.max_bytes = fw.PRESET_CACHE_BYTES
+        self.images = {}    # crc -> data_source dict
+        self.order = []     # crcs, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def image_size(image):
+        return (len(image['cregs']) + len(image['mregs']) + len(image['sfrs']) +
+                len(image['program_data']) + 4 * len(image['instructions']))
+    
+    def touch(self, crc):
+        self.order.remove(crc)
+        self.order.append(crc)
+    
+    def store(self, crc, image):
+        """Add or refresh an image, then evict until both limits hold"""
+        if crc in self.images:
+            self.touch(crc)
+            return
+        size = self.image_size(image)
+        if size > self.max_bytes:
+            return
+        self.images[crc] = image
+        self.order.append(crc)
+        self.size += size
+        while len(self.order) > self.max_images or self.size > self.max_bytes:
+            evicted = self.order.pop(0)
+            self.size -= self.image_size(self.images.pop(evicted))
+            self.debug_message(f"Preset cache: evicted image 0x{evicted:08X}")
+        self.debug_message(f"Preset cache: stored image 0x{crc:08X} ({len(self.order)} images, {self.size} bytes)")
+    
+    def get(self, crc):
+        """Cached image for crc (marked most recently used) or None"""
+        image = self.images.get(crc)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touch(crc)
+        return image
+    
+    def crcs(self):
+        """Cached image CRCs, most recently used first"""
+        return list(reversed(self.order))
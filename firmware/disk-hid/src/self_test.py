@@ -0,0 +1,109 @@
+# self_test.py - I2C self-test for code.py (extension command E7, or
+# SELFTEST_TRIGGER_FILE on the drive). Imported by run_self_test() in code.py
+# the first time a self-test runs.
+#
+# A fixed workload against one FXCore that tells a slow cable or bus apart
+# from a slow chip. Results go to the console and, while a host uses the
+# bridge, into input report 0xB9 (u32 little-endian from byte 4):
+#   0 result, 1 address | 4 total ms | 8 status read p50 us, 12 p99 us
+#   16 + 12 * i: write size i bytes/s, p50 us, p99 us | 52 upload bytes/s, 56 upload us
+
+import asyncio
+import time
+
+SELFTEST_REPORT_ID = 0xB9
+SELFTEST_REPORT_SIZE = 63
+SELFTEST_STATUS_READS = 200
+SELFTEST_WRITE_SIZES = (16, 64, 514)    # I2C write sizes, streamed as one MREG section
+SELFTEST_WRITE_ROUNDS = 8               # MREG sections per write size
+SELFTEST_PROGRAM_INSTRUCTIONS = 1024
+
+def percentile(samples, fraction):
+    """Value at fraction (0..1) of the sorted samples, 0 when there are none"""
+    if not samples:
+        return 0
+    samples.sort()
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+class SelfTest:
+    """Runs the workload as a pipeline job, one FXCore at a time"""
+    def __init__(self, fw):
+        self.fw = fw                # code.py names: bus managers, FXCore commands, FT260 emulator
+    
+    def timed_write(self, address, data, samples):
+        """One I2C write, its duration in us appended to samples"""
+        start_ns = time.monotonic_ns()
+        with self.fw.bus_for(address).transaction() as bus:
+            bus.writeto(address, data)
+        samples.append((time.monotonic_ns() - start_ns) // 1000)
+    
+    async def run(self, address):
+        """
+        Status reads in the current mode, then in PROG mode MREG sections
+        written in SELFTEST_WRITE_SIZES pieces and a complete all-zero image
+        (never executed). A RAM program is stopped, the chip ends in RUN mode
+        running its flash program.
+        """
+        fw = self.fw
+        log_message = fw.log_message
+        report = bytearray(SELFTEST_REPORT_SIZE)
+        report[1] = address
+        values = []
+        start_ns = time.monotonic_ns()
+        log_message(f"Self-test of FXCore 0x{address:02X} started")
+        try:
+            # Status reads, yielding in between so HID keeps being served
+            samples = []
+            status = bytearray(12)
+            for _ in range(SELFTEST_STATUS_READS):
+                read_ns = time.monotonic_ns()
+                with fw.bus_for(address).transaction() as bus:
+                    bus.readfrom_into(address, status)
+                samples.append((time.monotonic_ns() - read_ns) // 1000)
+                await asyncio.sleep(0)
+            values.extend((percentile(samples, 0.5), percentile(samples, 0.99)))
+            log_message(f"  status read: p50 {values[0]} us, p99 {values[1]} us")
+            
+            if not await fw.ensure_prog_mode(address):
+                raise OSError("ENTER_PRG failed")
+            
+            # Sized writes - an all-zero MREG section has a zero checksum too
+            mregs = bytes(514)
+            for size in SELFTEST_WRITE_SIZES:
+                samples = []
+                busy_us = 0
+                for _ in range(SELFTEST_WRITE_ROUNDS):
+                    if not await fw.send_command(fw.CMD_XFER_MREG, "XFER_MREG", address):
+                        raise OSError("XFER_MREG failed")
+                    for offset in range(0, len(mregs), size):
+                        self.timed_write(address, mregs[offset:offset + size], samples)
+                    busy_us += sum(samples[-((len(mregs) + size - 1) // size):])
+                rate = len(mregs) * SELFTEST_WRITE_ROUNDS * 1000000 // max(1, busy_us)
+                values.extend((rate, percentile(samples, 0.5), percentile(samples, 0.99)))
+                log_message(f"  {size}-byte writes: {rate} B/s, p50 {values[-2]} us, p99 {values[-1]} us")
+            
+            # Whole image the way an upload sends it, without the section gaps
+            program_data = bytes(SELFTEST_PROGRAM_INSTRUCTIONS * 4 + 2)
+            upload_ns = time.monotonic_ns()
+            ok = (await fw.send_mregs(mregs, address) and await fw.send_cregs(bytes(66), address) and
+                  await fw.send_sfrs(bytes(50), address) and
+                  await fw.send_program_data([0] * SELFTEST_PROGRAM_INSTRUCTIONS, program_data, address))
+            upload_us = (time.monotonic_ns() - upload_ns) // 1000
+            if not ok:
+                raise OSError("dummy upload failed")
+            upload_bytes = 514 + 66 + 50 + len(program_data)
+            values.extend((upload_bytes * 1000000 // max(1, upload_us), upload_us))
+            log_message(f"  image upload: {upload_bytes} bytes in {upload_us // 1000} ms, {values[-2]} B/s")
+            report[0] = fw.EXT_OK
+        except OSError as e:
+            fw.error_message(f"Self-test of FXCore 0x{address:02X} failed: {e}")
+            report[0] = fw.EXT_ERR_I2C
+        
+        # The MREGs were overwritten, leave PROG mode so the flash program runs again
+        await fw.ensure_run_mode(address)
+        total_ms = (time.monotonic_ns() - start_ns) // 1000000
+        log_message(f"Self-test of FXCore 0x{address:02X} done in {total_ms} ms")
+        for index, value in enumerate([total_ms] + values):
+            report[4 + index * 4:8 + index * 4] = (value & 0xFFFFFFFF).to_bytes(4, 'little')
+        fw.ft260.push_report(report, SELFTEST_REPORT_ID)
+        return report[0] == fw.EXT_OK
@@ -0,0 +1,116 @@
+# span_trace.py - span tracing for code.py (TRACE_SPANS, extension command E6)
+# Imported by start_span_trace() in code.py only when tracing is switched on.
+
+import time
+
+# Event records are 8 bytes: timestamp (us since boot, uint32 LE), span id,
+# flags (bit 0 end, bit 1 returned a true value), FXCore address, argument
+# (command byte, flash location)
+TRACE_RECORD_SIZE = 8
+TRACE_END = 0x01
+TRACE_OK = 0x02
+
+# (span name, wrapped function, address argument, detail argument), the span
+# id is the index - fxcore_trace.py has the same table
+TRACE_SPAN_TABLE = (
+    ("upload", "execute_unified_programming", 4, 2),
+    ("parse", "read_fxcore_hex_file", None, None),
+    ("ENTER_PRG", "enter_prog_mode", 0, None),
+    ("EXIT_PRG", "exit_prog_mode", 0, None),
+    ("settle", "settle_fxcore", 0, None),
+    ("section", "upload_section", 2, None),
+    ("CREG", "send_cregs", 1, None),
+    ("MREG", "send_mregs", 1, None),
+    ("SFR", "send_sfrs", 1, None),
+    ("PRG", "send_program_data", 2, None),
+    ("command", "send_command", 2, 0),
+    ("i2c_write", "send_i2c_data", 2, None),
+    ("WRITE_PRG", "write_to_flash_location", 1, 0),
+    ("EXEC", "execute_from_ram", 0, None),
+    ("RETURN_0", "send_return_0", 0, None),
+)
+
+class SpanTrace:
+    """Ring of begin/end events, allocated once when tracing is installed"""
+    def __init__(self, fw):
+        self.fw = fw        # code.py names, the functions to wrap among them
+        self.buffer = None
+        self.capacity = 0
+        self.next = 0       # record index written next
+        self.count = 0      # records held, up to capacity
+    
+    def install(self, events):
+        """Allocate the ring and wrap the functions of TRACE_SPAN_TABLE in code.py"""
+        if self.buffer is not None:
+            return
+        self.buffer = bytearray(events * TRACE_RECORD_SIZE)
+        self.capacity = events
+        module = self.fw.names
+        for span, (name, function, address_arg, detail_arg) in enumerate(TRACE_SPAN_TABLE):
+            wrap = self.wrap_async if function != "read_fxcore_hex_file" else self.wrap
+            module[function] = wrap(module[function], span, address_arg, detail_arg)
+        self.fw.log_message(f"Span tracing on, {events} events")
+    
+    def clear(self):
+        self.next = 0
+        self.count = 0
+    
+    def record(self, span, flags, address, detail):
+        offset = self.next * TRACE_RECORD_SIZE
+        buffer = self.buffer
+        buffer[offset:offset + 4] = ((time.monotonic_ns() // 1000) & 0xFFFFFFFF).to_bytes(4, 'little')
+        buffer[offset + 4] = span
+        buffer[offset + 5] = flags
+        buffer[offset + 6] = address & 0xFF
+        buffer[offset + 7] = detail & 0xFF
+        self.next = (self.next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+    
+    def arguments(self, args, kwargs, address_arg, detail_arg):
+        """(address, detail) of one call"""
+        address = 0     # not tied to an FXCore (hex parsing)
+        if address_arg is not None:
+            address = args[address_arg] if len(args) > address_arg else kwargs.get("address", self.fw.FXCORE_ADDRESS)
+        detail = 0
+        if detail_arg is not None and len(args) > detail_arg:
+            detail = args[detail_arg]
+            if not isinstance(detail, int):
+                detail = detail[0] if detail and not isinstance(detail, str) else 0
+        return address, detail
+    
+    def wrap(self, function, span, address_arg, detail_arg):
+        def traced(*args, **kwargs):
+            address, detail = self.arguments(args, kwargs, address_arg, detail_arg)
+            self.record(span, 0, address, detail)
+            result = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                self.record(span, TRACE_END | (TRACE_OK if result else 0), address, detail)
+        return traced
+    
+    def wrap_async(self, function, span, address_arg, detail_arg):
+        async def traced(*args, **kwargs):
+            address, detail = self.arguments(args, kwargs, address_arg, detail_arg)
+            self.record(span, 0, address, detail)
+            result = None
+            try:
+                result = await function(*args, **kwargs)
+                return result
+            finally:
+                self.record(span, TRACE_END | (TRACE_OK if result else 0), address, detail)
+        return traced
+    
+    def events(self, start, count):
+        """Records start..start+count-1, oldest first, as one bytes object"""
+        if start >= self.count:
+            return b""
+        count = min(count, self.count - start)
+        first = (self.next - self.count + start) % self.capacity
+        end = first + count
+        if end <= self.capacity:
+            return bytes(self.buffer[first * TRACE_RECORD_SIZE:end * TRACE_RECORD_SIZE])
+        wrapped = end - self.capacity
+        return bytes(self.buffer[first * TRACE_RECORD_SIZE:]) + bytes(self.buffer[:wrapped * TRACE_RECORD_SIZE])
@@ -0,0 +1,184 @@
+# traffic_capture.py - HID report and I2C traffic capture for code.py
+# (CAPTURE_TRAFFIC, extension command E8). Imported by start_capture() in
+# code.py the first time capture starts, at boot or on the host's request.
+
+import time
+
+# Records have a variable length and are never split across the end of the
+# ring:
+#
+#   kind, body length, timestamp (us since boot, uint32 LE), body
+#
+# CAPTURE_REPORT_IN / CAPTURE_REPORT_OUT body: report ID, payload. D0 and C2
+# payloads are cut to their used length (a C2 request to its 4 bytes).
+# CAPTURE_I2C body: address, op, result, write length (2), read length (2),
+# duration in us (2, saturating).
+CAPTURE_HEADER_SIZE = 6
+CAPTURE_REPORT_IN = 0x01
+CAPTURE_REPORT_OUT = 0x02
+CAPTURE_I2C = 0x03
+CAPTURE_I2C_BODY = 9
+CAPTURE_OP_WRITE = 0
+CAPTURE_OP_READ = 1
+CAPTURE_OP_WRITE_READ = 2
+CAPTURE_RESULT_OK = 0
+CAPTURE_RESULT_ERROR = 1        # OSError - NACK, bus error
+
+class CapturingBus:
+    """
+    Stands in for a busio.I2C while capture is on: the transfer methods time
+    the call and record it, everything else goes to the bus.
+    """
+    def __init__(self, bus, capture):
+        self.bus = bus
+        self.capture = capture
+    
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+    
+    def writeto(self, address, buffer, **kwargs):
+        start = time.monotonic_ns()
+        try:
+            self.bus.writeto(address, buffer, **kwargs)
+        except OSError:
+            self.capture.i2c(address, CAPTURE_OP_WRITE, CAPTURE_RESULT_ERROR, len(buffer), 0, start)
+            raise
+        self.capture.i2c(address, CAPTURE_OP_WRITE, CAPTURE_RESULT_OK, len(buffer), 0, start)
+    
+    def readfrom_into(self, address, buffer, **kwargs):
+        start = time.monotonic_ns()
+        try:
+            self.bus.readfrom_into(address, buffer, **kwargs)
+        except OSError:
+            self.capture.i2c(address, CAPTURE_OP_READ, CAPTURE_RESULT_ERROR, 0, len(buffer), start)
+            raise
+        self.capture.i2c(address, CAPTURE_OP_READ, CAPTURE_RESULT_OK, 0, len(buffer), start)
+    
+    def writeto_then_readfrom(self, address, out_buffer, in_buffer, **kwargs):
+        start = time.monotonic_ns()
+        try:
+            self.bus.writeto_then_readfrom(address, out_buffer, in_buffer, **kwargs)
+        except OSError:
+            self.capture.i2c(address, CAPTURE_OP_WRITE_READ, CAPTURE_RESULT_ERROR,
+                             len(out_buffer), len(in_buffer), start)
+            raise
+        self.capture.i2c(address, CAPTURE_OP_WRITE_READ, CAPTURE_RESULT_OK,
+                         len(out_buffer), len(in_buffer), start)
+
+class TrafficCapture:
+    """
+    Byte ring of capture records. A record that doesn't fit before the end
+    of the buffer starts again at 0 and the oldest records are dropped to
+    make room, so reading never has to reassemble a split record.
+    """
+    def __init__(self, fw):
+        self.buses = fw.i2c_buses       # managers that get the proxy while recording
+        self.size = fw.CAPTURE_BYTES
+        self.log_message = fw.log_message
+        self.buffer = None
+        self.enabled = False
+        self.clear()
+    
+    def clear(self):
+        self.head = 0       # next write offset
+        self.tail = 0       # oldest record
+        self.wrap_at = 0    # end of the data before head went back to 0
+        self.wrapped = False
+        self.records = 0
+        self.dropped = 0
+    
+    def start(self):
+        """Clear the ring and start recording, the I2C buses get the proxy"""
+        if self.buffer is None:
+            self.buffer = bytearray(self.size)
+        self.clear()
+        for manager in self.buses:
+            manager.client = CapturingBus(manager.bus, self)
+        self.enabled = True
+        self.log_message(f"Traffic capture on, {len(self.buffer)} bytes")
+    
+    def stop(self):
+        """Stop recording, the records stay readable until the next start"""
+        self.enabled = False
+        for manager in self.buses:
+            manager.client = manager.bus
+    
+    def length(self):
+        """Bytes of records held"""
+        if self.wrapped:
+            return self.wrap_at - self.tail + self.head
+        return self.head - self.tail
+    
+    def allocate(self, size):
+        """Offset of size free bytes, dropping the oldest records as needed"""
+        buffer = self.buffer
+        while True:
+            if not self.wrapped:
+                if self.head + size <= len(buffer):
+                    return self.head
+                if self.head == self.tail:
+                    self.head = self.tail = 0
+                    continue
+                self.wrap_at = self.head
+                self.head = 0
+                self.wrapped = True
+            if self.head + size <= self.tail:
+                return self.head
+            self.tail += CAPTURE_HEADER_SIZE + buffer[self.tail + 1]
+            self.records -= 1
+            self.dropped += 1
+            if self.tail >= self.wrap_at:
+                self.tail = 0
+                self.wrapped = False
+    
+    def header(self, kind, body_length):
+        """Reserve a record and write its header, returns the body offset"""
+        offset = self.allocate(CAPTURE_HEADER_SIZE + body_length)
+        buffer = self.buffer
+        buffer[offset] = kind
+        buffer[offset + 1] = body_length
+        buffer[offset + 2:offset + 6] = ((time.monotonic_ns() // 1000) & 0xFFFFFFFF).to_bytes(4, 'little')
+        self.head = offset + CAPTURE_HEADER_SIZE + body_length
+        self.records += 1
+        return offset + CAPTURE_HEADER_SIZE
+    
+    def report(self, kind, report_id, data):
+        """Record a HID report, D0 and C2 payloads cut to the bytes in use"""
+        length = len(data)
+        if report_id == 0xD0 and length >= 3:
+            length = min(length, 3 + data[2])
+        elif report_id == 0xC2 and length >= 4:
+            length = 4 if kind == CAPTURE_REPORT_IN else min(length, 1 + data[0])
+        offset = self.header(kind, 1 + length)
+        self.buffer[offset] = report_id
+        self.buffer[offset + 1:offset + 1 + length] = data[:length]
+    
+    def i2c(self, address, op, result, write_length, read_length, start_ns):
+        """Record one I2C transfer that began at start_ns"""
+        duration = min((time.monotonic_ns() - start_ns) // 1000, 0xFFFF)
+        offset = self.header(CAPTURE_I2C, CAPTURE_I2C_BODY)
+        buffer = self.buffer
+        buffer[offset] = address
+        buffer[offset + 1] = op
+        buffer[offset + 2] = result
+        buffer[offset + 3] = write_length & 0xFF
+        buffer[offset + 4] = write_length >> 8
+        buffer[offset + 5] = read_length & 0xFF
+        buffer[offset + 6] = read_length >> 8
+        buffer[offset + 7] = duration & 0xFF
+        buffer[offset + 8] = duration >> 8
+    
+    def read(self, start, count):
+        """count bytes from position start of the records, oldest first"""
+        if self.buffer is None:
+            return b""
+        count = max(0, min(count, self.length() - start))
+        if not self.wrapped:
+            return bytes(self.buffer[self.tail + start:self.tail + start + count])
+        first = self.wrap_at - self.tail     # bytes before the wrap
+        if start >= first:
+            return bytes(self.buffer[start - first:start - first + count])
+        data = bytes(self.buffer[self.tail + start:self.tail + start + min(count, first - start)])
+        if count > first - start:
+            data += bytes(self.buffer[:count - (first - start)])
+        return data
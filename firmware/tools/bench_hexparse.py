@@ -0,0 +1,345 @@
+"""
+Intel HEX parser benchmark for the disk-hid and disk-mode firmware.
+
+Generates FXCore images across the size range (1 to 1024 instructions,
+sparse and dense register sections, 16/32/64-byte and mixed record
+lengths, sparse images with their all-zero records left out) plus
+malformed variants of one image. Each image is parsed with
+read_fxcore_hex_file() of both firmwares and checked byte for byte
+against a reference parser. The report shows per image:
+
+    us/KB     parse time per KB of hex text (fastest of --repeat runs)
+    allocs    estimated MicroPython heap allocations, see AllocCounter
+    peak KB   tracemalloc peak while parsing
+    match     sections equal to the reference (malformed images: same
+              outcome, records the reference skips are skipped too)
+
+    python3 bench_hexparse.py
+    python3 bench_hexparse.py --quick --corpus /tmp/hexcorpus    # keep the files
+"""
+import argparse
+import dis
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fwload import DISK_HID_CODE, DISK_MODE_CODE, load_firmware, silenced
+
+SIZES = (1, 4, 16, 64, 256, 1024)
+RECORD_LENGTHS = (16, 32, 64, "mixed")
+SECTION_KEYS = ("cregs", "mregs", "sfrs", "program_data", "instructions")
+# Section base address, data bytes without the checksum
+REGIONS = (("mregs", 0x0000, 512), ("cregs", 0x0800, 64), ("sfrs", 0x1000, 48))
+PROGRAM_BASE = 0x1800
+
+
+def section(data):
+    """Section bytes plus the little-endian sum checksum"""
+    return bytes(data) + (sum(data) & 0xFFFF).to_bytes(2, "little")
+
+
+def record(address, record_type, data=b""):
+    body = bytes([len(data), address >> 8, address & 0xFF, record_type]) + bytes(data)
+    return ":" + (body + bytes([-sum(body) & 0xFF])).hex().upper()
+
+
+def make_image(instructions, dense, record_length, seed):
+    """(sections dict, hex text) of one generated image"""
+    rng = random.Random(seed)
+
+    def fill(count):
+        if dense:
+            return bytes(rng.randrange(256) for _ in range(count))
+        # Sparse: a few 16-byte blocks set, the rest zero
+        return b"".join(rng.randbytes(16) if rng.random() < 0.15 else bytes(16) for _ in range(count // 16))
+
+    sections = {key: section(fill(size)) for key, _, size in REGIONS}
+    sections["program_data"] = section(bytes(rng.randrange(256) for _ in range(instructions * 4)))
+    lines = []
+    for key, base in [(key, base) for key, base, _ in REGIONS] + [("program_data", PROGRAM_BASE)]:
+        data = sections[key]
+        offset = 0
+        while offset < len(data):
+            length = rng.randint(1, 64) if record_length == "mixed" else record_length
+            chunk = data[offset:offset + length]
+            last = offset + length >= len(data)
+            # Sparse images leave out interior records that are all zero
+            if dense or offset == 0 or last or any(chunk):
+                lines.append(record(base + offset, 0x00, chunk))
+            offset += length
+    lines.append(record(0, 0x01))
+    program = sections["program_data"]
+    sections["instructions"] = [int.from_bytes(program[i:i + 4], "little") for i in range(0, len(program) - 2, 4)]
+    return sections, "\n".join(lines) + "\n"
+
+
+def malformed_variants(text):
+    """(name, hex text) of broken or unusual versions of one image"""
+    lines = text.splitlines()
+    program = next(i for i, line in enumerate(lines) if line[3:7] == "1800")
+
+    def replace(index, line):
+        return "\n".join(lines[:index] + [line] + lines[index + 1:]) + "\n"
+
+    bad_checksum = lines[program][:-2] + f"{(int(lines[program][-2:], 16) + 1) & 0xFF:02X}"
+    return [
+        ("bad-checksum", replace(program, bad_checksum)),
+        ("truncated-record", replace(1, lines[1][:-2])),
+        ("non-hex-digit", replace(2, lines[2][:12] + "G" + lines[2][13:])),
+        ("no-eof", "\n".join(lines[:-1]) + "\n"),
+        ("crlf", "\r\n".join(lines) + "\r\n"),
+        ("blank-and-comments", "# generated\n\n" + "\n\n".join(lines) + "\n"),
+        ("extended-address", record(0, 0x04, b"\x00\x00") + "\n" + text),
+        ("data-after-eof", text + record(PROGRAM_BASE, 0x00, b"\xFF" * 4) + "\n"),
+        ("empty", ""),
+        ("not-hex", "hello\n"),
+    ]
+
+
+def reference_parse(text):
+    """
+    Sections of a hex text, the reference for both firmwares: lines that are
+    short, of the wrong length, not hex or fail their checksum are skipped,
+    the first EOF record ends the file. A file that is empty or doesn't
+    start with a record is None, as disk-hid rejects it
+    """
+    if not text.strip().startswith(":"):
+        return None
+    data = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith(":") or len(line) < 11:
+            continue
+        try:
+            raw = bytes.fromhex(line[1:])
+        except ValueError:
+            continue
+        if len(raw) != raw[0] + 5 or sum(raw) & 0xFF:
+            continue
+        if raw[3] == 0x01:
+            break
+        if raw[3] == 0x00:
+            address = (raw[1] << 8) | raw[2]
+            for i, byte in enumerate(raw[4:-1]):
+                data[address + i] = byte
+    regions = [(key, base, base + 0x800) for key, base, _ in REGIONS] + [("program_data", PROGRAM_BASE, 1 << 16)]
+    sections = {}
+    for key, base, end in regions:
+        addresses = [address for address in data if base <= address < end]
+        out = bytearray(max(addresses) - base + 1 if addresses else 0)
+        for address in addresses:
+            out[address - base] = data[address]
+        sections[key] = bytes(out)
+    program = sections["program_data"]
+    usable = len(program) - 2 if len(program) >= 2 else len(program)
+    sections["instructions"] = [int.from_bytes(program[i:i + 4], "little") for i in range(0, usable - 3, 4)]
+    return sections
+
+
+def same(result, expected):
+    if result is None or expected is None:
+        return result is expected
+    return all((bytes(result[key]) if key != "instructions" else list(result[key])) == expected[key]
+               for key in SECTION_KEYS)
+
+
+class AllocCounter:
+    """
+    Estimate of the heap allocations MicroPython makes running the code of
+    one file. CPython doesn't count allocations and its object model
+    differs, so the operations that allocate on the MicroPython heap are
+    counted instead:
+
+    - executed opcodes that build an object: slices, lists, tuples, dicts,
+      strings and f-strings, functions
+    - calls of builtins that return a new object (str methods, iterators,
+      constructors, file reads)
+    - growth of the lists, dicts and bytearrays held in local variables,
+      checked at every line: lists double from 4, dicts step through
+      MicroPython's hash table sizes, bytearrays take 8 more bytes; lists
+      built by comprehensions count when they are returned
+    - the strings of a list first seen already holding them (split(),
+      readlines())
+
+    Small ints are not objects in MicroPython and are not counted.
+    """
+    OPCODES = {"BUILD_SLICE", "BINARY_SLICE", "BUILD_LIST", "BUILD_TUPLE", "BUILD_MAP", "BUILD_SET",
+               "BUILD_STRING", "FORMAT_VALUE", "FORMAT_SIMPLE", "FORMAT_WITH_SPEC", "BUILD_CONST_KEY_MAP",
+               "MAKE_FUNCTION"}
+    CALLS = {"str.strip", "str.split", "str.splitlines", "str.replace", "str.join", "str.upper", "str.lower",
+             "str.format", "enumerate", "range", "zip", "map", "sorted", "list", "dict", "bytearray", "bytes",
+             "open", "TextIOWrapper.read", "TextIOWrapper.readlines", "dict.keys", "dict.values", "dict.items"}
+    # py/map.c hash_allocation_sizes, past the end the table grows by half
+    DICT_SIZES = (0, 2, 4, 6, 8, 10, 12, 17, 23, 29, 37, 47, 59, 73, 97, 127, 167, 223, 293, 389, 521, 691,
+                  919, 1223, 1627, 2161, 3229, 4831, 7243, 10861, 16273, 24407, 36607, 54907)
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self.opcodes = {}       # code object -> its bytecode
+        self.containers = {}    # id -> (container, capacity), the container kept so the id stays unique
+
+    def grow(self, kind, capacity):
+        if kind is list:
+            return max(4, capacity * 2)
+        if kind is dict:
+            for size in self.DICT_SIZES:
+                if size > capacity:
+                    return size
+            return capacity * 3 // 2
+        return capacity + 8
+
+    def growths(self, container, capacity):
+        """(allocations, new capacity) for the container to hold its items"""
+        count = 0
+        while len(container) > capacity:
+            capacity = self.grow(type(container), capacity)
+            count += 1
+        return count, capacity
+
+    def check_locals(self, frame):
+        for value in frame.f_locals.values():
+            if type(value) not in (list, dict, bytearray):
+                continue
+            seen = self.containers.get(id(value))
+            if seen is None:
+                # New or created by a call: its storage is counted where it was built
+                if type(value) is list:
+                    self.count += sum(1 for item in value if isinstance(item, (str, bytes)))
+                self.containers[id(value)] = (value, self.growths(value, 0)[1])
+            elif len(value) > seen[1]:
+                count, capacity = self.growths(value, seen[1])
+                self.count += count
+                self.containers[id(value)] = (value, capacity)
+
+    def trace(self, frame, event, arg):
+        if event == "call":
+            if frame.f_code.co_filename != self.filename:
+                return None
+            frame.f_trace_opcodes = True
+            return self.trace
+        if event == "opcode":
+            code = frame.f_code
+            bytecode = self.opcodes.get(code)
+            if bytecode is None:
+                bytecode = self.opcodes[code] = code.co_code
+            if dis.opname[bytecode[frame.f_lasti]] in self.OPCODES:
+                self.count += 1
+        elif event == "line":
+            self.check_locals(frame)
+        elif event == "return":
+            self.check_locals(frame)
+            if frame.f_code.co_name in ("<listcomp>", "<dictcomp>") and arg is not None:
+                self.count += self.growths(arg, 0)[0]
+        return self.trace
+
+    def profile(self, frame, event, arg):
+        if event == "c_call" and frame.f_code.co_filename == self.filename:
+            if getattr(arg, "__qualname__", "") in self.CALLS:
+                self.count += 1
+
+    def run(self, function, *args):
+        sys.settrace(self.trace)
+        sys.setprofile(self.profile)
+        try:
+            return function(*args)
+        finally:
+            sys.setprofile(None)
+            sys.settrace(None)
+            self.containers.clear()
+
+
+def measure(parser, filename, path, repeat):
+    """(result, seconds, allocations, peak bytes) of one parser on one file"""
+    with silenced():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = parser(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        counter = AllocCounter(filename)
+        counter.run(parser, path)
+        tracemalloc.start()
+        try:
+            parser(path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, counter.count, peak
+
+
+def build_corpus(directory, quick):
+    """[(name, path, reference sections)], the files written to directory"""
+    sizes = (1, 64, 1024) if quick else SIZES
+    lengths = (64, "mixed") if quick else RECORD_LENGTHS
+    corpus = []
+    seed = 0
+    base_text = None
+    for instructions in sizes:
+        for dense in (True, False):
+            for length in lengths:
+                seed += 1
+                sections, text = make_image(instructions, dense, length, seed)
+                name = f"{instructions}i-{'dense' if dense else 'sparse'}-r{length}"
+                if reference_parse(text) != sections:
+                    raise RuntimeError(f"reference parser disagrees with the generator on {name}")
+                corpus.append((name, text))
+                if instructions == 64 and dense and base_text is None:
+                    base_text = text
+    corpus += [(f"bad:{name}", text) for name, text in malformed_variants(base_text)]
+    entries = []
+    for name, text in corpus:
+        path = os.path.join(directory, name.replace(":", "-") + ".hex")
+        with open(path, "w", newline="") as f:
+            f.write(text)
+        entries.append((name, path, reference_parse(text)))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed parses per image, the fastest counts")
+    parser.add_argument("--quick", action="store_true", help="fewer sizes and record lengths")
+    parser.add_argument("--corpus", metavar="DIR", help="write the corpus here and keep it")
+    args = parser.parse_args()
+
+    firmwares = {"disk-hid": DISK_HID_CODE, "disk-mode": DISK_MODE_CODE}
+    parsers = {name: (load_firmware(path, f"fw_{name.replace('-', '_')}").read_fxcore_hex_file, path)
+               for name, path in firmwares.items()}
+
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.corpus or scratch
+        os.makedirs(directory, exist_ok=True)
+        corpus = build_corpus(directory, args.quick)
+
+        header = f"{'image':<26} {'KB':>6}"
+        for name in parsers:
+            header += f" | {name + ' us/KB':>15} {'allocs':>7} {'peak KB':>8} {'match':>5}"
+        print(header)
+        totals = {name: [0.0, 0, 0, 0] for name in parsers}    # seconds, KB, allocs, mismatches
+        for image, path, expected in corpus:
+            kb = os.path.getsize(path) / 1024
+            line = f"{image:<26} {kb:>6.1f}"
+            for name, (parse, filename) in parsers.items():
+                result, seconds, allocs, peak = measure(parse, filename, path, args.repeat)
+                match = same(result, expected)
+                per_kb = seconds * 1e6 / kb if kb else 0.0
+                line += f" | {per_kb:>15.0f} {allocs:>7} {peak / 1024:>8.1f} {'yes' if match else 'NO':>5}"
+                total = totals[name]
+                total[0] += seconds
+                total[1] += kb
+                total[2] += allocs
+                total[3] += not match
+            print(line)
+        print()
+        for name, (seconds, kb, allocs, mismatches) in totals.items():
+            print(f"{name:<10} {seconds * 1e6 / kb:>8.0f} us/KB overall, {allocs / kb:>7.0f} allocations/KB, "
+                  f"{mismatches} of {len(corpus)} images differ from the reference")
+
+
+if __name__ == "__main__":
+    main()
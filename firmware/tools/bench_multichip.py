@@ -0,0 +1,108 @@
+"""
+Multi-chip programming benchmark.
+
+Programs the same image into 1..N FXCores on one I2C bus, once with the
+jobs awaited one after another (one chip at a time, as before the pipeline
+had per-chip lanes) and once submitted together so the pipeline interleaves
+them. Runs the unmodified disk-hid code.py against stand-in hardware:
+
+    python3 bench_multichip.py                     # RAM runs, 1-4 chips
+    python3 bench_multichip.py --mode flash --chips 8 --frequency 400000
+    python3 bench_multichip.py --buses 2          # chips alternate between buses
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fwload import FIRMWARE_DIR, load_firmware, silenced
+
+DEFAULT_HEX = os.path.join(os.path.dirname(FIRMWARE_DIR), "test_programs", "alternate-blink.hex")
+FIRST_ADDRESS = 0x30
+
+
+class AckingFXCore:
+    """
+    Minimal FXCore peripheral: acknowledges everything and reports the last
+    command in its status so the firmware's state machine follows along.
+    """
+    def __init__(self, device_id=0x1234):
+        self.status = bytearray(12)
+        self.status[0] = 0x20
+        self.status[6] = device_id & 0xFF
+        self.status[7] = device_id >> 8
+
+    def write(self, data):
+        if len(data) in (2, 3):
+            self.status[2] = data[0]
+            self.status[3] = data[1]
+
+    def read_into(self, buffer):
+        length = min(len(buffer), len(self.status))
+        buffer[:length] = self.status[:length]
+
+
+async def program_chips(fw, addresses, image, mode, interleaved):
+    """Program every address, returns the wall time in seconds"""
+    runner = asyncio.create_task(fw.pipeline.run())
+    location = 0 if mode == "flash" else None
+    start = time.monotonic()
+    if interleaved:
+        jobs = [fw.pipeline.submit(mode, image, location, address) for address in addresses]
+        for job in jobs:
+            await job.done.wait()
+    else:
+        jobs = []
+        for address in addresses:
+            job = fw.pipeline.submit(mode, image, location, address)
+            await job.done.wait()
+            jobs.append(job)
+    elapsed = time.monotonic() - start
+    runner.cancel()
+    failed = [hex(job.address) for job in jobs if not job.result]
+    if failed:
+        raise RuntimeError(f"programming failed for {', '.join(failed)}")
+    return elapsed
+
+
+def run_case(hex_file, chips, mode, interleaved, frequency, buses=1):
+    """
+    Fresh firmware instance with chips FXCores spread over buses I2C buses,
+    returns (seconds, busiest bus seconds)
+    """
+    fw = load_firmware()
+    wires = [fw.i2c] + [fw.busio.I2C() for _ in range(buses - 1)]
+    addresses = [FIRST_ADDRESS + index for index in range(chips)]
+    for index, wire in enumerate(wires):
+        wire.frequency = frequency
+        if index > 0:
+            fw.add_i2c_bus(wire, addresses[index::buses], f"I2C{index}")
+    for index, address in enumerate(addresses):
+        fw.add_fxcore_target(address)
+        wires[index % buses].attach(address, AckingFXCore())
+    with silenced():
+        image = fw.read_fxcore_hex_file(hex_file)
+        elapsed = asyncio.run(program_chips(fw, addresses, image, mode, interleaved))
+    return elapsed, max(wire.bus_time for wire in wires)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hex", default=DEFAULT_HEX, help="image to program")
+    parser.add_argument("--chips", type=int, default=4, help="largest number of FXCores")
+    parser.add_argument("--mode", choices=("ram", "flash"), default="ram")
+    parser.add_argument("--frequency", type=int, default=100000, help="I2C clock in Hz")
+    parser.add_argument("--buses", type=int, default=1, choices=(1, 2), help="I2C buses the chips are spread over")
+    args = parser.parse_args()
+
+    print(f"{os.path.basename(args.hex)}, {args.mode} upload, I2C {args.frequency // 1000} kHz, {args.buses} bus(es)")
+    print(f"{'chips':>5} {'sequential':>11} {'interleaved':>12} {'speedup':>8} {'busiest bus':>12}")
+    for chips in range(1, args.chips + 1):
+        sequential, _ = run_case(args.hex, chips, args.mode, False, args.frequency, args.buses)
+        interleaved, bus_time = run_case(args.hex, chips, args.mode, True, args.frequency, args.buses)
+        print(f"{chips:>5} {sequential:>10.3f}s {interleaved:>11.3f}s {sequential / interleaved:>7.2f}x "
+              f"{100 * bus_time / interleaved:>11.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Replay benchmark for the FT260 emulator.
+
+Feeds recorded host sessions, report by report, into
+SmartFT260Emulator.process_reports() of the unmodified disk-hid code.py
+on stand-in hardware. Programming jobs a report starts run to completion
+before the next report, as they would while the host polls. Per session it
+reports reports/s and the report handling time, the bytes allocated per
+report (tracemalloc, a separate run so the tracing doesn't skew the
+timing) and the exact I2C transaction stream, data included:
+
+    python3 bench_replay.py                         # built-in sessions
+    python3 bench_replay.py --stream upload         # print the I2C stream
+    python3 bench_replay.py --session capture.json  # replay a capture
+    python3 bench_replay.py --save baseline.json
+    python3 bench_replay.py --check baseline.json   # exit 1 if a stream changed
+
+Built-in sessions: ``upload`` (RAM run as the web programmer sends it),
+``flash`` (upload and WRITE_PRG), ``passthrough`` (status polls, EEPROM
+writes and reads) and ``errors`` (NACKs, short and malformed reports).
+--session takes the JSON of ``fxcore_capture.py --json`` (the received
+reports are replayed) or a list of ``[report_id, hex payload]``.
+
+The FXCore status cache TTL is pinned so that host status polls hit or
+miss the cache the same way in every run; --live-ttl keeps the firmware's.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import zlib
+
+import ft260_reports
+from bench_multichip import DEFAULT_HEX, AckingFXCore
+from fwload import load_firmware, silenced
+
+FXCORE = ft260_reports.FXCORE_ADDRESS
+EEPROM_ADDRESS = 0x50
+ABSENT_ADDRESS = 0x51
+ALLOC_NOISE = 0.1           # allocation changes below this fraction are run-to-run noise
+
+
+class EEPROM:
+    """24C02-style peripheral: the first written byte sets the address pointer"""
+    def __init__(self, size=256):
+        self.memory = bytearray(size)
+        self.pointer = 0
+
+    def write(self, data):
+        if not data:
+            return
+        self.pointer = data[0]
+        for byte in data[1:]:
+            self.memory[self.pointer] = byte
+            self.pointer = (self.pointer + 1) % len(self.memory)
+
+    def read_into(self, buffer):
+        for i in range(len(buffer)):
+            buffer[i] = self.memory[self.pointer]
+            self.pointer = (self.pointer + 1) % len(self.memory)
+
+
+def status_poll(address=FXCORE):
+    return ft260_reports.c2_read(address, 12)
+
+
+def upload_session(image, run=True):
+    """plain_upload() with a status poll after every command, like the web programmer"""
+    reports = []
+    for report in ft260_reports.plain_upload(image, run=run):
+        reports.append(report)
+        if report[0] == 0xD0 and report[1][1] == ft260_reports.FLAG_START_AND_STOP:
+            reports.append(status_poll())
+    return reports
+
+
+def passthrough_session():
+    reports = [status_poll() for _ in range(8)]
+    for offset in range(0, 64, 16):
+        data = bytes(range(offset, offset + 16))
+        reports.append(ft260_reports.d0_write(EEPROM_ADDRESS, bytes([offset]) + data))
+    for offset in range(0, 64, 16):
+        reports.append(ft260_reports.d0_write(EEPROM_ADDRESS, bytes([offset]), ft260_reports.FLAG_START))
+        reports.append(ft260_reports.c2_read(EEPROM_ADDRESS, 16))
+    reports.append(ft260_reports.c2_read(EEPROM_ADDRESS, 60))
+    return reports + [status_poll() for _ in range(8)]
+
+
+def errors_session():
+    return [
+        ft260_reports.c2_read(ABSENT_ADDRESS, 4),                   # NACK on read
+        ft260_reports.d0_write(ABSENT_ADDRESS, b"\x00\x01"),        # NACK on write
+        (0xC2, bytes([FXCORE, 0x06])),                              # C2 too short
+        (0xD0, bytes([FXCORE, 0x06, 60])),                          # D0 length without data
+        (0xA1, bytes(63)),                                          # ignored report
+        ft260_reports.d0_write(FXCORE, b"\xE9\x00"),                # unknown extension
+        ft260_reports.c2_read(FXCORE, 2),
+        ft260_reports.d0_write(FXCORE, b"\xE6\x00"),                # truncated trace read
+        ft260_reports.c2_read(FXCORE, 2),
+        ft260_reports.d0_write(FXCORE, b"\xA5\x5A\x30"),            # ENTER_PRG
+        ft260_reports.d0_write(FXCORE, b"\x04\x7F"),                # MREG, then too little data
+        ft260_reports.d0_write(FXCORE, bytes(20), ft260_reports.FLAG_START),
+        ft260_reports.d0_write(FXCORE, b"\x5A\xA5"),                # EXIT_PRG mid-section
+        status_poll(),
+        ft260_reports.d0_write(FXCORE, b"\x0E\x00"),                # RETURN_0
+        status_poll(),
+    ]
+
+
+def load_session(path):
+    """Reports of a session file, payloads padded to the report size"""
+    with open(path) as f:
+        entries = json.load(f)
+    reports = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            if entry.get("kind") != "in":
+                continue
+            report_id, payload = entry["report_id"], bytes.fromhex(entry["payload"])
+        else:
+            report_id, payload = entry[0], bytes.fromhex(entry[1])
+        reports.append((report_id, payload.ljust(ft260_reports.REPORT_SIZE, b"\x00")))
+    return reports
+
+
+def builtin_sessions(hex_file):
+    with silenced():
+        image = load_firmware().read_fxcore_hex_file(hex_file)
+    flash = upload_session(image, run=False) + [ft260_reports.d0_write(FXCORE, b"\x0C\x00"), status_poll()]
+    return {"upload": upload_session(image), "flash": flash,
+            "passthrough": passthrough_session(), "errors": errors_session()}
+
+
+def stream_lines(log):
+    """Text form of the I2C data log, one transfer per line"""
+    return [f"{address:02X} {direction} {data.hex()}" + ("" if ok else " NACK")
+            for address, direction, data, ok in log]
+
+
+async def replay(fw, reports, measure):
+    """Feed the reports one by one, returns measure(report) per report"""
+    runner = asyncio.create_task(fw.pipeline.run())
+    device = fw.ft260.hid_device
+    results = []
+    for report_id, payload in reports:
+        device.queue_report(report_id, payload)
+        results.append(measure(fw.ft260.process_reports))
+        while fw.pipeline.jobs or fw.pipeline.active or (fw.ft260.batch is not None and fw.ft260.batch.running):
+            await asyncio.sleep(0.001)
+    runner.cancel()
+    return results
+
+
+def run_session(reports, measure, live_ttl=False):
+    """Fresh firmware and peripherals, returns (measurements, I2C stream lines)"""
+    fw = load_firmware()
+    fw.i2c.realtime = False
+    fw.i2c.attach(FXCORE, AckingFXCore())
+    fw.i2c.attach(EEPROM_ADDRESS, EEPROM())
+    if not live_ttl:
+        for target in fw.fxcore_targets.values():
+            target.status_cache.ttl_ns = 1 << 62
+    fw.i2c.data_log = []
+    with silenced():
+        results = asyncio.run(replay(fw, reports, measure))
+    return results, stream_lines(fw.i2c.data_log)
+
+
+def timed(process):
+    start = time.perf_counter_ns()
+    process()
+    return time.perf_counter_ns() - start
+
+
+def allocated(process):
+    """(bytes allocated while handling the report at peak, bytes still held after)"""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    process()
+    current, peak = tracemalloc.get_traced_memory()
+    return peak - before, current - before
+
+
+def bench(name, reports, repeat, live_ttl):
+    """Numbers and stream of one session"""
+    times = []
+    streams = set()
+    for _ in range(repeat):
+        ns, stream = run_session(reports, timed, live_ttl)
+        times.append(ns)
+        streams.add(tuple(stream))
+    tracemalloc.start()
+    try:
+        allocations, stream = run_session(reports, allocated, live_ttl)
+    finally:
+        tracemalloc.stop()
+    streams.add(tuple(stream))
+    per_report = [min(run[i] for run in times) for i in range(len(reports))]
+    transient = [a for a, _ in allocations]
+    return {
+        "session": name,
+        "reports": len(reports),
+        "reports_per_s": round(len(reports) / (sum(per_report) / 1e9)),
+        "p50_us": round(statistics.median(per_report) / 1000, 1),
+        "max_us": round(max(per_report) / 1000, 1),
+        "alloc_per_report": round(statistics.mean(transient)),
+        "alloc_max": max(transient),
+        "retained": sum(r for _, r in allocations),
+        "transfers": len(stream),
+        "stream_crc": f"{zlib.crc32(chr(10).join(stream).encode()):08X}",
+        "deterministic": len(streams) == 1,
+        "stream": list(stream),
+    }
+
+
+def print_result(result):
+    flag = "" if result["deterministic"] else "  (stream differs between runs)"
+    print(f"{result['session']:<12} {result['reports']:>7} {result['reports_per_s']:>10,} "
+          f"{result['p50_us']:>8} {result['max_us']:>8} {result['alloc_per_report']:>10,} "
+          f"{result['alloc_max']:>9,} {result['retained']:>9,} {result['transfers']:>9} "
+          f"{result['stream_crc']:>9}{flag}")
+
+
+def check(results, path):
+    """Compare the streams with a saved baseline, returns True when all match"""
+    with open(path) as f:
+        baseline = {result["session"]: result for result in json.load(f)}
+    ok = True
+    for result in results:
+        saved = baseline.get(result["session"])
+        if saved is None:
+            print(f"{result['session']}: not in {path}")
+            continue
+        if saved["stream"] != result["stream"]:
+            ok = False
+            index = next((i for i, (a, b) in enumerate(zip(saved["stream"], result["stream"])) if a != b),
+                         min(len(saved["stream"]), len(result["stream"])))
+            print(f"{result['session']}: I2C stream changed at transfer {index}")
+            print(f"  baseline: {saved['stream'][index] if index < len(saved['stream']) else '(end)'}")
+            print(f"  now:      {result['stream'][index] if index < len(result['stream']) else '(end)'}")
+        change = result["alloc_per_report"] - saved["alloc_per_report"]
+        if abs(change) > ALLOC_NOISE * saved["alloc_per_report"]:
+            print(f"{result['session']}: {change:+,} bytes allocated per report")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hex", default=DEFAULT_HEX, help="image of the upload sessions")
+    parser.add_argument("--session", action="append", default=[], metavar="FILE",
+                        help="replay a recorded session instead of the built-in ones")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per session, the fastest counts")
+    parser.add_argument("--stream", metavar="SESSION", help="print the I2C stream of a session")
+    parser.add_argument("--live-ttl", action="store_true", help="keep the firmware's status cache TTL")
+    parser.add_argument("--save", metavar="FILE", help="write the results and streams as JSON")
+    parser.add_argument("--check", metavar="FILE", help="compare the streams with a saved run")
+    args = parser.parse_args()
+
+    if args.session:
+        sessions = {os.path.basename(path): load_session(path) for path in args.session}
+    else:
+        sessions = builtin_sessions(args.hex)
+
+    print(f"{'session':<12} {'reports':>7} {'reports/s':>10} {'p50 us':>8} {'max us':>8} "
+          f"{'alloc B/r':>10} {'alloc max':>9} {'retained':>9} {'transfers':>9} {'stream':>9}")
+    results = []
+    for name, reports in sessions.items():
+        result = bench(name, reports, args.repeat, args.live_ttl)
+        print_result(result)
+        results.append(result)
+
+    if args.stream:
+        for result in results:
+            if result["session"] == args.stream:
+                print("\n".join(result["stream"]))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.check and not check(results, args.check):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+End-to-end upload latency benchmark against the FXCore simulator.
+
+Runs execute_unified_programming() of the unmodified disk-hid code.py
+against FXCoreSim on the busio stand-in, which blocks for the wire time at
+the configured clock, and splits the wall time of each upload into:
+
+    sleeps    asyncio.sleep() in the firmware (settle, command and flash waits, LED blinks)
+    bus       I2C wire time at the bus clock
+    stretch   transfers held while the simulated chip was busy
+    cpu       process CPU time (firmware, stand-ins, simulator)
+
+The rest is event loop overhead (CPU time spent inside a sleep() call
+counts twice, so it can come out slightly negative). The image is passed
+parsed, hex parsing is not included.
+
+    python3 bench_upload.py                            # RAM and flash, 100/400/1000 kHz
+    python3 bench_upload.py --image full --sleeps      # 1024 instructions, sleeps by function
+    python3 bench_upload.py --timing write_prg=0.25 --busy nack
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from bench_multichip import DEFAULT_HEX
+from fwload import load_firmware, silenced
+from fxcore_sim import TIMING, FXCoreSim
+
+ADDRESS = 0x30
+
+
+class SleepMeter:
+    """Stands in for the firmware's asyncio module and times sleep() per calling function"""
+    def __init__(self, module):
+        self.module = module
+        self.sites = {}
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    async def sleep(self, delay):
+        caller = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        await self.module.sleep(delay)
+        self.sites[caller] = self.sites.get(caller, 0.0) + time.perf_counter() - start
+
+
+def section(data):
+    """Section bytes plus the little-endian sum checksum"""
+    return bytearray(data) + (sum(data) & 0xFFFF).to_bytes(2, "little")
+
+
+def full_image(instructions=1024, seed=1):
+    """Image with every section full, in the dict form read_fxcore_hex_file() returns"""
+    rng = random.Random(seed)
+    program = section(rng.randbytes(instructions * 4))
+    return {
+        "cregs": section(rng.randbytes(64)),
+        "mregs": section(rng.randbytes(512)),
+        "sfrs": section(rng.randbytes(48)),
+        "instructions": [int.from_bytes(program[i:i + 4], "little") for i in range(0, instructions * 4, 4)],
+        "program_data": program,
+        "filename": "synthetic full image",
+    }
+
+
+async def upload(fw, image, mode):
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    location = 0 if mode == "flash" else None
+    result = await fw.execute_unified_programming(image, mode, location, address=ADDRESS, force=True)
+    return result, time.perf_counter() - start_wall, time.process_time() - start_cpu
+
+
+def run_case(image, mode, frequency, timing, busy):
+    """One upload on fresh firmware, returns a dict of the breakdown"""
+    fw = load_firmware()
+    chip = FXCoreSim(timing, busy)
+    fw.i2c.frequency = frequency
+    fw.i2c.attach(ADDRESS, chip)
+    meter = SleepMeter(fw.asyncio)
+    fw.asyncio = meter
+    with silenced():
+        result, wall, cpu = asyncio.run(upload(fw, image, mode))
+    sleeps = sum(meter.sites.values())
+    expected = "RUN_RAM" if mode == "ram" else "RUN_FLASH"
+    ok = result and chip.mode == expected and not chip.errors
+    if ok and mode == "flash":
+        ok = chip.slots.get(0) == bytes(image["program_data"])
+    return {
+        "ok": ok, "wall": wall, "sleeps": sleeps, "bus": fw.i2c.bus_time,
+        "stretch": chip.stretch_time, "cpu": cpu, "transfers": len(fw.i2c.transactions),
+        "errors": chip.errors, "nacks": chip.nacks, "sites": meter.sites,
+    }
+
+
+def parse_timing(values):
+    timing = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        if name not in TIMING:
+            raise SystemExit(f"unknown timing {name}, one of {', '.join(TIMING)}")
+        timing[name] = float(seconds)
+    return timing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hex", default=DEFAULT_HEX, help="image to upload")
+    parser.add_argument("--image", choices=("hex", "full"), default="hex",
+                        help="the hex file, or a synthetic image with all 1024 instructions")
+    parser.add_argument("--mode", choices=("ram", "flash", "both"), default="both")
+    parser.add_argument("--frequency", type=int, action="append", help="I2C clock in Hz, repeatable")
+    parser.add_argument("--timing", action="append", default=[], metavar="NAME=SECONDS",
+                        help=f"override a chip timing ({', '.join(TIMING)})")
+    parser.add_argument("--busy", choices=("stretch", "nack"), default="stretch",
+                        help="what the chip does with a transfer while busy")
+    parser.add_argument("--sleeps", action="store_true", help="break the sleeps down by function")
+    args = parser.parse_args()
+
+    if args.image == "full":
+        image = full_image()
+    else:
+        with silenced():
+            image = load_firmware().read_fxcore_hex_file(args.hex)
+    modes = ("ram", "flash") if args.mode == "both" else (args.mode,)
+    frequencies = args.frequency or [100000, 400000, 1000000]
+    timing = parse_timing(args.timing)
+
+    print(f"{image['filename']}: {len(image['instructions'])} instructions, chip busy -> {args.busy}")
+    print(f"{'mode':<6} {'kHz':>5} {'wall ms':>8} {'sleeps':>8} {'bus':>8} {'stretch':>8} "
+          f"{'cpu':>8} {'other':>7} {'xfers':>6}  result")
+    for mode in modes:
+        for frequency in frequencies:
+            case = run_case(image, mode, frequency, timing, args.busy)
+            other = case["wall"] - case["sleeps"] - case["bus"] - case["stretch"] - case["cpu"]
+            result = "ok" if case["ok"] else f"FAILED {case['errors']} {case['nacks']} NACKs"
+            print(f"{mode:<6} {frequency // 1000:>5} {case['wall'] * 1000:>8.1f} {case['sleeps'] * 1000:>8.1f} "
+                  f"{case['bus'] * 1000:>8.1f} {case['stretch'] * 1000:>8.1f} {case['cpu'] * 1000:>8.1f} "
+                  f"{other * 1000:>7.1f} {case['transfers']:>6}  {result}")
+            if args.sleeps:
+                for site, seconds in sorted(case["sites"].items(), key=lambda item: -item[1]):
+                    print(f"{'':>14} {site:<28} {seconds * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Host-side FT260 report builders, matching what the web programmer sends.
+
+Reports are (report_id, 63-byte payload) tuples that can be queued into the
+usb_hid stand-in or written to a real device.
+"""
+REPORT_SIZE = 63
+CHUNK_SIZE = 60             # I2C payload bytes per D0 report
+
+FLAG_START = 0x02
+FLAG_CONTINUE = 0x00
+FLAG_STOP = 0x04
+FLAG_START_AND_STOP = 0x06
+
+FXCORE_ADDRESS = 0x30
+
+
+def d0_write(address, data, flag=FLAG_START_AND_STOP):
+    """One D0 report: I2C write of up to 60 bytes"""
+    if len(data) > CHUNK_SIZE:
+        raise ValueError(f"D0 report carries at most {CHUNK_SIZE} bytes, got {len(data)}")
+    report = bytearray(REPORT_SIZE)
+    report[0] = address
+    report[1] = flag
+    report[2] = len(data)
+    report[3:3 + len(data)] = data
+    return (0xD0, bytes(report))
+
+
+def d0_transfer(address, data):
+    """D0 reports for one I2C write of any length (START ... STOP)"""
+    if len(data) <= CHUNK_SIZE:
+        return [d0_write(address, data)]
+    reports = [d0_write(address, data[:CHUNK_SIZE], FLAG_START)]
+    offset = CHUNK_SIZE
+    while len(data) - offset > CHUNK_SIZE:
+        reports.append(d0_write(address, data[offset:offset + CHUNK_SIZE], FLAG_CONTINUE))
+        offset += CHUNK_SIZE
+    reports.append(d0_write(address, data[offset:], FLAG_STOP))
+    return reports
+
+
+def c2_read(address, length):
+    """C2 report: I2C read request of length bytes"""
+    report = bytearray(REPORT_SIZE)
+    report[0] = address
+    report[1] = FLAG_START_AND_STOP
+    report[2] = length & 0xFF
+    report[3] = length >> 8
+    return (0xC2, bytes(report))
+
+
+def section_commands(sections):
+    """(xfer command, data) pairs for the sections of a parsed image, in upload order"""
+    commands = []
+    if len(sections["mregs"]) == 514:
+        commands.append((bytes([0x04, 0x7F]), sections["mregs"]))
+    if len(sections["cregs"]) == 66:
+        commands.append((bytes([0x01, 0x0F]), sections["cregs"]))
+    if len(sections["sfrs"]) == 50:
+        commands.append((bytes([0x02, 0x0B]), sections["sfrs"]))
+    program = sections.get("program_data", b"")
+    if len(program) >= 6:
+        value = 0x0800 + (len(program) - 2) // 4 - 1
+        commands.append((bytes([value >> 8, value & 0xFF]), program))
+    return commands
+
+
+def plain_upload(sections, address=FXCORE_ADDRESS, run=True):
+    """Reports for an uncompressed upload: ENTER_PRG, sections, EXEC_FROM_RAM"""
+    reports = [d0_write(address, bytes([0xA5, 0x5A, address]))]
+    for command, data in section_commands(sections):
+        reports.append(d0_write(address, command))
+        reports.extend(d0_transfer(address, data))
+    if run:
+        reports.append(d0_write(address, bytes([0x0D, 0x00])))
+    return reports
+
+
+def preset_run(crc, force=False, address=FXCORE_ADDRESS):
+    """E3 extension: run the preset cached under image CRC crc"""
+    return d0_write(address, bytes([0xE3]) + crc.to_bytes(4, "little") + bytes([0x01 if force else 0x00]))
+
+
+def preset_list(start=0, address=FXCORE_ADDRESS):
+    """E4 extension plus the C2 read that fetches the reply"""
+    return [d0_write(address, bytes([0xE4, start])), c2_read(address, 62)]
+
+
+def parse_preset_list(payload):
+    """(cached image count, CRCs in this reply) from the C2 input report payload of an E4 reply"""
+    reply = payload[1:1 + payload[0]]
+    if len(reply) < 3 or reply[0] != 0xE4 or reply[1] != 0:
+        raise ValueError(f"bad preset list reply {bytes(reply).hex()}")
+    return reply[2], [int.from_bytes(reply[i:i + 4], "little") for i in range(3, len(reply), 4)]
+
+
+# I2C batch scripts (E5): ops run on the device, one reply for all of them
+def batch_write(address, data):
+    return bytes([0x01, address, len(data)]) + bytes(data)
+
+
+def batch_read(address, count):
+    return bytes([0x02, address, count])
+
+
+def batch_write_read(address, data, count):
+    return bytes([0x03, address, len(data), count]) + bytes(data)
+
+
+def batch_poll(address, count, index, mask, value, timeout_ms):
+    """Read count bytes until byte index & mask == value, NACKs count as not ready"""
+    return bytes([0x04, address, count, index, mask, value, timeout_ms & 0xFF, timeout_ms >> 8])
+
+
+def batch_delay(us):
+    return bytes([0x05, us & 0xFF, us >> 8])
+
+
+def batch(ops, address=FXCORE_ADDRESS, reply_length=60):
+    """Reports that run a script of batch ops and read the first reply chunk"""
+    script = b"".join(ops)
+    first = bytes([0xE5, len(script) & 0xFF, len(script) >> 8]) + script
+    reports = [d0_write(address, first[:CHUNK_SIZE], FLAG_START_AND_STOP if len(first) <= CHUNK_SIZE else FLAG_START)]
+    rest = first[CHUNK_SIZE:]
+    while rest:
+        flag = FLAG_STOP if len(rest) <= CHUNK_SIZE else FLAG_CONTINUE
+        reports.append(d0_write(address, rest[:CHUNK_SIZE], flag))
+        rest = rest[CHUNK_SIZE:]
+    reports.append(c2_read(address, reply_length))
+    return reports
+
+
+def parse_batch_reply(data):
+    """(result, per-op results, read data) from the concatenated C2 reply bytes"""
+    if len(data) < 3 or data[0] != 0xE5:
+        raise ValueError(f"bad batch reply {bytes(data[:8]).hex()}")
+    count = data[2]
+    return data[1], bytes(data[3:3 + count]), bytes(data[3 + count:])
+
+
+PERF_COUNTERS = ("uptime_ms", "reports_received", "reports_dropped", "bytes_from_host",
+                 "bytes_to_host", "i2c_transactions", "i2c_errors", "retries", "contended",
+                 "lock_wait_us", "uploads_ram", "uploads_flash", "upload_failures",
+                 "uploads_skipped", "superseded")
+# Latency page -> its two phases
+PERF_PHASES = {1: ("section", "flash_write"), 3: ("ram_job", "flash_job")}
+PERF_MEMORY = ("mem_free", "low_water_reports", "low_water_upload", "low_water_idle",
+               "collections", "forced_collections", "collect_max_us", "report_max_us")
+
+
+def perf_request(page=0, reset=False):
+    """SET_FEATURE 0x01 that publishes a counters page (optionally resetting first)"""
+    report = bytearray(REPORT_SIZE)
+    report[0] = 0x01 if reset else 0x00
+    report[1] = page
+    return (0x01, bytes(report))
+
+
+def parse_perf(report):
+    """dict of the counters in a GET_FEATURE 0x01 report"""
+    values = [int.from_bytes(report[i:i + 4], "little") for i in range(1, len(report) - 3, 4)]
+    if report[0] == 2:
+        return dict(zip(PERF_MEMORY, values))
+    if report[0] in PERF_PHASES:
+        return {phase: dict(zip(("count", "min_us", "avg_us", "max_us"), values[i * 4:i * 4 + 4]))
+                for i, phase in enumerate(PERF_PHASES[report[0]])}
+    return dict(zip(PERF_COUNTERS, values))
+
+
+def trace_read(start, count, address=FXCORE_ADDRESS):
+    """E6 extension for count span trace events from index start, plus the C2 reads of the reply"""
+    reply_length = 5 + 8 * count
+    reports = [d0_write(address, bytes([0xE6, start & 0xFF, start >> 8, count]))]
+    for offset in range(0, reply_length, CHUNK_SIZE):
+        reports.append(c2_read(address, min(CHUNK_SIZE, reply_length - offset)))
+    return reports
+
+
+def parse_trace_reply(data):
+    """(events held on the device, raw 8-byte event records) from the concatenated C2 reply bytes"""
+    if len(data) < 5 or data[0] != 0xE6 or data[1] != 0:
+        raise ValueError(f"bad trace reply {bytes(data[:8]).hex()}")
+    return data[2] | (data[3] << 8), bytes(data[5:5 + 8 * data[4]])
+
+
+SELF_TEST_WRITE_SIZES = (16, 64, 514)
+
+
+def self_test(address=FXCORE_ADDRESS):
+    """E7 extension: queue an I2C self-test, the results arrive as input report 0xB9"""
+    return d0_write(address, bytes([0xE7, 0x00]))
+
+
+def parse_self_test(report):
+    """dict of the results in a 0xB9 input report"""
+    values = [int.from_bytes(report[i:i + 4], "little") for i in range(4, 60, 4)]
+    results = {"result": report[0], "address": report[1], "total_ms": values[0],
+               "status_p50_us": values[1], "status_p99_us": values[2],
+               "upload_bytes_per_s": values[12], "upload_us": values[13]}
+    for index, size in enumerate(SELF_TEST_WRITE_SIZES):
+        rate, p50, p99 = values[3 + index * 3:6 + index * 3]
+        results[f"write{size}"] = {"bytes_per_s": rate, "p50_us": p50, "p99_us": p99}
+    return results
+
+
+CAPTURE_READ_MAX = 55
+
+
+def capture_control(start, address=FXCORE_ADDRESS):
+    """E8 extension starting (clears the ring) or stopping traffic capture, plus the C2 read of the reply"""
+    return [d0_write(address, bytes([0xE8, 0x01 if start else 0x00])), c2_read(address, 8)]
+
+
+def parse_capture_status(data):
+    """(bytes held, records, dropped records) from an E8 start/stop reply"""
+    if len(data) < 8 or data[0] != 0xE8 or data[1] != 0:
+        raise ValueError(f"bad capture reply {bytes(data[:8]).hex()}")
+    return data[2] | (data[3] << 8), data[4] | (data[5] << 8), data[6] | (data[7] << 8)
+
+
+def capture_read(offset, count=CAPTURE_READ_MAX, address=FXCORE_ADDRESS):
+    """E8 extension for count bytes of capture records from offset, plus the C2 read of the reply"""
+    return [d0_write(address, bytes([0xE8, 0x02, offset & 0xFF, offset >> 8, count])),
+            c2_read(address, 5 + count)]
+
+
+def parse_capture_reply(data):
+    """(bytes held on the device, record bytes) from an E8 read reply"""
+    if len(data) < 5 or data[0] != 0xE8 or data[1] != 0:
+        raise ValueError(f"bad capture reply {bytes(data[:8]).hex()}")
+    return data[2] | (data[3] << 8), bytes(data[5:5 + data[4]])
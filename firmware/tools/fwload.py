@@ -0,0 +1,64 @@
+"""
+Load the disk-hid firmware under CPython.
+
+The CircuitPython modules it imports (board, busio, usb_hid, ...) are taken
+from standins/, so code.py runs unmodified on a desktop machine. The module
+is imported under its own name and main() is not started. The optional
+feature modules next to code.py (cdc_transport, span_trace, ...) are found
+on its own directory, as on the board.
+"""
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+STANDINS_DIR = os.path.join(TOOLS_DIR, "standins")
+FIRMWARE_DIR = os.path.dirname(TOOLS_DIR)
+DISK_HID_CODE = os.path.join(FIRMWARE_DIR, "disk-hid", "src", "code.py")
+DISK_MODE_CODE = os.path.join(FIRMWARE_DIR, "disk-mode", "src", "code.py")
+# Modules code.py imports from its own directory, when their feature is on
+FIRMWARE_MODULES = ("cdc_transport", "midi_transport", "span_trace", "traffic_capture", "deterministic_memory",
+                    "batch_script", "self_test", "preset_cache")
+
+
+def use_standins():
+    """Put the stand-in modules first on sys.path"""
+    if STANDINS_DIR not in sys.path:
+        sys.path.insert(0, STANDINS_DIR)
+
+
+def load_firmware(path=DISK_HID_CODE, name="fxcore_fw", quiet=True):
+    """
+    Import a firmware code.py as a fresh module and return it.
+
+    Every call creates new module state (I2C bus, emulator, pipeline), so one
+    process can compare several configurations. With quiet=True the banner
+    and log output printed during import is swallowed.
+    """
+    use_standins()
+    source_dir = os.path.dirname(os.path.abspath(path))
+    if source_dir not in sys.path:
+        sys.path.insert(0, source_dir)
+    for module in ("busio", "usb_hid", "usb_cdc", "usb_midi") + FIRMWARE_MODULES:
+        # Fresh peripherals and feature modules for every firmware instance
+        sys.modules.pop(module, None)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    if quiet:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    else:
+        spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def silenced(enabled=True):
+    """Swallow firmware log output while the block runs"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
@@ -0,0 +1,200 @@
+"""
+Traffic capture decoder for the disk-hid firmware.
+
+With capture running (CAPTURE_TRAFFIC = True in code.py, or started from
+the host with extension command E8 01) the firmware records every HID
+report it receives or sends and every I2C transfer in a binary ring:
+
+    kind, body length, timestamp (us since boot, uint32 LE), body
+
+Reports (kind 1 in, 2 out) carry the report ID and the used part of the
+payload, I2C transfers (kind 3) address, op, result, write and read
+length and the duration in us. This tool stops the capture, reads the ring
+over the FT260 bridge and prints a timeline, or writes it as JSON:
+
+    python3 fxcore_capture.py --simulate ../../test_programs/alternate-blink.hex
+    python3 fxcore_capture.py --start               # from a board, needs hidapi
+    python3 fxcore_capture.py --json capture.json
+
+--simulate captures an upload sent as FT260 reports to the stand-ins.
+"""
+import argparse
+import asyncio
+import json
+
+import ft260_reports
+from fxcore_trace import USB_PID, USB_VID, hid_transact
+
+HEADER_SIZE = 6
+REPORT_IN = 0x01
+REPORT_OUT = 0x02
+I2C = 0x03
+OPS = ("write", "read", "write+read")
+RESULTS = ("ok", "error")
+COMMANDS = {(0xA5, 0x5A): "ENTER_PRG", (0x5A, 0xA5): "EXIT_PRG", (0x01, 0x0F): "XFER_CREG",
+            (0x04, 0x7F): "XFER_MREG", (0x02, 0x0B): "XFER_SFR", (0x0D, 0x00): "EXEC_FROM_RAM",
+            (0x0E, 0x00): "RETURN_0"}
+
+
+def parse_records(data):
+    """List of record dicts, timestamps unwrapped to a running microsecond count"""
+    records = []
+    offset = 0
+    last = None
+    wraps = 0
+    while offset + HEADER_SIZE <= len(data):
+        kind, length = data[offset], data[offset + 1]
+        timestamp = int.from_bytes(data[offset + 2:offset + 6], "little")
+        body = bytes(data[offset + HEADER_SIZE:offset + HEADER_SIZE + length])
+        offset += HEADER_SIZE + length
+        if len(body) < length:
+            break           # cut off at the end of the read
+        if last is not None and timestamp < last:
+            wraps += 1
+        last = timestamp
+        record = {"us": timestamp + (wraps << 32)}
+        if kind in (REPORT_IN, REPORT_OUT) and body:
+            record.update(kind="in" if kind == REPORT_IN else "out", report_id=body[0], payload=body[1:])
+        elif kind == I2C and len(body) >= 9:
+            record.update(kind="i2c", address=body[0], op=OPS[body[1]] if body[1] < len(OPS) else body[1],
+                          result=RESULTS[body[2]] if body[2] < len(RESULTS) else body[2],
+                          write=body[3] | (body[4] << 8), read=body[5] | (body[6] << 8),
+                          duration_us=body[7] | (body[8] << 8))
+        else:
+            record.update(kind=f"0x{kind:02X}", payload=body)
+        records.append(record)
+    return records
+
+
+def describe(record):
+    """One timeline line for a record"""
+    kind = record["kind"]
+    if kind == "i2c":
+        lengths = " ".join(f"{name} {record[name]}" for name in ("write", "read") if record[name])
+        return (f"I2C  0x{record['address']:02X} {record['op']:<10} {lengths:<18} "
+                f"{record['result']:<5} {record['duration_us']} us")
+    payload = record.get("payload", b"")
+    if kind not in ("in", "out"):
+        return f"{kind} {payload.hex(' ')}"
+    report_id = record["report_id"]
+    arrow = "->" if kind == "in" else "<-"
+    if report_id == 0xD0 and kind == "in" and len(payload) >= 3:
+        data = payload[3:]
+        name = COMMANDS.get(tuple(data[:2]), "")
+        if not name and data and 0x08 <= data[0] <= 0x0B:
+            name = "XFER_PRG"
+        elif not name and data and data[0] == 0x0C:
+            name = "WRITE_PRG"
+        elif not name and data and 0xE0 <= data[0] <= 0xEF:
+            name = f"ext E{data[0] & 0x0F:X}"
+        return f"{arrow} D0 0x{payload[0]:02X} flag {payload[1]:02X} {len(data):>2} bytes {name} {data[:8].hex(' ')}"
+    if report_id == 0xC2 and kind == "in" and len(payload) >= 4:
+        return f"{arrow} C2 0x{payload[0]:02X} read {payload[2] | (payload[3] << 8)} bytes"
+    if report_id == 0xC2 and payload:
+        return f"{arrow} C2 {payload[0]:>2} bytes {payload[1:1 + min(payload[0], 12)].hex(' ')}"
+    return f"{arrow} {report_id:02X} {payload[:12].hex(' ')}"
+
+
+def timeline(records):
+    """Text timeline, times in ms from the first record"""
+    if not records:
+        return []
+    first = records[0]["us"]
+    return [f"{(record['us'] - first) / 1000:10.3f} ms  {describe(record)}" for record in records]
+
+
+def fetch_records(transact, start=False, address=ft260_reports.FXCORE_ADDRESS):
+    """
+    Stop the capture and read the whole ring, or with start=True start a new
+    capture instead. transact(reports) sends the reports and returns the
+    payloads of the C2 input reports that came back.
+    """
+    payloads = transact(ft260_reports.capture_control(start, address))
+    held, _, dropped = ft260_reports.parse_capture_status(payloads[-1][1:1 + payloads[-1][0]])
+    if start:
+        return [], 0
+    data = b""
+    while len(data) < held:
+        payloads = transact(ft260_reports.capture_read(len(data), address=address))
+        held, chunk = ft260_reports.parse_capture_reply(payloads[-1][1:1 + payloads[-1][0]])
+        if not chunk:
+            break
+        data += chunk
+    return parse_records(data), dropped
+
+
+def simulate(hex_file):
+    """Capture an upload sent as FT260 reports to stand-in hardware, return (records, dropped)"""
+    from bench_multichip import AckingFXCore
+    from fwload import load_firmware, silenced
+
+    fw = load_firmware()
+    fw.i2c.attach(ft260_reports.FXCORE_ADDRESS, AckingFXCore())
+    device = fw.ft260.hid_device
+
+    async def run():
+        tasks = [asyncio.create_task(fw.hid_task()), asyncio.create_task(fw.pipeline.run())]
+
+        async def exchange(reports):
+            device.sent.clear()
+            for report in reports:
+                device.queue_report(*report)
+            while device.inbox or fw.pipeline.jobs or fw.pipeline.active:
+                await asyncio.sleep(0.001)
+            return [payload for report_id, payload in device.sent if report_id == 0xC2]
+
+        await exchange(ft260_reports.capture_control(True))
+        image = fw.read_fxcore_hex_file(hex_file)
+        await exchange(ft260_reports.plain_upload(image) +
+                       [ft260_reports.c2_read(ft260_reports.FXCORE_ADDRESS, 12)])
+
+        payloads = await exchange(ft260_reports.capture_control(False))
+        held, _, dropped = ft260_reports.parse_capture_status(payloads[-1][1:1 + payloads[-1][0]])
+        data = b""
+        while len(data) < held:
+            payloads = await exchange(ft260_reports.capture_read(len(data)))
+            held, chunk = ft260_reports.parse_capture_reply(payloads[-1][1:1 + payloads[-1][0]])
+            if not chunk:
+                break
+            data += chunk
+        for task in tasks:
+            task.cancel()
+        return parse_records(data), dropped
+
+    with silenced():
+        return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read and decode the firmware traffic capture")
+    parser.add_argument("--simulate", metavar="HEXFILE", help="capture an upload on stand-in hardware")
+    parser.add_argument("--start", action="store_true", help="start (and clear) a capture on the board")
+    parser.add_argument("--json", metavar="FILE", help="write the records as JSON instead of printing")
+    args = parser.parse_args()
+
+    if args.simulate:
+        records, dropped = simulate(args.simulate)
+    else:
+        import hid     # hidapi
+        device = hid.device()
+        device.open(USB_VID, USB_PID)
+        try:
+            records, dropped = fetch_records(hid_transact(device), args.start)
+        finally:
+            device.close()
+        if args.start:
+            print("capture started")
+            return
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([{key: value.hex() if isinstance(value, bytes) else value for key, value in record.items()}
+                       for record in records], f, indent=1)
+    else:
+        print("\n".join(timeline(records)))
+    i2c = sum(1 for record in records if record["kind"] == "i2c")
+    print(f"{len(records)} records ({i2c} I2C transfers), {dropped} older records dropped")
+
+
+if __name__ == "__main__":
+    main()
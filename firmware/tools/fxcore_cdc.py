@@ -0,0 +1,162 @@
+"""
+Host side of the disk-hid CDC data channel transport.
+
+Frames are ``'F' 'X' cmd seq len_lo len_hi payload crc32`` with the CRC-32
+little-endian over cmd..payload. The device answers every frame with
+cmd | 0x80, the same seq and ``[result, data...]`` (0 = ok). The data
+channel has to be enabled in boot.py (ENABLE_CDC_DATA = True).
+
+Upload a hex file and run it from RAM, or write it to a flash slot:
+
+    python3 fxcore_cdc.py /dev/ttyACM1 ../../test_programs/alternate-blink.hex
+    python3 fxcore_cdc.py /dev/ttyACM1 prog.hex --slot 3
+
+The serial port needs pyserial, frame building and parsing don't.
+"""
+import argparse
+import zlib
+
+MAGIC = b"FX"
+HEADER_SIZE = 6
+FXCORE_ADDRESS = 0x30
+
+CMD_PING = 0x00
+CMD_IMAGE = 0x10
+CMD_RUN = 0x11
+CMD_WRITE_SLOT = 0x12
+CMD_RUN_PRESET = 0x13
+CMD_STATUS = 0x20
+CMD_I2C_WRITE = 0x30
+CMD_I2C_READ = 0x31
+CMD_I2C_WRITE_READ = 0x32
+
+RESULTS = {0x00: "ok", 0x01: "CRC error", 0x02: "bad length", 0x03: "bad parameter",
+           0x04: "not cached", 0x05: "failed", 0x06: "busy", 0x07: "I2C error",
+           0x08: "unknown command"}
+
+
+class CDCError(Exception):
+    pass
+
+
+def frame(cmd, seq, payload=b""):
+    """One request frame"""
+    body = bytes([cmd, seq & 0xFF, len(payload) & 0xFF, len(payload) >> 8]) + bytes(payload)
+    return MAGIC + body + zlib.crc32(body).to_bytes(4, "little")
+
+
+def parse_frame(data):
+    """(cmd, seq, payload, frame size) of the frame at the start of data, None if incomplete"""
+    if len(data) < HEADER_SIZE:
+        return None
+    if data[0:2] != MAGIC:
+        raise CDCError(f"bad frame start {bytes(data[0:2]).hex()}")
+    length = data[4] | (data[5] << 8)
+    size = HEADER_SIZE + length + 4
+    if len(data) < size:
+        return None
+    if zlib.crc32(data[2:HEADER_SIZE + length]) != int.from_bytes(data[size - 4:size], "little"):
+        raise CDCError("reply CRC mismatch")
+    return data[2], data[3], bytes(data[HEADER_SIZE:HEADER_SIZE + length]), size
+
+
+def image_payload(sections):
+    """CMD_IMAGE payload for a parsed image: CREG, MREG, SFR, program data"""
+    cregs = bytes(sections["cregs"]) or bytes(66)
+    mregs = bytes(sections["mregs"]) or bytes(514)
+    sfrs = bytes(sections["sfrs"]) or bytes(50)
+    return cregs + mregs + sfrs + bytes(sections.get("program_data", b""))
+
+
+class CDCLink:
+    """
+    Request/response over a byte stream. port is anything with write() and
+    read(n), a pyserial Serial or the usb_cdc stand-in driven by a test.
+    """
+    def __init__(self, port, address=FXCORE_ADDRESS):
+        self.port = port
+        self.address = address
+        self.seq = 0
+        self.pending = bytearray()
+
+    def request(self, cmd, payload=b""):
+        """Send one frame and return the reply data, raise CDCError on a failed result"""
+        self.seq = (self.seq + 1) & 0xFF
+        self.port.write(frame(cmd, self.seq, payload))
+        while True:
+            reply = parse_frame(self.pending)
+            if reply is not None:
+                break
+            chunk = self.port.read(max(1, getattr(self.port, "in_waiting", 0)))
+            if not chunk:
+                raise CDCError("no reply")
+            self.pending.extend(chunk)
+        reply_cmd, seq, data, size = reply
+        del self.pending[0:size]
+        if reply_cmd != cmd | 0x80 or seq != self.seq:
+            raise CDCError(f"reply {reply_cmd:02X}/{seq} to request {cmd:02X}/{self.seq}")
+        if data[0] != 0:
+            raise CDCError(RESULTS.get(data[0], f"result 0x{data[0]:02X}"))
+        return data[1:]
+
+    def ping(self):
+        """(protocol version, max payload)"""
+        data = self.request(CMD_PING)
+        return data[0], data[1] | (data[2] << 8)
+
+    def upload(self, sections):
+        """Stage an image on the device, returns its image CRC"""
+        return int.from_bytes(self.request(CMD_IMAGE, image_payload(sections)), "little")
+
+    def run(self, force=False):
+        self.request(CMD_RUN, bytes([self.address, 0x01 if force else 0x00]))
+
+    def write_slot(self, location):
+        self.request(CMD_WRITE_SLOT, bytes([self.address, location]))
+
+    def run_preset(self, crc, force=False):
+        self.request(CMD_RUN_PRESET, bytes([self.address, 0x01 if force else 0x00]) + crc.to_bytes(4, "little"))
+
+    def status(self):
+        return self.request(CMD_STATUS, bytes([self.address]))
+
+    def i2c_write(self, address, data):
+        self.request(CMD_I2C_WRITE, bytes([address]) + bytes(data))
+
+    def i2c_read(self, address, length, write_data=b""):
+        cmd = CMD_I2C_WRITE_READ if write_data else CMD_I2C_READ
+        return self.request(cmd, bytes([address, length & 0xFF, length >> 8]) + bytes(write_data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Program an FXCore over the CDC data channel")
+    parser.add_argument("port", help="CDC data serial port, e.g. /dev/ttyACM1 or COM7")
+    parser.add_argument("hexfile")
+    parser.add_argument("--slot", type=lambda v: int(v, 16), help="flash slot 0-F instead of RAM")
+    parser.add_argument("--force", action="store_true", help="upload even if the image already runs")
+    parser.add_argument("--address", type=lambda v: int(v, 0), default=FXCORE_ADDRESS)
+    args = parser.parse_args()
+
+    import serial   # pyserial
+    from fwload import load_firmware, silenced
+    fw = load_firmware()
+    with silenced():
+        sections = fw.read_fxcore_hex_file(args.hexfile)
+    if not sections:
+        raise SystemExit(f"{args.hexfile}: not a valid FXCore hex file")
+
+    with serial.Serial(args.port, timeout=5) as port:
+        link = CDCLink(port, args.address)
+        version, max_payload = link.ping()
+        crc = link.upload(sections)
+        print(f"protocol {version}, image 0x{crc:08X} staged")
+        if args.slot is None:
+            link.run(args.force)
+            print("running from RAM")
+        else:
+            link.write_slot(args.slot)
+            print(f"written to slot {args.slot:X}")
+
+
+if __name__ == "__main__":
+    main()
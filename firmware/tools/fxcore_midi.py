@@ -0,0 +1,214 @@
+"""
+Host side of the disk-hid USB MIDI SysEx transport.
+
+Messages are ``F0 00 02 17 <type> ... F7``. Section data is 7-bit packed,
+an MSB byte followed by up to 7 low-bit bytes, 256 section bytes per data
+message. The device acknowledges data messages cumulatively with
+``F0 00 02 17 70 <type> <result> <seq lo> <seq hi> F7``; SysExSender keeps
+up to the advertised window of messages in flight and goes back to the
+acknowledged sequence number when the device reports a gap.
+
+With mido installed, upload a hex file and run it or write it to a slot:
+
+    python3 fxcore_midi.py SandboxFX ../../test_programs/alternate-blink.hex
+    python3 fxcore_midi.py SandboxFX prog.hex --slot 3
+"""
+import argparse
+import time
+import zlib
+
+SYSEX_ID = bytes([0x00, 0x02, 0x17])
+FXCORE_ADDRESS = 0x30
+CHUNK = 256
+
+MSG_STOP = 0x5B
+MSG_BEGIN = 0x60
+MSG_DATA = 0x61
+MSG_RUN = 0x62
+MSG_WRITE_SLOT = 0x63
+MSG_RUN_PRESET = 0x64
+MSG_REPLY = 0x70
+
+RESULT_OK = 0x00
+RESULT_SEQUENCE = 0x09
+
+# XFER command byte and parsed-image key of each section, in upload order
+SECTIONS = ((0x04, "mregs"), (0x01, "cregs"), (0x02, "sfrs"), (0x08, "program_data"))
+
+
+class MidiError(Exception):
+    pass
+
+
+def pack7(data):
+    """7-bit pack: per 7 bytes an MSB byte (bit i = MSB of byte i) and the low bits"""
+    out = bytearray()
+    for i in range(0, len(data), 7):
+        group = data[i:i + 7]
+        out.append(sum(((b >> 7) & 1) << j for j, b in enumerate(group)))
+        out.extend(b & 0x7F for b in group)
+    return bytes(out)
+
+
+def value7(value, count):
+    """int as little-endian 7-bit groups"""
+    return bytes((value >> (7 * i)) & 0x7F for i in range(count))
+
+
+def sysex(msg_type, body=b""):
+    return bytes([0xF0]) + SYSEX_ID + bytes([msg_type]) + bytes(body) + bytes([0xF7])
+
+
+def begin(address, section_byte, data):
+    return sysex(MSG_BEGIN, bytes([address, section_byte]) + value7(len(data), 3) +
+                 value7(zlib.crc32(data), 5))
+
+
+def data_messages(data):
+    """Data messages of one section, seq counting from 0"""
+    return [sysex(MSG_DATA, value7(seq, 2) + pack7(data[offset:offset + CHUNK]))
+            for seq, offset in enumerate(range(0, len(data), CHUNK))]
+
+
+def run(address=FXCORE_ADDRESS, force=False):
+    return sysex(MSG_RUN, bytes([address, 0x01 if force else 0x00]))
+
+
+def write_slot(location, address=FXCORE_ADDRESS):
+    return sysex(MSG_WRITE_SLOT, bytes([address, location]))
+
+
+def run_preset(crc, address=FXCORE_ADDRESS, force=False):
+    return sysex(MSG_RUN_PRESET, bytes([address, 0x01 if force else 0x00]) + value7(crc, 5))
+
+
+def parse_replies(stream):
+    """(type, result, value) for every device reply in a MIDI byte stream"""
+    replies = []
+    start = None
+    for i, byte in enumerate(stream):
+        if byte == 0xF0:
+            start = i
+        elif byte == 0xF7 and start is not None:
+            message = stream[start + 1:i]
+            start = None
+            if len(message) == 8 and message[0:3] == SYSEX_ID and message[3] == MSG_REPLY:
+                replies.append((message[4], message[5], message[6] | (message[7] << 7)))
+    return replies
+
+
+class SysExSender:
+    """
+    Windowed uploads over any MIDI connection. send(message) transmits one
+    SysEx message, receive() returns the device replies that arrived since
+    the last call (waiting up to a short timeout).
+    """
+    def __init__(self, send, receive, timeout=2.0):
+        self.send = send
+        self.receive = receive
+        self.timeout = timeout
+        self.replies = []
+        self.resends = 0
+
+    def wait_reply(self, msg_type):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            for i, reply in enumerate(self.replies):
+                if reply[0] == msg_type:
+                    del self.replies[i]
+                    return reply
+            if time.monotonic() > deadline:
+                return None
+            self.replies.extend(self.receive())
+
+    def upload_section(self, address, section_byte, data):
+        self.send(begin(address, section_byte, data))
+        reply = self.wait_reply(MSG_BEGIN)
+        if reply is None or reply[1] != RESULT_OK:
+            raise MidiError(f"section {section_byte:02X} refused: {reply}")
+        window = reply[2]
+        messages = data_messages(data)
+        acked = 0
+        sent = 0
+        rewound = None      # gap already answered by a resend
+        while True:
+            while sent < len(messages) and sent - acked < window:
+                self.send(messages[sent])
+                sent += 1
+            reply = self.wait_reply(MSG_DATA)
+            if reply is None:
+                # Nothing came back - resend everything after the last ack
+                self.resends += sent - acked
+                sent = acked
+                continue
+            _, result, seq = reply
+            if result == RESULT_SEQUENCE:
+                # Every message in flight after a gap is refused, resend once
+                if seq >= acked and seq != rewound:
+                    self.resends += sent - seq
+                    acked = sent = rewound = seq
+                continue
+            if result != RESULT_OK:
+                raise MidiError(f"section {section_byte:02X} rejected, result {result}")
+            acked = max(acked, seq)
+            rewound = None
+            if acked == len(messages):
+                return
+
+    def upload(self, sections, address=FXCORE_ADDRESS):
+        for section_byte, key in SECTIONS:
+            data = bytes(sections.get(key, b""))
+            if data:
+                self.upload_section(address, section_byte, data)
+
+    def command(self, message, msg_type, timeout=10.0):
+        """Send run, slot write or preset run and wait until the job is done"""
+        self.send(message)
+        saved, self.timeout = self.timeout, timeout
+        try:
+            reply = self.wait_reply(msg_type)
+        finally:
+            self.timeout = saved
+        if reply is None or reply[1] != RESULT_OK:
+            raise MidiError(f"command {msg_type:02X} failed: {reply}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Program an FXCore over USB MIDI SysEx")
+    parser.add_argument("port", help="MIDI port name (prefix match)")
+    parser.add_argument("hexfile")
+    parser.add_argument("--slot", type=lambda v: int(v, 16), help="flash slot 0-F instead of RAM")
+    parser.add_argument("--force", action="store_true", help="upload even if the image already runs")
+    args = parser.parse_args()
+
+    import mido
+    from fwload import load_firmware, silenced
+    fw = load_firmware()
+    with silenced():
+        sections = fw.read_fxcore_hex_file(args.hexfile)
+    if not sections:
+        raise SystemExit(f"{args.hexfile}: not a valid FXCore hex file")
+
+    out_name = next(n for n in mido.get_output_names() if n.startswith(args.port))
+    in_name = next(n for n in mido.get_input_names() if n.startswith(args.port))
+    with mido.open_output(out_name) as out_port, mido.open_input(in_name) as in_port:
+        def send(message):
+            out_port.send(mido.Message.from_bytes(list(message)))
+
+        def receive():
+            time.sleep(0.001)
+            stream = b"".join(bytes(m.bytes()) for m in in_port.iter_pending())
+            return parse_replies(stream)
+
+        sender = SysExSender(send, receive)
+        start = time.monotonic()
+        sender.upload(sections)
+        if args.slot is None:
+            sender.command(run(force=args.force), MSG_RUN)
+        else:
+            sender.command(write_slot(args.slot), MSG_WRITE_SLOT)
+        print(f"done in {time.monotonic() - start:.2f} s, {sender.resends} messages resent")
+
+
+if __name__ == "__main__":
+    main()
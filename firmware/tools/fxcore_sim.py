@@ -0,0 +1,188 @@
+"""
+FXCore I2C slave simulator with a timing model.
+
+FXCoreSim is a busio stand-in peripheral that behaves like the chip as far
+as the firmware can see: RUN (flash), PROG STATE0 and RUN from RAM modes,
+ENTER_PRG/EXIT_PRG, XFER_CREG/MREG/SFR/PRG with the length and the
+little-endian 16-bit sum checksum checked, EXEC_FROM_RAM, WRITE_PRG and
+RETURN_0. ENTER_PRG and RETURN_0 go back to STATE0 and discard the
+sections received so far. The 12-byte status has the layout
+read_fxcore_status() parses:
+
+    0     transfer state: 0x20 ready, 0x01 CREG, 0x02 SFR, 0x04 MREG,
+          0x08 all registers, 0x10 program received
+    1     command status, 0x00 or an FXCORE_STATUS_ERRORS code
+    2-3   last command, big-endian
+    4-5   programmed flash slots, bit per slot, little-endian
+    6-7   device id, little-endian
+    8-11  serial number, little-endian
+
+Every command keeps the chip busy for its TIMING entry (a section for
+``section_byte`` per byte after its last byte). A transfer that arrives
+while the chip is busy is clock-stretched until it is ready, or with
+busy="nack" refused with OSError like a NACK. The TIMING values are model
+parameters, not datasheet figures - set them from measurements (the I2C
+self-test, extension command E7) when they matter.
+"""
+import time
+
+TIMING = {
+    "command": 20e-6,       # decoding any command
+    "enter_prg": 2e-3,
+    "exit_prg": 2e-3,
+    "return_0": 1e-3,
+    "exec": 1e-3,           # EXEC_FROM_RAM until the program runs
+    "section_byte": 1e-6,   # per section byte, after the last one arrived
+    "write_prg": 0.15,      # flash erase and program of one slot
+}
+
+MODE_RUN_FLASH = "RUN_FLASH"
+MODE_PROG = "PROG"
+MODE_RUN_RAM = "RUN_RAM"
+
+READY = 0x20
+REGISTERS_RECEIVED = 0x08
+PROGRAM_RECEIVED = 0x10
+# XFER command -> (transfer state bit, section bytes including the checksum)
+SECTIONS = {0x010F: (0x01, 66), 0x047F: (0x04, 514), 0x020B: (0x02, 50)}
+
+OK = 0x00
+ERR_UNKNOWN = 0xFF
+ERR_LENGTH = 0xFE
+ERR_RANGE = 0xFD
+ERR_STATE = 0xFC
+ERR_CHECKSUM = 0x80
+
+
+class FXCoreSim:
+    def __init__(self, timing=None, busy="stretch", device_id=0x1234, serial=0x00C0FFEE):
+        self.timing = dict(TIMING, **(timing or {}))
+        self.busy = busy
+        self.status = bytearray(12)
+        self.status[0] = READY
+        self.status[6:8] = device_id.to_bytes(2, "little")
+        self.status[8:12] = serial.to_bytes(4, "little")
+        self.mode = MODE_RUN_FLASH
+        self.expecting = None       # (bit, length) of the section being received
+        self.received = bytearray()
+        self.sections = {}          # bit -> last section accepted
+        self.slots = {}             # flash slot -> program section written to it
+        self.busy_until = 0.0
+        self.stretch_time = 0.0     # seconds transfers were held waiting for the chip
+        self.nacks = 0
+        self.errors = []            # (command, status code) of every refused command or section
+
+    def occupy(self, seconds):
+        self.busy_until = max(self.busy_until, time.monotonic()) + seconds
+
+    def wait_ready(self):
+        remaining = self.busy_until - time.monotonic()
+        if remaining <= 0:
+            return
+        if self.busy == "nack":
+            self.nacks += 1
+            raise OSError(5, "FXCore busy")
+        time.sleep(remaining)
+        self.stretch_time += remaining
+
+    def fail(self, code, command):
+        self.status[1] = code
+        self.errors.append((command, code))
+
+    def write(self, data):
+        self.wait_ready()
+        if self.expecting is not None:
+            self.receive(data)
+        else:
+            self.command(bytes(data))
+
+    def read_into(self, buffer):
+        self.wait_ready()
+        length = min(len(buffer), len(self.status))
+        buffer[:length] = self.status[:length]
+
+    def command(self, data):
+        if len(data) < 2:
+            self.fail(ERR_LENGTH, data.hex())
+            return
+        command = (data[0] << 8) | data[1]
+        self.status[1] = OK
+        self.status[2] = data[0]
+        self.status[3] = data[1]
+        self.occupy(self.timing["command"])
+        if len(data) > (3 if command == 0xA55A else 2):
+            self.fail(ERR_LENGTH, f"{command:04X}")
+        elif command == 0xA55A:
+            # Also stops a program running from RAM
+            self.mode = MODE_PROG
+            self.reset_transfers()
+            self.occupy(self.timing["enter_prg"])
+        elif command == 0x5AA5:
+            if self.mode == MODE_RUN_RAM:
+                self.fail(ERR_STATE, "EXIT_PRG")
+                return
+            self.mode = MODE_RUN_FLASH
+            self.occupy(self.timing["exit_prg"])
+        elif self.mode == MODE_RUN_FLASH:
+            self.fail(ERR_STATE, f"{command:04X}")
+        elif command == 0x0E00:
+            self.mode = MODE_PROG
+            self.reset_transfers()
+            self.occupy(self.timing["return_0"])
+        elif self.mode == MODE_RUN_RAM:
+            self.fail(ERR_STATE, f"{command:04X}")
+        elif command in SECTIONS:
+            self.expect(*SECTIONS[command])
+        elif 0x0800 <= command <= 0x0BFF:
+            self.expect(PROGRAM_RECEIVED, (command - 0x0800 + 1) * 4 + 2)
+        elif command == 0x0D00:
+            if not self.status[0] & PROGRAM_RECEIVED:
+                self.fail(ERR_STATE, "EXEC_FROM_RAM")
+                return
+            self.mode = MODE_RUN_RAM
+            self.occupy(self.timing["exec"])
+        elif data[0] == 0x0C:
+            location = data[1]
+            if location > 15:
+                self.fail(ERR_RANGE, "WRITE_PRG")
+            elif not self.status[0] & PROGRAM_RECEIVED:
+                self.fail(ERR_STATE, "WRITE_PRG")
+            else:
+                self.slots[location] = self.sections[PROGRAM_RECEIVED]
+                slots = int.from_bytes(self.status[4:6], "little") | (1 << location)
+                self.status[4:6] = slots.to_bytes(2, "little")
+                self.occupy(self.timing["write_prg"])
+        else:
+            self.fail(ERR_UNKNOWN, f"{command:04X}")
+
+    def expect(self, bit, length):
+        self.expecting = (bit, length)
+        self.received = bytearray()
+        self.status[0] &= ~bit & 0xFF
+
+    def receive(self, data):
+        """Section data, possibly in several writes"""
+        bit, length = self.expecting
+        self.received.extend(data)
+        if len(self.received) < length:
+            return
+        self.expecting = None
+        name = f"section {bit:02X}"
+        if len(self.received) > length:
+            self.fail(ERR_LENGTH, name)
+            return
+        checksum = int.from_bytes(self.received[-2:], "little")
+        if sum(self.received[:-2]) & 0xFFFF != checksum:
+            self.fail(ERR_CHECKSUM, name)
+            return
+        self.sections[bit] = bytes(self.received)
+        self.status[0] |= bit
+        if self.status[0] & 0x07 == 0x07:
+            self.status[0] |= REGISTERS_RECEIVED
+        self.occupy(self.timing["section_byte"] * length)
+
+    def reset_transfers(self):
+        """Back to STATE0, the sections received so far are gone"""
+        self.expecting = None
+        self.sections = {}
+        self.status[0] = READY
@@ -0,0 +1,169 @@
+"""
+Span trace export for the disk-hid firmware.
+
+With TRACE_SPANS = True in code.py the firmware records begin/end events of
+the upload steps (hex parsing, ENTER_PRG, each section, commands, I2C
+writes, flash writes, EXEC) in a ring buffer. Extension command E6 reads
+it over the FT260 bridge; this tool fetches the events and writes them as
+Chrome trace JSON, which chrome://tracing and ui.perfetto.dev open. Every
+FXCore address is a track, hex parsing is on track 0.
+
+    python3 fxcore_trace.py --simulate ../../test_programs/alternate-blink.hex -o upload.json
+    python3 fxcore_trace.py -o device.json          # from a board, needs hidapi
+
+--simulate runs the upload against the stand-ins with tracing installed,
+so it works without a board or a firmware change.
+"""
+import argparse
+import asyncio
+import json
+
+import ft260_reports
+
+# Span ids are indexes into the firmware's TRACE_SPAN_TABLE
+SPAN_NAMES = ("upload", "parse", "ENTER_PRG", "EXIT_PRG", "settle", "section", "CREG", "MREG",
+              "SFR", "PRG", "command", "i2c_write", "WRITE_PRG", "EXEC", "RETURN_0")
+RECORD_SIZE = 8
+TRACE_END = 0x01
+TRACE_OK = 0x02
+READ_COUNT = 32             # events per E6 request, the firmware's TRACE_READ_MAX
+USB_VID = 0x1209
+USB_PID = 0x3911
+
+
+def parse_records(data):
+    """(timestamp us, span id, flags, address, detail) per 8-byte record"""
+    return [(int.from_bytes(data[i:i + 4], "little"), data[i + 4], data[i + 5], data[i + 6], data[i + 7])
+            for i in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE)]
+
+
+def fetch_records(transact, address=ft260_reports.FXCORE_ADDRESS):
+    """
+    Read all events the device holds. transact(reports) sends the reports and
+    returns the payloads of the C2 input reports that came back.
+    """
+    data = b""
+    start = 0
+    while True:
+        payloads = transact(ft260_reports.trace_read(start, READ_COUNT, address))
+        held, records = ft260_reports.parse_trace_reply(b"".join(p[1:1 + p[0]] for p in payloads))
+        data += records
+        start += len(records) // RECORD_SIZE
+        if not records or start >= held:
+            return parse_records(data)
+
+
+def to_chrome(records):
+    """Chrome trace dict; ends without a begin (overwritten in the ring) are dropped"""
+    events = []
+    open_spans = {}
+    last = None
+    offset = 0
+    for timestamp, span, flags, address, detail in records:
+        if last is not None and timestamp < last:
+            offset += 1 << 32       # uint32 microsecond counter wrapped
+        last = timestamp
+        name = SPAN_NAMES[span] if span < len(SPAN_NAMES) else f"span {span}"
+        event = {"name": name, "ts": timestamp + offset, "pid": 1, "tid": address}
+        stack = open_spans.setdefault(address, [])
+        if flags & TRACE_END:
+            if span not in stack:
+                continue
+            while stack.pop() != span:
+                pass
+            event["ph"] = "E"
+            event["args"] = {"ok": bool(flags & TRACE_OK)}
+        else:
+            stack.append(span)
+            event["ph"] = "B"
+            if name in ("command", "WRITE_PRG", "upload"):
+                event["args"] = {"detail": f"0x{detail:02X}"}
+        events.append(event)
+    for address in open_spans:
+        label = "host" if address == 0 else f"FXCore 0x{address:02X}"
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": address, "args": {"name": label}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def simulate(hex_file, mode="ram"):
+    """Upload hex_file on stand-in hardware with tracing installed, return the fetched records"""
+    from bench_multichip import AckingFXCore
+    from fwload import load_firmware, silenced
+
+    fw = load_firmware()
+    fw.i2c.attach(ft260_reports.FXCORE_ADDRESS, AckingFXCore())
+    device = fw.ft260.hid_device
+
+    async def run():
+        tasks = [asyncio.create_task(fw.hid_task()), asyncio.create_task(fw.pipeline.run())]
+        fw.start_span_trace()
+        image = fw.read_fxcore_hex_file(hex_file)
+        job = fw.pipeline.submit(mode, image, 0 if mode == "flash" else None)
+        await job.done.wait()
+
+        replies = []
+
+        async def exchange(reports):
+            device.sent.clear()
+            for report in reports:
+                device.queue_report(*report)
+            while device.inbox:
+                await asyncio.sleep(0.001)
+            return [payload for report_id, payload in device.sent if report_id == 0xC2]
+
+        start = 0
+        while True:
+            payloads = await exchange(ft260_reports.trace_read(start, READ_COUNT))
+            held, records = ft260_reports.parse_trace_reply(b"".join(p[1:1 + p[0]] for p in payloads))
+            replies.append(records)
+            start += len(records) // RECORD_SIZE
+            if not records or start >= held:
+                break
+        for task in tasks:
+            task.cancel()
+        return parse_records(b"".join(replies))
+
+    with silenced():
+        return asyncio.run(run())
+
+
+def hid_transact(device):
+    """transact() for a hidapi device: write the reports, collect one C2 input report per C2 request"""
+    def transact(reports):
+        payloads = []
+        for report_id, payload in reports:
+            device.write(bytes([report_id]) + payload)
+            if report_id == 0xC2:
+                reply = bytes(device.read(64, 1000))
+                payloads.append(reply[1:] if reply and reply[0] == 0xC2 else reply)
+        return payloads
+    return transact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the firmware span trace as Chrome trace JSON")
+    parser.add_argument("--simulate", metavar="HEXFILE", help="trace an upload on stand-in hardware")
+    parser.add_argument("--mode", choices=("ram", "flash"), default="ram")
+    parser.add_argument("-o", "--output", default="trace.json")
+    args = parser.parse_args()
+
+    if args.simulate:
+        records = simulate(args.simulate, args.mode)
+    else:
+        import hid     # hidapi
+        device = hid.device()
+        device.open(USB_VID, USB_PID)
+        try:
+            records = fetch_records(hid_transact(device))
+        finally:
+            device.close()
+
+    trace = to_chrome(records)
+    with open(args.output, "w") as f:
+        json.dump(trace, f, indent=1)
+    spans = sum(1 for event in trace["traceEvents"] if event["ph"] == "B")
+    print(f"{len(records)} events, {spans} spans written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
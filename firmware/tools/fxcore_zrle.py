@@ -0,0 +1,132 @@
+"""
+Compressed section uploads for the disk-hid FT260 emulator (extension
+command 0xE1).
+
+encode() produces the zero-run stream ZeroRunDecoder in code.py expands:
+
+    0x00-0x7F  literal, the next (c + 1) bytes are copied
+    0x80-0xBF  (c - 0x80 + 1) zero bytes
+    0xC0-0xFF  the next byte repeated (c - 0xC0 + 1) times
+
+Each section is sent as ``E1 ss LL LL CC CC CC CC NN NN`` followed by the
+stream, in the same report as far as it fits and then in D0 data reports:
+ss is the XFER command byte of the section, LL the expanded size, CC the
+CRC-32 of the expanded data and NN the stream size, little-endian. A C2
+read of the FXCore address afterwards returns ``E1 result`` (0 = ok).
+
+Run it to compare report counts for hex files:
+
+    python3 fxcore_zrle.py ../../test_programs/*.hex
+"""
+import sys
+import zlib
+
+from ft260_reports import (CHUNK_SIZE, FXCORE_ADDRESS, d0_transfer, d0_write,
+                           plain_upload, section_commands)
+
+EXT_SECTION_ZRLE = 0xE1
+HEADER_SIZE = 10
+MAX_RUN = 64
+MAX_LITERAL = 128
+
+
+def encode(data):
+    """Zero-run/RLE encode a section"""
+    out = bytearray()
+    literal = bytearray()
+
+    def flush_literal():
+        for start in range(0, len(literal), MAX_LITERAL):
+            piece = literal[start:start + MAX_LITERAL]
+            out.append(len(piece) - 1)
+            out.extend(piece)
+        literal.clear()
+
+    i = 0
+    while i < len(data):
+        value = data[i]
+        run = 1
+        while i + run < len(data) and run < MAX_RUN and data[i + run] == value:
+            run += 1
+        if value == 0 and run >= 2:
+            flush_literal()
+            out.append(0x80 + run - 1)
+        elif run >= 3:
+            flush_literal()
+            out.append(0xC0 + run - 1)
+            out.append(value)
+        else:
+            literal.extend(data[i:i + run])
+        i += run
+    flush_literal()
+    return bytes(out)
+
+
+def decode(stream):
+    """Reference decoder, the inverse of encode()"""
+    out = bytearray()
+    i = 0
+    while i < len(stream):
+        c = stream[i]
+        i += 1
+        if c < 0x80:
+            out.extend(stream[i:i + c + 1])
+            i += c + 1
+        elif c < 0xC0:
+            out.extend(bytes(c - 0x7F))
+        else:
+            out.extend(bytes([stream[i]]) * (c - 0xBF))
+            i += 1
+    return bytes(out)
+
+
+def section_header(section_byte, data, stream):
+    """The 10-byte E1 command header for one section"""
+    crc = zlib.crc32(bytes(data)) & 0xFFFFFFFF
+    return bytes([EXT_SECTION_ZRLE, section_byte,
+                  len(data) & 0xFF, len(data) >> 8,
+                  crc & 0xFF, (crc >> 8) & 0xFF, (crc >> 16) & 0xFF, crc >> 24,
+                  len(stream) & 0xFF, len(stream) >> 8])
+
+
+def compressed_section(address, section_byte, data):
+    """D0 reports for one compressed section"""
+    stream = encode(data)
+    first = section_header(section_byte, data, stream) + stream[:CHUNK_SIZE - HEADER_SIZE]
+    reports = [d0_write(address, first)]
+    rest = stream[CHUNK_SIZE - HEADER_SIZE:]
+    if rest:
+        reports.extend(d0_transfer(address, rest))
+    return reports
+
+
+def compressed_upload(sections, address=FXCORE_ADDRESS, run=True):
+    """Reports for a compressed upload: ENTER_PRG, E1 sections, EXEC_FROM_RAM"""
+    reports = [d0_write(address, bytes([0xA5, 0x5A, address]))]
+    for command, data in section_commands(sections):
+        reports.extend(compressed_section(address, command[0], data))
+    if run:
+        reports.append(d0_write(address, bytes([0x0D, 0x00])))
+    return reports
+
+
+def main(paths):
+    from fwload import load_firmware, silenced
+    fw = load_firmware()
+    print(f"{'file':<28} {'bytes':>6} {'stream':>7} {'plain':>6} {'zrle':>5} {'ratio':>6}")
+    for path in paths:
+        with silenced():
+            sections = fw.read_fxcore_hex_file(path)
+        if not sections:
+            print(f"{path}: not a valid FXCore hex file")
+            continue
+        raw = sum(len(data) for _, data in section_commands(sections))
+        stream = sum(len(encode(data)) for _, data in section_commands(sections))
+        plain = len(plain_upload(sections))
+        packed = len(compressed_upload(sections))
+        name = path.replace("\\", "/").split("/")[-1]
+        print(f"{name:<28} {raw:>6} {stream:>7} {plain:>6} {packed:>5} {plain / packed:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,323 @@
+"""
+Replay checks for the FT260 emulator.
+
+Most checks feed a host session, report by report, into
+process_reports() of the unmodified disk-hid code.py with FXCoreSim on the
+bus, and then check what the chip ended up with and what the emulator
+replied. Programming jobs run to completion between reports, as in
+bench_replay.py.
+
+    python3 replay_checks.py                    # all checks, exit 1 on a failure
+    python3 replay_checks.py extension-bytes    # checks whose name starts with this
+"""
+import asyncio
+import sys
+import time
+
+import ft260_reports
+import fxcore_cdc
+from bench_replay import replay
+from bench_upload import full_image, section
+from fwload import load_firmware, silenced
+from fxcore_sim import MODE_RUN_RAM, PROGRAM_RECEIVED, FXCoreSim
+from fxcore_zrle import compressed_upload, section_header
+
+FXCORE = ft260_reports.FXCORE_ADDRESS
+SFR_RECEIVED = 0x02
+# FXCoreSim transfer state bit -> image key
+SECTION_BITS = ((0x01, "cregs"), (SFR_RECEIVED, "sfrs"), (0x04, "mregs"), (PROGRAM_RECEIVED, "program_data"))
+
+
+def image_starting_with(sfr_first, program_first, instructions=14):
+    """
+    Image whose SFR section and program start with the given bytes. With 14
+    instructions or fewer the program, like the SFR section, goes in one
+    START + STOP report.
+    """
+    image = full_image(instructions)
+    sfrs = bytearray(image["sfrs"][:-2])
+    sfrs[0] = sfr_first
+    image["sfrs"] = section(sfrs)
+    program = bytearray(image["program_data"][:-2])
+    program[0] = program_first
+    image["program_data"] = section(program)
+    image["instructions"] = [int.from_bytes(program[i:i + 4], "little") for i in range(0, len(program), 4)]
+    return image
+
+
+def run(reports, chip=None, setup=None):
+    """Replay on fresh firmware, returns (firmware, chip, C2 replies); setup(fw) runs first"""
+    fw = load_firmware()
+    if setup:
+        setup(fw)
+    fw.i2c.realtime = False
+    chip = chip or FXCoreSim()
+    fw.i2c.attach(FXCORE, chip)
+    with silenced():
+        asyncio.run(replay(fw, reports, lambda process: process()))
+    replies = [bytes(payload[1:1 + payload[0]]) for report_id, payload in fw.ft260.hid_device.sent
+               if report_id == 0xC2]
+    return fw, chip, replies
+
+
+def check_extension_bytes():
+    """Section data starting with 0xE0-0xEF is data, not an extension command"""
+    problems = []
+    for first in (0xE2, 0xE3, 0xE5, 0xE7):
+        image = image_starting_with(first, first)
+        _, chip, _ = run(ft260_reports.plain_upload(image))
+        if chip.sections.get(SFR_RECEIVED) != bytes(image["sfrs"]):
+            problems.append(f"SFR starting with {first:02X} not received")
+        if chip.sections.get(PROGRAM_RECEIVED) != bytes(image["program_data"]):
+            problems.append(f"program starting with {first:02X} not received")
+        if chip.mode != MODE_RUN_RAM or chip.errors:
+            problems.append(f"{first:02X}: chip {chip.mode}, errors {chip.errors}")
+    return problems
+
+
+def received_image(chip, image):
+    """Problems if the chip doesn't run from RAM with every section of the image"""
+    problems = []
+    for bit, key in SECTION_BITS:
+        if chip.sections.get(bit) != bytes(image[key]):
+            problems.append(f"{key} not received")
+    if chip.mode != MODE_RUN_RAM:
+        problems.append(f"chip in {chip.mode}")
+    return problems
+
+
+def check_compressed_abort():
+    """ENTER_PRG in the middle of a compressed section starts a new upload"""
+    image = full_image(64)
+    # ENTER_PRG, the start of the MREG section and one more report of it
+    reports = compressed_upload(image)[:3] + ft260_reports.plain_upload(image)
+    return received_image(run(reports)[1], image)
+
+
+def check_compressed_stall():
+    """A compressed section that stops coming is dropped, later commands work"""
+    def no_wait(fw):
+        fw.EXT_STREAM_TIMEOUT = 0
+    reports = compressed_upload(full_image(64))[:3] + ft260_reports.preset_list()
+    _, _, replies = run(reports, setup=no_wait)
+    if not replies or replies[-1][:2] != bytes([0xE4, 0x00]):
+        return [f"E4 after the stalled section answered {replies[-1].hex() if replies else 'nothing'}"]
+    return []
+
+
+def check_compressed_overflow():
+    """A compressed stream that expands past its section never grows the section buffer beyond it"""
+    sfrs = bytes(50)
+    stream = bytes([0xBF]) * 1000      # 64 zeros per byte
+    first = section_header(0x02, sfrs, stream) + stream[:50]
+    reports = [ft260_reports.d0_write(FXCORE, first)] + ft260_reports.d0_transfer(FXCORE, stream[50:])
+    problems = []
+    fw = run(reports[:8])[0]
+    if len(fw.ft260.sfr_data) > len(sfrs):
+        problems.append(f"SFR buffer grew to {len(fw.ft260.sfr_data)} bytes halfway through the stream")
+    replies = run(reports + [ft260_reports.c2_read(FXCORE, 2)])[2]
+    if not replies or replies[-1] != bytes([0xE1, 0x02]):
+        problems.append(f"complete stream answered {replies[-1].hex() if replies else 'nothing'}, expected e102")
+    return problems
+
+
+def truncated_batch():
+    """The first report of a batch script that takes two"""
+    ops = [ft260_reports.batch_write(0x50, bytes(40)) for _ in range(2)]
+    return ft260_reports.batch(ops)[:1]
+
+
+def check_batch_abort():
+    """ENTER_PRG after a truncated batch script starts a new upload"""
+    image = full_image(64)
+    reports = truncated_batch() + ft260_reports.plain_upload(image)
+    return received_image(run(reports)[1], image)
+
+
+def check_batch_stall():
+    """A batch script that stops coming is dropped, later commands work"""
+    def no_wait(fw):
+        fw.EXT_STREAM_TIMEOUT = 0
+    _, _, replies = run(truncated_batch() + ft260_reports.preset_list(), setup=no_wait)
+    if not replies or replies[-1][:2] != bytes([0xE4, 0x00]):
+        return [f"E4 after the stalled batch answered {replies[-1].hex() if replies else 'nothing'}"]
+    return []
+
+
+class MidImageNack(FXCoreSim):
+    """NACKs the SFR section data once and falls back to STATE0 with status 0x40, like a chip reset"""
+    def __init__(self):
+        super().__init__()
+        self.nacked = False
+
+    def receive(self, data):
+        if not self.nacked and self.expecting[0] == SFR_RECEIVED:
+            self.nacked = True
+            self.reset_transfers()
+            self.fail(0x40, "section 02")
+            raise OSError(5, "NACK")
+        super().receive(data)
+
+
+def check_mid_image_nack():
+    """With VERIFY_UPLOADS a chip reset halfway through the image gets the whole image again"""
+    def verify(fw):
+        fw.VERIFY_UPLOADS = True
+    image = full_image(64)
+    fw, chip, _ = run(ft260_reports.plain_upload(image), MidImageNack(), verify)
+    problems = received_image(chip, image)
+    if not chip.nacked:
+        problems.append("the NACK never happened")
+    if fw.verify_retries == 0:
+        problems.append("no retry counted")
+    return problems
+
+
+class Superseding(FXCoreSim):
+    """Supersedes the running job once it has sent the given SFR section, like a newer upload request"""
+    def __init__(self, sfrs):
+        super().__init__()
+        self.sfrs = bytes(sfrs)
+        self.fw = None
+
+    def receive(self, data):
+        super().receive(data)
+        if bytes(data) == self.sfrs:
+            self.fw.pipeline.supersede_ram_jobs(FXCORE)
+
+
+def check_perf_counters():
+    """Skipped and superseded RAM jobs are neither uploads nor failures, and aren't timed"""
+    image = full_image(64)
+    superseded = image_starting_with(0x11, 0x22, 64)
+    crc = load_firmware().image_crc32(image["cregs"], image["mregs"], image["sfrs"], image["program_data"])
+    chip = Superseding(superseded["sfrs"])
+
+    def attach(fw):
+        chip.fw = fw
+    # upload, the same image again from the preset cache, an upload superseded halfway
+    reports = (ft260_reports.plain_upload(image) + [ft260_reports.preset_run(crc)]
+               + ft260_reports.plain_upload(superseded))
+    fw = run(reports, chip, attach)[0]
+    counted = (fw.perf.uploads_ram, fw.perf.uploads_skipped, fw.perf.upload_failures,
+               fw.pipeline.superseded, fw.perf.phase_count[fw.PERF_PHASE_RAM_JOB])
+    if counted != (1, 1, 0, 1, 1):
+        return [f"ok, skipped, failed, superseded, timed RAM jobs {counted}, expected (1, 1, 0, 1, 1)"]
+    return []
+
+
+def check_perf_pages():
+    """Every counters page fits the 63-byte feature report, the job phases come on page 3"""
+    reports = ft260_reports.plain_upload(full_image(64)) + [ft260_reports.perf_request(page) for page in range(4)]
+    fw = run(reports)[0]
+    pages = [payload for report_id, payload in fw.ft260.hid_device.sent if report_id == fw.PERF_REPORT_ID]
+    problems = [f"page {page[0]} is {len(page)} bytes" for page in pages if len(page) != fw.PERF_REPORT_SIZE]
+    if [page[0] for page in pages] != [0, 1, 2, 3]:
+        return problems + [f"pages {[page[0] for page in pages]} sent, expected [0, 1, 2, 3]"]
+    sections = ft260_reports.parse_perf(pages[1])["section"]["count"]
+    ram_jobs = ft260_reports.parse_perf(pages[3])["ram_job"]["count"]
+    if (sections, ram_jobs) != (4, 1):
+        problems.append(f"{sections} sections and {ram_jobs} RAM jobs timed, expected 4 and 1")
+    return problems
+
+
+def check_progress_stall():
+    """A progress report that blocks pauses the reports until the host sends again, an idle host gets none"""
+    def slow_host(fw):
+        send = fw.ft260.hid_device.send_report
+
+        def send_report(data, report_id=None):
+            if report_id == fw.PROGRESS_REPORT_ID:
+                time.sleep(0.05)
+            send(data, report_id)
+        fw.ft260.hid_device.send_report = send_report
+    image = full_image(64)
+    fw = run(ft260_reports.plain_upload(image), setup=slow_host)[0]
+    progress = [payload for report_id, payload in fw.ft260.hid_device.sent if report_id == fw.PROGRESS_REPORT_ID]
+    problems = []
+    # Jobs start on a host report, the rest of each job's events are held back
+    events = [payload[0] for payload in progress]
+    if not events or any(event != fw.PROGRESS_JOB_STARTED for event in events):
+        problems.append(f"progress events {events} pushed to a host that doesn't read, expected only job starts")
+
+    def idle_host(fw):
+        fw.PUSH_HOST_WINDOW = 0
+    fw = run(ft260_reports.plain_upload(image), setup=idle_host)[0]
+    if any(report_id == fw.PROGRESS_REPORT_ID for report_id, payload in fw.ft260.hid_device.sent):
+        problems.append("progress reports pushed after the host went quiet")
+    return problems
+
+
+def check_bus_lock():
+    """A transaction that times out leaves a held lock to its holder, a reserved address refuses pass-through writes"""
+    fw = load_firmware()
+    manager = fw.i2c_bus
+    problems = []
+    manager.timeout_ns = 1000000
+    with manager.transaction():
+        try:
+            with manager.transaction():
+                problems.append("lock acquired while held")
+        except fw.I2CBusTimeout:
+            pass
+        if not fw.i2c.locked():
+            problems.append("the timeout released the holder's lock")
+    if fw.i2c.locked():
+        problems.append("lock still held after the holder's block")
+    manager.reserve(FXCORE)
+    if manager.write_allowed(FXCORE) or not manager.write_allowed(FXCORE + 1):
+        problems.append("write_allowed() ignores the reservation")
+    manager.release(FXCORE)
+    if not manager.write_allowed(FXCORE):
+        problems.append("write refused after the reservation ended")
+    return problems
+
+
+def check_cdc_status_nack():
+    """A CDC status request to an FXCore that doesn't answer gets an I2C error reply"""
+    fw = load_firmware()
+    fw.i2c.realtime = False
+    serial = fw.cdc.serial
+    serial.host_write(fxcore_cdc.frame(fxcore_cdc.CMD_STATUS, 1, bytes([FXCORE])))
+    try:
+        with silenced():
+            asyncio.run(fw.cdc.handle(*fw.cdc.receive()))
+    except NameError as e:
+        return [f"status request raised {e!r}"]
+    reply = fxcore_cdc.parse_frame(serial.host_read())
+    if reply is None or reply[2][0:1] != bytes([fw.EXT_ERR_I2C]):
+        return [f"reply {reply}, expected an I2C error result"]
+    return []
+
+
+CHECKS = {
+    "extension-bytes": check_extension_bytes,
+    "compressed-abort": check_compressed_abort,
+    "compressed-stall": check_compressed_stall,
+    "compressed-overflow": check_compressed_overflow,
+    "batch-abort": check_batch_abort,
+    "batch-stall": check_batch_stall,
+    "mid-image-nack": check_mid_image_nack,
+    "perf-counters": check_perf_counters,
+    "perf-pages": check_perf_pages,
+    "progress-stall": check_progress_stall,
+    "bus-lock": check_bus_lock,
+    "cdc-status-nack": check_cdc_status_nack,
+}
+
+
+def main(prefixes):
+    failed = 0
+    for name, check in CHECKS.items():
+        if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+            continue
+        problems = check()
+        print(f"{name:<28} {'ok' if not problems else 'FAILED'}")
+        for problem in problems:
+            print(f"    {problem}")
+        failed += bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,13 @@
+"""CPython stand-in for CircuitPython board - every pin name resolves to a Pin"""
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+def __getattr__(name):
+    return Pin(name)
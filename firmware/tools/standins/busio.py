@@ -0,0 +1,83 @@
+"""
+CPython stand-in for CircuitPython busio (I2C only).
+
+I2C models the wire: every transfer blocks for as long as it would take at
+the configured clock, like the real blocking busio call, and is appended to
+``transactions``. Peripherals are attached per address with ``attach()``;
+an address without a peripheral NACKs with OSError like the hardware does.
+A peripheral provides ``write(data)`` and ``read_into(buffer)``. Setting
+``data_log`` to a list also records the bytes of every transfer.
+"""
+import time
+
+START_STOP_BITS = 2     # START and STOP conditions, in bit times
+
+
+class I2C:
+    def __init__(self, scl=None, sda=None, frequency=100000, timeout=255):
+        self.scl = scl
+        self.sda = sda
+        self.frequency = frequency
+        self.devices = {}
+        self.transactions = []      # (timestamp_ns, address, "w" | "r", length, ok)
+        self.bus_time = 0.0         # seconds the wire was busy
+        self.realtime = True        # False = account bus time without sleeping
+        self.data_log = None        # list -> (address, "w" | "r", bytes, ok) per transfer
+        self._locked = False
+
+    def attach(self, address, device):
+        self.devices[address] = device
+
+    def try_lock(self):
+        if self._locked:
+            return False
+        self._locked = True
+        return True
+
+    def unlock(self):
+        self._locked = False
+
+    def locked(self):
+        return self._locked
+
+    def wire_time(self, length):
+        """Seconds a transfer of length data bytes plus the address byte takes"""
+        return ((length + 1) * 9 + START_STOP_BITS) / self.frequency
+
+    def _transfer(self, address, direction, length):
+        device = self.devices.get(address)
+        self.transactions.append((time.monotonic_ns(), address, direction, length, device is not None))
+        # A NACKed address still costs the address byte
+        duration = self.wire_time(length if device is not None else 0)
+        self.bus_time += duration
+        if self.realtime:
+            time.sleep(duration)
+        if device is None:
+            raise OSError(19, "No such device")
+        return device
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        if self.data_log is not None:
+            self.data_log.append((address, "w", data, address in self.devices))
+        self._transfer(address, "w", len(data)).write(data)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        view = memoryview(buffer)[start:end]
+        try:
+            self._transfer(address, "r", len(view)).read_into(view)
+        finally:
+            if self.data_log is not None:
+                ok = address in self.devices
+                self.data_log.append((address, "r", bytes(view) if ok else b"", ok))
+
+    def writeto_then_readfrom(self, address, out_buffer, in_buffer, *,
+                              out_start=0, out_end=None, in_start=0, in_end=None):
+        self.writeto(address, out_buffer, start=out_start, end=out_end)
+        self.readfrom_into(address, in_buffer, start=in_start, end=in_end)
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def deinit(self):
+        pass
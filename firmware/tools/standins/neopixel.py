@@ -0,0 +1,19 @@
+"""CPython stand-in for the neopixel library - remembers the colours it was given"""
+
+
+class NeoPixel(list):
+    def __init__(self, pin, n, brightness=1.0, auto_write=True, pixel_order=None):
+        super().__init__([(0, 0, 0)] * n)
+        self.pin = pin
+        self.brightness = brightness
+        self.auto_write = auto_write
+
+    def fill(self, color):
+        for i in range(len(self)):
+            self[i] = color
+
+    def show(self):
+        pass
+
+    def deinit(self):
+        pass
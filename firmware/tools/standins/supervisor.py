@@ -0,0 +1,23 @@
+"""CPython stand-in for CircuitPython supervisor"""
+
+
+class RunReason:
+    STARTUP = 1
+    AUTO_RELOAD = 2
+    SUPERVISOR_RELOAD = 3
+    REPL_RELOAD = 4
+
+
+class _Runtime:
+    def __init__(self):
+        self.autoreload = True
+        self.run_reason = RunReason.STARTUP
+        self.usb_connected = True
+        self.serial_connected = False
+
+
+runtime = _Runtime()
+
+
+def reload():
+    raise SystemExit("supervisor.reload()")
@@ -0,0 +1,57 @@
+"""
+CPython stand-in for CircuitPython usb_cdc.
+
+The data channel is always present here. Serial keeps the bytes the host
+wrote in one buffer and collects everything the firmware writes in
+``received``, so a driver can play the host side without a serial port.
+"""
+
+
+class Serial:
+    def __init__(self):
+        self.timeout = 1.0
+        self.write_timeout = None
+        self.inbox = bytearray()        # host -> device
+        self.received = bytearray()     # device -> host
+
+    def host_write(self, data):
+        """Host side: send bytes to the device"""
+        self.inbox.extend(data)
+
+    def host_read(self):
+        """Host side: take everything the device wrote so far"""
+        data = bytes(self.received)
+        self.received.clear()
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self.inbox)
+
+    def readinto(self, buf):
+        count = min(len(buf), len(self.inbox))
+        if count == 0:
+            return None
+        buf[0:count] = self.inbox[0:count]
+        del self.inbox[0:count]
+        return count
+
+    def read(self, size=1):
+        data = bytes(self.inbox[0:size])
+        del self.inbox[0:len(data)]
+        return data
+
+    def write(self, data):
+        self.received.extend(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.inbox.clear()
+
+
+console = None
+data = Serial()
+
+
+def enable(console=True, data=False):
+    pass
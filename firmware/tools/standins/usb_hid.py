@@ -0,0 +1,59 @@
+"""
+CPython stand-in for CircuitPython usb_hid.
+
+Device keeps host output reports in one FIFO, so a driver can queue a whole
+recorded session up front, and records every input report the firmware
+sends. get_last_received_report() only hands out the oldest queued report,
+so reports are seen in the order the host sent them whatever ID the
+firmware polls first. send_report() checks the report against the lengths
+the device declares, like CircuitPython, whose defaults are those of the
+disk-hid boot.py.
+"""
+import collections
+
+# Report IDs and lengths as disk-hid boot.py declares them
+REPORT_IDS = (0xA1, 0xC0, 0xC2, 0xB8, 0xB9, 0xD0, 0xDE, 0x01)
+IN_REPORT_LENGTHS = (63, 63, 63, 16, 63, 0, 0, 63)
+OUT_REPORT_LENGTHS = (63, 63, 63, 0, 0, 63, 63, 63)
+
+
+class Device:
+    def __init__(self, usage_page=0xFF00, usage=0x01, report_ids=REPORT_IDS,
+                 in_report_lengths=IN_REPORT_LENGTHS, out_report_lengths=OUT_REPORT_LENGTHS):
+        self.usage_page = usage_page
+        self.usage = usage
+        self.report_ids = report_ids
+        self.in_report_lengths = in_report_lengths
+        self.out_report_lengths = out_report_lengths
+        self.inbox = collections.deque()    # (report_id, bytes) from the host
+        self.sent = []                      # (report_id, bytes) to the host
+
+    def queue_report(self, report_id, data):
+        """Host side: send an output report to the device"""
+        self.inbox.append((report_id, bytes(data)))
+
+    def get_last_received_report(self, report_id=None):
+        if not self.inbox:
+            return None
+        queued_id, data = self.inbox[0]
+        if report_id is not None and queued_id != report_id:
+            return None
+        self.inbox.popleft()
+        return data
+
+    def send_report(self, data, report_id=None):
+        if report_id is None:
+            report_id = self.report_ids[0]
+        if report_id not in self.report_ids:
+            raise ValueError(f"Invalid report_id {report_id}")
+        length = self.in_report_lengths[self.report_ids.index(report_id)]
+        if len(data) != length:
+            raise ValueError(f"Buffer incorrect size. Should be {length} bytes.")
+        self.sent.append((report_id, bytes(data)))
+
+
+devices = [Device()]
+
+
+def enable(new_devices, boot_device=0):
+    pass
@@ -0,0 +1,53 @@
+"""
+CPython stand-in for CircuitPython usb_midi.
+
+ports holds one PortIn and one PortOut. host_send() queues MIDI stream bytes
+for the firmware, host_read() returns what the firmware wrote.
+"""
+
+
+class PortIn:
+    def __init__(self):
+        self.inbox = bytearray()
+
+    def host_send(self, data):
+        self.inbox.extend(data)
+
+    def readinto(self, buf, nbytes=None):
+        count = min(len(buf) if nbytes is None else nbytes, len(self.inbox))
+        if count == 0:
+            return None
+        buf[0:count] = self.inbox[0:count]
+        del self.inbox[0:count]
+        return count
+
+    def read(self, nbytes=None):
+        count = len(self.inbox) if nbytes is None else min(nbytes, len(self.inbox))
+        data = bytes(self.inbox[0:count])
+        del self.inbox[0:count]
+        return data
+
+
+class PortOut:
+    def __init__(self):
+        self.received = bytearray()
+
+    def host_read(self):
+        data = bytes(self.received)
+        self.received.clear()
+        return data
+
+    def write(self, buf):
+        self.received.extend(buf)
+        return len(buf)
+
+
+ports = (PortIn(), PortOut())
+
+
+def disable():
+    pass
+
+
+def enable():
+    pass